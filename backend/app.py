@@ -1,11 +1,25 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import BadRequest
+from werkzeug.utils import secure_filename
 import os
-import pandas as pd
-from app.Preprocess import preprocess_data, compute_and_save_embeddings
-from app.Mapper import run_matching_pipeline
+import shutil
+import threading
+from app.Preprocess import preprocess_file, count_csv_rows, peak_rss_mb, load_preprocess_rules
+from app.mapper import iter_matching_pipeline, make_fallback_verifier, FALLBACK_PROMPT_VERSION
+from app.IncrementalMatch import iter_incremental_matching
+from app.EmbeddingCache import EmbeddingCache
+from app.EmbeddingStore import EmbeddingStore, check_same_space, store_paths
+from app.EmbeddingProvider import make_provider
+from app.EmbeddingDispatcher import EmbeddingDispatcher
+from app.FallbackVerifier import VerdictCache
+from app.JobQueue import JobQueue
+from app.ResultsStore import ResultsStore, ResultsWriter
+from app.Workspace import ArtifactStore, Workspace
+from app.StreamingUpload import StreamingUpload
+from app.CatalogCache import CatalogCache
+from app.Metrics import REGISTRY, stage_timer
 from app.AccuracyCheck  import calculate_accuracy
-import json
 
 
 app = Flask(__name__)
@@ -17,14 +31,79 @@ UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'csv'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Each run gets its own workspace; preprocessed internal catalogs are shared between runs
+app.config['RUNS_FOLDER'] = os.path.join(UPLOAD_FOLDER, 'runs')
+app.config['ARTIFACTS_FOLDER'] = os.path.join(UPLOAD_FOLDER, 'artifacts')
+# Nearest-neighbour backend for semantic matching: 'exact' or 'ivf'
+app.config['EMBEDDING_INDEX'] = os.getenv('EMBEDDING_INDEX', 'exact')
+# Embedding cache shared by all /preprocess runs
+app.config['EMBEDDING_CACHE'] = os.path.join(UPLOAD_FOLDER, 'embedding_cache.sqlite')
+app.config['EMBEDDING_CACHE_MAX_ENTRIES'] = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', 1000000))
+# Embedding backend: 'openai', or a CPU-local 'hashing' or 'sentence-transformers' provider
+app.config['EMBEDDING_PROVIDER'] = os.getenv('EMBEDDING_PROVIDER', 'openai')
+app.config['EMBEDDING_DIMENSIONS'] = int(os.getenv('EMBEDDING_DIMENSIONS', 256))
+app.config['EMBEDDING_LOCAL_MODEL'] = os.getenv('EMBEDDING_LOCAL_MODEL', 'all-MiniLM-L6-v2')
+# Embedding dispatch: parallel batches and retry policy
+app.config['EMBEDDING_CONCURRENCY'] = int(os.getenv('EMBEDDING_CONCURRENCY', 4))
+app.config['EMBEDDING_BATCH_TOKENS'] = int(os.getenv('EMBEDDING_BATCH_TOKENS', 8000))
+app.config['EMBEDDING_MAX_RETRIES'] = int(os.getenv('EMBEDDING_MAX_RETRIES', 6))
+# Rows per chunk when streaming catalogs through /preprocess; 0 reads each file whole
+app.config['PREPROCESS_CHUNK_SIZE'] = int(os.getenv('PREPROCESS_CHUNK_SIZE', 50000))
+# On-disk precision of the embedding matrices: 'float32' or 'float16'
+app.config['EMBEDDING_DTYPE'] = os.getenv('EMBEDDING_DTYPE', 'float32')
+# LLM fallback verification: verdict cache, parallel calls and pairs per prompt
+app.config['FALLBACK_CACHE'] = os.path.join(UPLOAD_FOLDER, 'fallback_verdicts.sqlite')
+app.config['FALLBACK_CONCURRENCY'] = int(os.getenv('FALLBACK_CONCURRENCY', 8))
+app.config['FALLBACK_PACK_SIZE'] = int(os.getenv('FALLBACK_PACK_SIZE', 1))
+# Processes for the rule-matching pass; 1 keeps it in the request's job thread
+app.config['MATCH_WORKERS'] = int(os.getenv('MATCH_WORKERS', 1))
+# Unique external rows matched per batch; each batch is written out before the next one starts
+app.config['MATCH_BATCH_ROWS'] = int(os.getenv('MATCH_BATCH_ROWS', 20000))
+# Re-match only rows affected since the previous /match, carrying the rest forward
+app.config['MATCH_INCREMENTAL'] = os.getenv('MATCH_INCREMENTAL', '1') == '1'
+# Background jobs for /preprocess and /match; runs have separate workspaces, so they run side by side
+app.config['JOB_DATABASE'] = os.path.join(UPLOAD_FOLDER, 'jobs.sqlite')
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 4))
+# Loaded internal catalogs kept in memory between matches, and whether to load them at startup
+app.config['CATALOG_CACHE_MB'] = int(os.getenv('CATALOG_CACHE_MB', 2048))
+app.config['CATALOG_WARM_UP'] = os.getenv('CATALOG_WARM_UP', '1') == '1'
+# Default page size of /view-mapped
+app.config['VIEW_PAGE_SIZE'] = int(os.getenv('VIEW_PAGE_SIZE', 100))
+
+os.makedirs(app.config['RUNS_FOLDER'], exist_ok=True)
+job_queue = JobQueue(app.config['JOB_DATABASE'], app.config['JOB_WORKERS'], UPLOAD_FOLDER)
+artifact_store = ArtifactStore(app.config['ARTIFACTS_FOLDER'], CatalogCache(app.config['CATALOG_CACHE_MB']))
+# Job id of the match queued or running for each run; a run's results files take one writer at a time
+active_matches = {}
+active_matches_lock = threading.Lock()
+
+def warm_up_job(progress):
+    """Load the most recently used internal catalogs into the catalog cache; runs on the job queue."""
+    progress.stage('warm_up')
+    warmed = artifact_store.warm_up(app.config['EMBEDDING_INDEX'], row_hashes=app.config['MATCH_INCREMENTAL'])
+    return {'message': f'Warmed {len(warmed)} internal catalogs', 'catalogs': warmed}
+
+if app.config['CATALOG_WARM_UP']:
+    job_queue.submit('warm_up', warm_up_job)
 
 # Helper function to check if the file has an allowed extension
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def run_workspace():
+    """Workspace of the run named by the request's run_id, or None."""
+    return Workspace.open(app.config['RUNS_FOLDER'], request.values.get('run_id'))
+
+def run_not_found():
+    return jsonify({'message': 'Run not found. Upload the files to start a new run.'}), 404
+
 # Route for uploading files
 @app.route('/upload', methods=['POST'])
 def upload_files():
+    # ?stream=1 preprocesses both catalogs while they upload
+    if request.args.get('stream') == '1':
+        return stream_upload()
+
     if 'file1' not in request.files or 'file2' not in request.files:
         return jsonify({'message': 'No file part'}), 400
 
@@ -32,113 +111,408 @@ def upload_files():
     file2 = request.files['file2']
 
     if file1 and allowed_file(file1.filename) and file2 and allowed_file(file2.filename):
-        filename1 = os.path.join(app.config['UPLOAD_FOLDER'], file1.filename)
-        filename2 = os.path.join(app.config['UPLOAD_FOLDER'], file2.filename)
+        # Upload into the given run, or start a new one
+        workspace = run_workspace() or Workspace.create(app.config['RUNS_FOLDER'])
+        filename1 = workspace.path(secure_filename(file1.filename))
+        filename2 = workspace.path(secure_filename(file2.filename))
 
         file1.save(filename1)
         file2.save(filename2)
 
         return jsonify({
-            'message': 'Files uploaded successfully'
+            'message': 'Files uploaded successfully',
+            'run_id': workspace.run_id
         }), 200
     else:
         return jsonify({'message': 'Invalid file format. Only CSV files are allowed.'}), 400
 
+def embedding_dispatcher():
+    provider = make_provider(app.config['EMBEDDING_PROVIDER'], app.config['EMBEDDING_DIMENSIONS'],
+                             app.config['EMBEDDING_LOCAL_MODEL'], app.config['EMBEDDING_BATCH_TOKENS'])
+    return provider, EmbeddingDispatcher.for_provider(provider, app.config['EMBEDDING_CONCURRENCY'],
+                                                      app.config['EMBEDDING_MAX_RETRIES'])
+
+def internal_artifact_settings(provider, **extra):
+    """Every setting that changes a preprocessed internal catalog, for ArtifactStore.key."""
+    rules = load_preprocess_rules(os.getenv("PREPROCESS_TABLES"))
+    return {
+        'name_column': 'LONG_NAME',
+        'embedding_model': provider.name,
+        'dtype': app.config['EMBEDDING_DTYPE'],
+        'abbreviations': list(rules.abbreviations.items()),
+        'stop_words': sorted(rules.stop_words),
+        **extra
+    }
+
+def preprocess_job(progress, workspace, chunk_size):
+    """Preprocess and embed both catalogs of a run; runs on the job queue.
+
+    The internal catalog is preprocessed into a shared artifact, or reuses the
+    one another run already built from the same file and settings.
+    """
+    external_file = workspace.path('Data_External.csv')
+    internal_file = workspace.path('Data_Internal.csv')
+    external_processed_file = workspace.path('Processed_External.csv')
+    external_embeddings_file = workspace.path('External_Embeddings.npy')
+
+    provider, dispatcher = embedding_dispatcher()
+    artifact_key = ArtifactStore.key(internal_file, internal_artifact_settings(provider))
+    # Reference the artifact before building it, so no other run's cleanup can remove it meanwhile
+    artifact_store.bind(workspace.run_id, artifact_key)
+
+    # Stream both files through preprocessing and embedding, appending each chunk to the outputs
+    with EmbeddingCache(app.config['EMBEDDING_CACHE'], app.config['EMBEDDING_CACHE_MAX_ENTRIES']) as cache:
+        progress.stage('external', count_csv_rows(external_file))
+        external_stats = preprocess_file(external_file, "PRODUCT_NAME", external_processed_file,
+                                         external_embeddings_file, chunk_size, cache, dispatcher,
+                                         app.config['EMBEDDING_DTYPE'], progress)
+        internal_rows = count_csv_rows(internal_file)
+        progress.stage('internal', internal_rows)
+        internal_stats = artifact_store.build(artifact_key, lambda folder: preprocess_file(
+            internal_file, "LONG_NAME", os.path.join(folder, ArtifactStore.PROCESSED_FILE),
+            os.path.join(folder, ArtifactStore.EMBEDDINGS_FILE), chunk_size, cache, dispatcher,
+            app.config['EMBEDDING_DTYPE'], progress
+        ))
+        if internal_stats is None:
+            progress.advance(internal_rows)
+
+    def internal(*keys):
+        return {key: internal_stats[key] for key in keys} if internal_stats else None
+
+    return {
+        'message': 'Preprocessing and embedding completed successfully',
+        'run_id': workspace.run_id,
+        'external_processed_file': external_processed_file,
+        'internal_processed_file': artifact_store.path(artifact_key, ArtifactStore.PROCESSED_FILE),
+        'external_embeddings_file': external_embeddings_file,
+        'internal_embeddings_file': artifact_store.path(artifact_key, ArtifactStore.EMBEDDINGS_FILE),
+        'internal_artifact': {
+            'key': artifact_key,
+            'reused': internal_stats is None,
+            'runs': artifact_store.refcount(artifact_key)
+        },
+        'embedding_model': provider.name,
+        'embedding_cache': {
+            'external': {key: external_stats[key] for key in ('rows', 'cache_hits', 'cache_misses')},
+            'internal': internal('rows', 'cache_hits', 'cache_misses')
+        },
+        'streaming': {
+            'chunk_size': chunk_size,
+            'external': {key: external_stats[key] for key in ('chunks', 'seconds', 'rows_per_second')},
+            'internal': internal('chunks', 'seconds', 'rows_per_second'),
+            'peak_rss_mb': peak_rss_mb()
+        },
+        'timings': {'external': external_stats['timings'], 'internal': internal_stats['timings'] if internal_stats else {}}
+    }
+
+def stream_upload():
+    """/upload?stream=1: save, validate and preprocess both catalogs as the request body arrives.
+
+    Each CSV is recognised by its LONG_NAME or PRODUCT_NAME column and fed
+    to preprocess_file while it uploads. Internal rows whose name repeats an
+    earlier one are dropped, as they could only ever be the second choice of
+    an identical match. External rows are all kept, so the results still
+    have one row per uploaded row; the matcher collapses their duplicates
+    (see duplicate_groups). The reply comes once the body is in and its
+    columns and encoding are checked, with a job that waits for the
+    preprocessing to finish, so no separate /preprocess call is needed.
+    A catalog that fails to preprocess fails that job, which undoes the
+    upload.
+    """
+    # The body is parsed below, so the run id can only come from the query string
+    workspace = Workspace.open(app.config['RUNS_FOLDER'], request.args.get('run_id'))
+    created = workspace is None
+    if created:
+        workspace = Workspace.create(app.config['RUNS_FOLDER'])
+    chunk_size = request.args.get('chunk_size', app.config['PREPROCESS_CHUNK_SIZE'], type=int)
+    provider, dispatcher = embedding_dispatcher()
+
+    def preprocess(catalog, pipe):
+        with EmbeddingCache(app.config['EMBEDDING_CACHE'], app.config['EMBEDDING_CACHE_MAX_ENTRIES']) as cache:
+            if catalog == 'external':
+                return preprocess_file(pipe, "PRODUCT_NAME", workspace.path('Processed_External.csv'),
+                                       workspace.path('External_Embeddings.npy'), chunk_size, cache, dispatcher,
+                                       app.config['EMBEDDING_DTYPE'])
+            # Built inside the run, then moved into the artifact store once the file's hash is known
+            folder = workspace.path('internal_artifact')
+            shutil.rmtree(folder, ignore_errors=True)
+            os.makedirs(folder)
+            return preprocess_file(pipe, "LONG_NAME", os.path.join(folder, ArtifactStore.PROCESSED_FILE),
+                                   os.path.join(folder, ArtifactStore.EMBEDDINGS_FILE), chunk_size, cache, dispatcher,
+                                   app.config['EMBEDDING_DTYPE'], dedupe=True)
+
+    upload = StreamingUpload(workspace, preprocess)
+    try:
+        upload.receive(request.environ)
+    except (ValueError, BadRequest) as e:
+        # BadRequest covers the client disconnecting mid-upload
+        undo_stream_upload(workspace, created)
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        undo_stream_upload(workspace, created)
+        return jsonify({'message': f'Error during upload: {str(e)}'}), 500
+
+    job_id = job_queue.submit('preprocess', stream_upload_job, workspace, upload, provider, created)
+    return jsonify({
+        'message': 'Files uploaded successfully; preprocessing is finishing',
+        'run_id': workspace.run_id,
+        'job_id': job_id,
+        'status_url': f'/jobs/{job_id}'
+    }), 202
+
+def undo_stream_upload(workspace, created):
+    """Remove what a failed streaming upload left: the whole run if it started one, else its partial artifact."""
+    if created:
+        workspace.delete()
+    else:
+        shutil.rmtree(workspace.path('internal_artifact'), ignore_errors=True)
+
+def stream_upload_job(progress, workspace, upload, provider, created):
+    """Wait for a streaming upload's preprocessing and publish its internal artifact; runs on the job queue."""
+    progress.stage('preprocess')
+    try:
+        stats = upload.wait()
+    except Exception:
+        undo_stream_upload(workspace, created)
+        raise
+    internal_file = workspace.path('Data_Internal.csv')
+    artifact_key = ArtifactStore.key(internal_file, internal_artifact_settings(provider, dedupe_names=True),
+                                     upload.catalogs['internal'].digest)
+    # Reference the artifact before adopting it, so no other run's cleanup can remove it meanwhile
+    artifact_store.bind(workspace.run_id, artifact_key)
+    reused = not artifact_store.adopt(artifact_key, workspace.path('internal_artifact'))
+
+    def counts(catalog):
+        return {key: stats[catalog][key] for key in ('rows', 'duplicates', 'cache_hits', 'cache_misses', 'seconds')}
+
+    return {
+        'message': 'Preprocessing and embedding completed successfully',
+        'run_id': workspace.run_id,
+        'internal_artifact': {
+            'key': artifact_key,
+            'reused': reused,
+            'runs': artifact_store.refcount(artifact_key)
+        },
+        'embedding_model': provider.name,
+        'external': counts('external'),
+        'internal': counts('internal'),
+        'timings': {catalog: stats[catalog]['timings'] for catalog in stats}
+    }
+
 # Route for preprocessing data
 @app.route('/preprocess', methods=['POST'])
 def preprocess_files():
     try:
-        external_file = os.path.join(app.config['UPLOAD_FOLDER'], 'Data_External.csv')
-        internal_file = os.path.join(app.config['UPLOAD_FOLDER'], 'Data_Internal.csv')
+        workspace = run_workspace()
+        if workspace is None:
+            return run_not_found()
+        external_file = workspace.path('Data_External.csv')
+        internal_file = workspace.path('Data_Internal.csv')
 
         if not os.path.exists(external_file) or not os.path.exists(internal_file):
             return jsonify({'message': 'Uploaded files not found'}), 404
 
-        # Load and preprocess the files
-        data_external = pd.read_csv(external_file)
-        data_internal = pd.read_csv(internal_file)
-
-        data_external_preprocessed = preprocess_data(data_external, "PRODUCT_NAME")
-        data_internal_preprocessed = preprocess_data(data_internal, "LONG_NAME")
-
-        # Save preprocessed files
-        external_processed_file = os.path.join(app.config['UPLOAD_FOLDER'], 'Processed_External.csv')
-        internal_processed_file = os.path.join(app.config['UPLOAD_FOLDER'], 'Processed_Internal.csv')
-
-        data_external_preprocessed.to_csv(external_processed_file, index=False)
-        data_internal_preprocessed.to_csv(internal_processed_file, index=False)
-
-        # Compute and save embeddings
-        external_embeddings_file = os.path.join(app.config['UPLOAD_FOLDER'], 'External_Embeddings.pkl')
-        internal_embeddings_file = os.path.join(app.config['UPLOAD_FOLDER'], 'Internal_Embeddings.pkl')
-
-        compute_and_save_embeddings(data_external_preprocessed, 'original_name', 'cleaned_name', external_embeddings_file)
-        compute_and_save_embeddings(data_internal_preprocessed, 'original_name', 'cleaned_name', internal_embeddings_file)
+        chunk_size = request.args.get('chunk_size', app.config['PREPROCESS_CHUNK_SIZE'], type=int)
+        # ?profile=1 runs this job under cProfile
+        job_id = job_queue.submit('preprocess', preprocess_job, workspace, chunk_size,
+                                  profile=request.args.get('profile') == '1')
 
         return jsonify({
-            'message': 'Preprocessing and embedding completed successfully',
-            'external_processed_file': external_processed_file,
-            'internal_processed_file': internal_processed_file,
-            'external_embeddings_file': external_embeddings_file,
-            'internal_embeddings_file': internal_embeddings_file
-        }), 200
+            'message': 'Preprocessing started',
+            'run_id': workspace.run_id,
+            'job_id': job_id,
+            'status_url': f'/jobs/{job_id}'
+        }), 202
     except Exception as e:
         return jsonify({'message': f'Error during preprocessing: {str(e)}'}), 500
 
+def exclusive_match_job(progress, workspace, artifact_key, incremental):
+    """match_job, freeing the run for the next /match once it ends."""
+    try:
+        return match_job(progress, workspace, artifact_key, incremental)
+    finally:
+        with active_matches_lock:
+            active_matches.pop(workspace.run_id, None)
+
+def match_job(progress, workspace, artifact_key, incremental):
+    """Match a run's preprocessed catalogs and write its Matched_Results.csv; runs on the job queue.
+
+    Results are written batch by batch as they are matched, so /view-mapped
+    shows the rows done so far while the job is still running.
+    """
+    progress.stage('load')
+    # Memory-map the embeddings; only the name and size columns are loaded
+    external_store = EmbeddingStore(workspace.path('External_Embeddings.npy'))
+
+    # Run the matching pipeline. The internal catalog, its nearest-neighbour index and its
+    # CandidateIndex come from the catalog cache, shared with every run matching against it
+    stats = {'timings': {}}
+    with artifact_store.use(artifact_key) as catalog, \
+            VerdictCache(app.config['FALLBACK_CACHE']) as verdict_cache:
+        with stage_timer('load', timings=stats['timings']):
+            index = catalog.index(app.config['EMBEDDING_INDEX'])
+            candidate_index = catalog.candidate_index()
+            internal_hashes = catalog.row_hashes() if incremental else None
+        verifier = make_fallback_verifier(verdict_cache, app.config['FALLBACK_CONCURRENCY'], app.config['FALLBACK_PACK_SIZE'])
+        if incremental:
+            settings = {'prompt_version': FALLBACK_PROMPT_VERSION, 'index': app.config['EMBEDDING_INDEX'],
+                        'embedding_model': catalog.store.manifest.get('model')}
+            batches = iter_incremental_matching(external_store.frame, catalog.frame, external_store.matrix,
+                                                catalog.matrix, workspace.path('Match_State.parquet'), settings,
+                                                threshold=0.8, stats=stats, index=index, verifier=verifier,
+                                                progress=progress, workers=app.config['MATCH_WORKERS'],
+                                                candidate_index=candidate_index, internal_hashes=internal_hashes,
+                                                batch_size=app.config['MATCH_BATCH_ROWS'])
+        else:
+            batches = iter_matching_pipeline(external_store.frame, catalog.frame, threshold=0.8, stats=stats,
+                                             index=index, verifier=verifier, external_vectors=external_store.matrix,
+                                             progress=progress, workers=app.config['MATCH_WORKERS'],
+                                             candidate_index=candidate_index, batch_size=app.config['MATCH_BATCH_ROWS'])
+
+        # Save each batch of results as soon as it is matched
+        results_file = workspace.path('Matched_Results.csv')
+        with ResultsWriter(results_file, workspace.path('Matched_Results.sqlite')) as writer:
+            for records in batches:
+                progress.stage('save', len(records))
+                with stage_timer('save', len(records), stats['timings']):
+                    writer.write(records)
+
+    return {
+        'message': 'Matching pipeline executed successfully',
+        'run_id': workspace.run_id,
+        'results_file': results_file,
+        'download_url': f'/download/{os.path.basename(results_file)}?run_id={workspace.run_id}',
+        'dedupe': stats['dedupe'],
+        'blocking': stats['blocking'],
+        'fallback': stats['fallback'],
+        'incremental': stats.get('incremental'),
+        'rows_written': writer.rows,
+        'catalog_cache': artifact_store.cache.stats(),
+        'timings': stats['timings']
+    }
+
 # Route for running the matching pipeline
 @app.route('/match', methods=['POST'])
 def run_matching():
     try:
-        external_embeddings_file = os.path.join(app.config['UPLOAD_FOLDER'], 'External_Embeddings.pkl')
-        internal_embeddings_file = os.path.join(app.config['UPLOAD_FOLDER'], 'Internal_Embeddings.pkl')
-
-        if not os.path.exists(external_embeddings_file) or not os.path.exists(internal_embeddings_file):
+        workspace = run_workspace()
+        if workspace is None:
+            return run_not_found()
+        external_embeddings_file = workspace.path('External_Embeddings.npy')
+        artifact_key = artifact_store.key_for(workspace.run_id)
+
+        if (not os.path.exists(store_paths(external_embeddings_file)[2]) or artifact_key is None
+                or not artifact_store.exists(artifact_key)):
             return jsonify({'message': 'Embeddings files not found. Please preprocess the data first.'}), 404
 
-        # Load embeddings
-        data_external = pd.read_pickle(external_embeddings_file)
-        data_internal = pd.read_pickle(internal_embeddings_file)
-
-        # Run the matching pipeline
-        matches = run_matching_pipeline(data_external, data_internal, threshold=0.8)
-
-        # Save the results
-        results_file = os.path.join(app.config['UPLOAD_FOLDER'], 'Matched_Results.csv')
-        matches.to_csv(results_file, index=False)
+        # Scores between vectors from different embedding providers mean nothing
+        try:
+            check_same_space(EmbeddingStore(external_embeddings_file),
+                             EmbeddingStore(artifact_store.path(artifact_key, ArtifactStore.EMBEDDINGS_FILE)))
+        except ValueError as e:
+            return jsonify({'message': f'{e} Please preprocess both files with the same embedding provider.'}), 409
+
+        incremental = request.args.get('incremental', '1' if app.config['MATCH_INCREMENTAL'] else '0') == '1'
+        # Held until the job is registered, so it cannot free the run before then
+        with active_matches_lock:
+            running = active_matches.get(workspace.run_id)
+            if running is not None:
+                return jsonify({
+                    'message': 'A match for this run is already queued or running.',
+                    'run_id': workspace.run_id,
+                    'job_id': running,
+                    'status_url': f'/jobs/{running}'
+                }), 409
+            job_id = job_queue.submit('match', exclusive_match_job, workspace, artifact_key, incremental,
+                                      profile=request.args.get('profile') == '1')
+            active_matches[workspace.run_id] = job_id
 
         return jsonify({
-            'message': 'Matching pipeline executed successfully',
-            'results_file': results_file
-        }), 200
+            'message': 'Matching started',
+            'run_id': workspace.run_id,
+            'job_id': job_id,
+            'status_url': f'/jobs/{job_id}'
+        }), 202
     except Exception as e:
         return jsonify({'message': f'Error during matching: {str(e)}'}), 500
 
+# Route for polling a preprocessing or matching job
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'message': 'Job not found'}), 404
+    return jsonify(job), 200
+
+# Route for deleting a run's workspace; its internal catalog artifact goes too once no other run uses it
+@app.route('/runs/<run_id>', methods=['DELETE'])
+def delete_run(run_id):
+    workspace = Workspace.open(app.config['RUNS_FOLDER'], run_id)
+    if workspace is None:
+        return run_not_found()
+    artifact_store.release(run_id)
+    workspace.delete()
+    return jsonify({'message': 'Run deleted'}), 200
+
+# Route for Prometheus scraping: stage timers and counters since the server started
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 # Route for downloading the final product list
 @app.route('/download/<filename>', methods=['GET'])
 def download_file(filename):
+    workspace = run_workspace()
+    if workspace is None:
+        return run_not_found()
     try:
-        # Ensure we are serving the file from the correct directory
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True)
+        # Ensure we are serving the file from the run's own directory
+        return send_from_directory(workspace.folder, filename, as_attachment=True)
     except FileNotFoundError:
         return jsonify({'message': 'File not found'}), 404
 
-# Route for fetching the matched results as JSON
+# Route for fetching the matched results as JSON, one page at a time
 @app.route('/view-mapped', methods=['GET'])
 def view_mapped_results():
     try:
-        results_file = os.path.join(app.config['UPLOAD_FOLDER'], 'Matched_Results.csv')
-
-        if not os.path.exists(results_file):
-            return jsonify({'message': 'Matched results file not found.'}), 404
-
-        # Read the CSV file into a DataFrame and convert to JSON
-        df = pd.read_csv(results_file).fillna("")  # Fill NaN with empty strings
-        return jsonify(df.to_dict(orient='records'))
+        workspace = run_workspace()
+        if workspace is None:
+            return run_not_found()
+        results_file = workspace.path('Matched_Results.csv')
+
+        try:
+            cursor = request.args.get('cursor', type=int)
+            offset = request.args.get('offset', 0, type=int)
+            limit = request.args.get('limit', app.config['VIEW_PAGE_SIZE'], type=int)
+            filters = {
+                'method': request.args.get('method') or None,
+                'min_score': float(request.args['min_score']) if request.args.get('min_score') else None,
+                'max_score': float(request.args['max_score']) if request.args.get('max_score') else None
+            }
+        except ValueError:
+            return jsonify({'message': 'min_score and max_score must be numbers.'}), 400
+
+        # A running or failed match shows the rows it wrote; otherwise the finished results
+        store = ResultsStore.live(workspace.path('Matched_Results.sqlite'))
+        if store is None:
+            if not os.path.exists(results_file):
+                return jsonify({'message': 'Matched results file not found.'}), 404
+            # Results written before the store existed, or edited since, are indexed on first view
+            store = ResultsStore.open(results_file, workspace.path('Matched_Results.sqlite'))
+
+        # ?format=ndjson streams every matching row, one JSON object per line
+        if request.args.get('format') == 'ndjson':
+            lines = (f"{record}\n" for record in store.iter_records(**filters))
+            return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+        # While a match is running, or after it failed, the rows so far come with complete false
+        rows, next_cursor, total = store.page(cursor=cursor, offset=offset, limit=limit, **filters)
+        return jsonify({'rows': rows, 'next_cursor': next_cursor, 'total': total, 'complete': store.is_complete(),
+                        'status': store.status(), 'error': store.meta('error')})
     except Exception as e:
         return jsonify({'message': f'Error fetching mapped results: {str(e)}'}), 500
 
 
-
 @app.route('/check-accuracy', methods=['POST'])
 def check_accuracy():
     if 'file' not in request.files:
@@ -149,12 +523,16 @@ def check_accuracy():
     if not file or not allowed_file(file.filename):
         return jsonify({'message': 'Invalid file format. Only CSV files are allowed.'}), 400
 
+    workspace = run_workspace()
+    if workspace is None:
+        return run_not_found()
+
     # Save uploaded file
-    uploaded_file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
+    uploaded_file_path = workspace.path(secure_filename(file.filename))
     file.save(uploaded_file_path)
 
     # Define file paths
-    actual_file = os.path.join(app.config['UPLOAD_FOLDER'], 'Matched_Results.csv')
+    actual_file = workspace.path('Matched_Results.csv')
     predicted_file = uploaded_file_path
 
     # Check if files exist
@@ -162,12 +540,10 @@ def check_accuracy():
         return jsonify({'message': 'Matched results file not found. Please run the matching process first.'}), 404
 
     # Calculate accuracy
-    response = calculate_accuracy(actual_file, predicted_file)
-
-    try:
-        return jsonify(json.loads(response))
-    except Exception as e:
-        return jsonify({'message': f'Error processing accuracy check: {str(e)}'}), 500
+    result = calculate_accuracy(actual_file, predicted_file)
+    if 'error' in result:
+        return jsonify({'message': f"Error processing accuracy check: {result['error']}"}), 400
+    return jsonify(result)
 
 if __name__ == '__main__':
     app.run(debug=True)
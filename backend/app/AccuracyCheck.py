@@ -1,6 +1,6 @@
+import numpy as np
 import pandas as pd
-from rapidfuzz import fuzz
-import json
+from rapidfuzz import fuzz, process
 
 def preprocess(df):
     """Preprocess data by stripping, lowering, and filling NAs."""
@@ -9,7 +9,52 @@ def preprocess(df):
     except Exception as e:
         raise ValueError(f"Preprocessing error: {str(e)}")
 
-def calculate_accuracy(actual_file, predicted_file, threshold=90):
+def pair_scores(a, b, workers=-1):
+    """fuzz.ratio of each a[i] against b[i], scored in bulk across all cores."""
+    return process.cpdist(a, b, scorer=fuzz.ratio, dtype=np.float64, workers=workers)
+
+def ratio(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else None
+
+def method_breakdown(methods, matches, predicted, expected):
+    """Precision and recall of each Method's predictions.
+
+    A row predicts a match when its internal name is not null. Precision is
+    the share of a Method's predicted matches that are correct; recall is the
+    share of all true matches (non-null expected internal) that the Method
+    found, so recalls add up to the overall recall.
+    """
+    true_positives = matches & predicted
+    positives = int(expected.sum())
+    frame = pd.DataFrame({
+        'method': methods,
+        'correct': matches,
+        'predicted': predicted,
+        'true_positives': true_positives
+    }).groupby('method', sort=True).agg(
+        rows=('correct', 'size'),
+        correct=('correct', 'sum'),
+        predicted=('predicted', 'sum'),
+        true_positives=('true_positives', 'sum')
+    )
+    return {
+        str(method): {
+            'rows': int(row.rows),
+            'correct': int(row.correct),
+            'precision': ratio(int(row.true_positives), int(row.predicted)),
+            'recall': ratio(int(row.true_positives), positives)
+        }
+        for method, row in frame.iterrows()
+    }
+
+def calculate_accuracy(actual_file, predicted_file, threshold=90, workers=-1):
+    """Grade matched results against a reference file, row by row.
+
+    A row is correct when both the external and internal names are at least
+    threshold similar. Returns a dict with the accuracy, the per-row results
+    (wrong rows first), overall and per-Method precision and recall, or
+    {"error": ...}.
+    """
     try:
         # Load CSV files with detailed logging
         try:
@@ -32,45 +77,45 @@ def calculate_accuracy(actual_file, predicted_file, threshold=90):
         except ValueError as e:
             return {"error": str(e)}
 
-        # Matching logic
-        def is_match(row1, row2):
-            return (
-                fuzz.ratio(row1[0], row2[0]) >= threshold and 
-                fuzz.ratio(row1[1], row2[1]) >= threshold
-            )
-
-        matches = [is_match(a, p) for a, p in zip(actual_pairs.values, predicted_pairs.values)]
-        correct_matches = actual_pairs[matches].reset_index(drop=True)
-        wrong_matches = actual_pairs[~pd.Series(matches)].reset_index(drop=True)
-        predicted_wrong = predicted_pairs[~pd.Series(matches)].reset_index(drop=True)
+        # Matching logic: both names must clear the threshold
+        external, internal = (actual_pairs.iloc[:, i].tolist() for i in range(2))
+        expected_external, expected_internal = (predicted_pairs.iloc[:, i].tolist() for i in range(2))
+        matches = (
+            (pair_scores(external, expected_external, workers) >= threshold) &
+            (pair_scores(internal, expected_internal, workers) >= threshold)
+        )
 
         total_entries = len(actual_df)
-        accuracy = (len(correct_matches) / total_entries) * 100
-
-        # Format the results for JSON response
-        result_data = []
-        for idx, row in wrong_matches.iterrows():
-            result_data.append({
-                "external": row[0],
-                "predicted_internal": row[1],
-                "actual_internal": predicted_wrong.iloc[idx, 1],
-                "status": "Wrong"
-            })
-
-        for idx, row in correct_matches.iterrows():
-            result_data.append({
-                "external": row[0],
-                "predicted_internal": row[1],
-                "actual_internal": row[1],
-                "status": "Correct"
-            })
+        accuracy = (int(matches.sum()) / total_entries) * 100 if total_entries else 0.0
+
+        # Format the results for JSON response, wrong rows first
+        order = np.concatenate([np.flatnonzero(~matches), np.flatnonzero(matches)]).tolist()
+        flags = matches.tolist()
+        results = [
+            {
+                "external": external[i],
+                "predicted_internal": internal[i],
+                "actual_internal": internal[i] if flags[i] else expected_internal[i],
+                "status": "Correct" if flags[i] else "Wrong"
+            }
+            for i in order
+        ]
+
+        predicted = actual_pairs.iloc[:, 1].to_numpy() != "null"
+        expected = predicted_pairs.iloc[:, 1].to_numpy() != "null"
+        true_positives = int((matches & predicted).sum())
 
         response = {
             "accuracy": round(accuracy, 2),
-            "results": result_data
+            "precision": ratio(true_positives, int(predicted.sum())),
+            "recall": ratio(true_positives, int(expected.sum())),
+            "results": results
         }
+        if 'Method' in actual_df.columns:
+            methods = actual_df['Method'].fillna("").astype(str).to_numpy()
+            response["by_method"] = method_breakdown(methods, matches, predicted, expected)
 
-        return json.dumps(response, indent=4)
+        return response
 
     except Exception as e:
         return {"error": f"Unexpected processing error: {str(e)}"}
@@ -0,0 +1,208 @@
+import copy
+import math
+import re
+from collections import Counter, defaultdict
+import pandas as pd
+
+# Rule-based match constants, shared with the blocking bounds below
+SIZE_TOLERANCE = 0.1
+NAME_THRESHOLD = 85
+
+# Any manufacturer key, used for rows without a manufacturer
+ANY_MANUFACTURER = object()
+
+# Characters 128-255 are dropped, as fuzzywuzzy's force_ascii did
+LATIN1_HIGH = dict.fromkeys(range(128, 256))
+NON_WORD = re.compile(r"(?ui)\W")
+
+
+def sort_tokens(name):
+    """Normalize a name the same way fuzzywuzzy's token_sort_ratio did."""
+    if name is None:
+        return None
+    processed = NON_WORD.sub(" ", str(name).translate(LATIN1_HIGH)).lower().strip()
+    return " ".join(sorted(processed.split())).strip()
+
+
+def bigrams(text):
+    """Multiset of character bigrams of a string."""
+    return Counter(text[i:i + 2] for i in range(len(text) - 1))
+
+
+def min_shared_bigrams(length1, length2, threshold=NAME_THRESHOLD):
+    """Lower bound on the bigrams two strings must share to reach the ratio threshold.
+
+    A ratio of at least threshold (rounded) needs a common subsequence of at
+    least m characters; every deletion breaks at most two bigrams of the first
+    string and every insertion at most one, so 3m - len1 - len2 - 1 bigrams
+    survive. Returns None when the lengths alone rule out a match.
+    """
+    total = length1 + length2
+    min_common = math.ceil((threshold - 0.5) / 200 * total - 1e-9)
+    if min_common > min(length1, length2):
+        return None
+    return 3 * min_common - total - 1
+
+
+def size_value(size):
+    """Return a size usable for matching, or None when the rule can never match."""
+    if isinstance(size, bool) or not size:
+        return None
+    try:
+        size = float(size)
+    except (TypeError, ValueError):
+        return None
+    return size if math.isfinite(size) else None
+
+
+def manufacturer_value(manufacturer):
+    return manufacturer if pd.notna(manufacturer) else None
+
+
+def row_fields(row):
+    """(size, manufacturer, sorted name) of one row, as the rule-based match compares them."""
+    return (size_value(row.get('size', None)), manufacturer_value(row.get('manufacturer', None)),
+            sort_tokens(row.get('cleaned_name', None)))
+
+
+class RuleFields:
+    """row_fields for a whole frame, extracted once into plain columns."""
+
+    __slots__ = ('sizes', 'manufacturers', 'names')
+
+    def __init__(self, frame):
+        missing = [None] * len(frame)
+        column = lambda name: frame[name].tolist() if name in frame.columns else missing  # noqa: E731
+        self.sizes = [size_value(size) for size in column('size')]
+        self.manufacturers = [manufacturer_value(manufacturer) for manufacturer in column('manufacturer')]
+        self.names = [sort_tokens(name) for name in column('cleaned_name')]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return zip(self.sizes, self.manufacturers, self.names)
+
+
+class CandidateIndex:
+    """Blocking index over the internal catalog for the rule-based pass.
+
+    Internal rows are grouped by manufacturer and by size bucket, and each
+    block keeps an inverted index of the character bigrams of the token-sorted
+    cleaned name. A bigram's postings are split by occurrence: level k lists
+    the rows holding it more than k times, so the bigrams a row shares with a
+    query are counted with Counter.update. candidates() returns every internal position that could pass
+    rule_based_match, in catalog order, so checking them in order keeps the
+    first-match-wins result of a full scan. records holds the row_fields of
+    every indexed position, so candidates can be checked without the frame.
+    """
+
+    def __init__(self, internal, size_tolerance=SIZE_TOLERANCE, name_threshold=NAME_THRESHOLD, positions=None):
+        self.size_tolerance = size_tolerance
+        self.name_threshold = name_threshold
+        self.size = len(internal)
+        # Positions reported for the rows of internal, e.g. when it is a slice of a larger catalog
+        positions = range(self.size) if positions is None else positions
+        self.lengths = {}
+        self.records = {}
+        self.blocks = defaultdict(lambda: {'rows_by_length': defaultdict(list), 'postings': defaultdict(list)})
+        self.buckets_by_manufacturer = defaultdict(set)
+        self.pairs_total = 0
+        self.pairs_candidates = 0
+        self.posting_entries = 0
+
+        for position, (size, manufacturer, name) in zip(positions, RuleFields(internal)):
+            if size is None or name is None:
+                continue
+
+            self.lengths[position] = len(name)
+            self.records[position] = (size, manufacturer, name)
+            key = (self._manufacturer_key(manufacturer), self._bucket(size))
+            block = self.blocks[key]
+            block['rows_by_length'][len(name)].append(position)
+            for gram, count in bigrams(name).items():
+                levels = block['postings'][gram]
+                for level in range(count):
+                    if level == len(levels):
+                        levels.append([])
+                    levels[level].append(position)
+                self.posting_entries += count
+            self.buckets_by_manufacturer[key[0]].add(key[1])
+
+    @staticmethod
+    def _manufacturer_key(manufacturer):
+        return ANY_MANUFACTURER if manufacturer is None else manufacturer
+
+    def _bucket(self, size):
+        return math.floor(size / self.size_tolerance)
+
+    def _block_keys(self, size, manufacturer):
+        if manufacturer is not None:
+            manufacturer_keys = [manufacturer, ANY_MANUFACTURER]
+        else:
+            manufacturer_keys = list(self.buckets_by_manufacturer)
+
+        # Widen by a hair so float rounding never drops a row on the bucket edge
+        low = math.floor((size - self.size_tolerance) / self.size_tolerance - 1e-6)
+        high = math.floor((size + self.size_tolerance) / self.size_tolerance + 1e-6)
+
+        keys = []
+        for manufacturer_key in manufacturer_keys:
+            buckets = self.buckets_by_manufacturer.get(manufacturer_key, ())
+            keys.extend((manufacturer_key, bucket) for bucket in range(low, high + 1) if bucket in buckets)
+        return keys
+
+    def candidates(self, row):
+        """Internal positions that may rule-match the given external row, in order."""
+        return self.candidates_for(*row_fields(row))
+
+    def candidates_for(self, size, manufacturer, name):
+        """candidates() for a row already reduced to its row_fields."""
+        self.pairs_total += self.size
+        if size is None or name is None:
+            return []
+
+        query = bigrams(name)
+        length = len(name)
+        found = []
+        for key in self._block_keys(size, manufacturer):
+            block = self.blocks[key]
+            shared = Counter()
+            for gram, count in query.items():
+                for level in block['postings'].get(gram, ())[:count]:
+                    shared.update(level)
+
+            needed = {}
+            for other_length, rows in block['rows_by_length'].items():
+                needed[other_length] = min_shared_bigrams(length, other_length, self.name_threshold)
+                # Very short names can pass without sharing a bigram
+                if needed[other_length] is not None and needed[other_length] <= 0:
+                    found.extend(rows)
+            for position, count in shared.items():
+                bound = needed[self.lengths[position]]
+                if bound is not None and 0 < bound <= count:
+                    found.append(position)
+
+        found.sort()
+        self.pairs_candidates += len(found)
+        return found
+
+    def view(self):
+        """A copy sharing this index's blocks but with its own pair counters, for one matching run."""
+        view = copy.copy(self)
+        view.pairs_total = 0
+        view.pairs_candidates = 0
+        return view
+
+    def nbytes(self):
+        """Rough memory footprint: postings and per-row records, as measured on CPython."""
+        return 16 * self.posting_entries + 170 * len(self.records)
+
+    def stats(self):
+        """Pair counts seen so far and the fraction of pairs pruned by blocking."""
+        reduction = 1 - self.pairs_candidates / self.pairs_total if self.pairs_total else 0.0
+        return {
+            'pairs_total': self.pairs_total,
+            'pairs_candidates': self.pairs_candidates,
+            'reduction_ratio': round(reduction, 6)
+        }
@@ -0,0 +1,158 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+from app.Blocking import CandidateIndex
+from app.EmbeddingIndex import load_or_build_index
+from app.EmbeddingStore import EmbeddingStore
+from app.IncrementalMatch import row_hashes
+from app.Metrics import CATALOG_CACHE
+
+# Rough size of one row hash: a 32-character str plus the list slot
+ROW_HASH_BYTES = 90
+
+
+def index_nbytes(index):
+    """Memory held by an index's own arrays; the matrix it searches is counted with the catalog."""
+    return sum(value.nbytes for name, value in vars(index).items() if isinstance(value, np.ndarray) and name != 'matrix')
+
+
+class LoadedCatalog:
+    """An internal catalog loaded for matching, plus everything derived from it.
+
+    The metadata frame and the unit-length matrix are loaded by load(); the
+    nearest-neighbour indexes, the rule-matching CandidateIndex and the row
+    hashes incremental matching compares are built on first use and kept.
+    All of it is only read while matching, so concurrent runs share it.
+    """
+
+    def __init__(self, embeddings_file):
+        self.embeddings_file = embeddings_file
+        self.lock = threading.Lock()
+        self.users = 0
+        self.store = None
+        self.frame = None
+        self.matrix = None
+        self.indexes = {}
+        self._candidate_index = None
+        self._row_hashes = None
+
+    def load(self):
+        """Load the store unless already loaded; True if this call loaded it."""
+        with self.lock:
+            if self.store is not None:
+                return False
+            store = EmbeddingStore(self.embeddings_file)
+            self.frame = store.frame
+            self.matrix = store.matrix
+            self.store = store
+            return True
+
+    def index(self, backend='exact'):
+        with self.lock:
+            if backend not in self.indexes:
+                self.indexes[backend] = load_or_build_index(self.store.path, self.store, backend=backend)
+            return self.indexes[backend]
+
+    def candidate_index(self):
+        """The catalog's CandidateIndex, as a view with pair counters of its own."""
+        with self.lock:
+            if self._candidate_index is None:
+                self._candidate_index = CandidateIndex(self.frame)
+            return self._candidate_index.view()
+
+    def row_hashes(self):
+        with self.lock:
+            if self._row_hashes is None:
+                self._row_hashes = row_hashes(self.frame, self.matrix)
+            return self._row_hashes
+
+    def nbytes(self):
+        with self.lock:
+            if self.store is None:
+                return 0
+            total = int(self.frame.memory_usage(deep=True).sum()) + self.matrix.nbytes
+            total += sum(index_nbytes(index) for index in self.indexes.values())
+            if self._candidate_index is not None:
+                total += self._candidate_index.nbytes()
+            if self._row_hashes is not None:
+                total += ROW_HASH_BYTES * len(self._row_hashes)
+            return total
+
+
+class CatalogCache:
+    """Loaded internal catalogs kept in memory between matches, keyed by artifact.
+
+    use() returns the cached LoadedCatalog, loading it on a miss. Catalogs
+    that no job is using are evicted least recently used first once their
+    estimated sizes add up to more than budget_mb. A catalog is sized when a
+    job finishes with it, so whatever it derived on the way is counted.
+    """
+
+    def __init__(self, budget_mb=2048):
+        self.budget = budget_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.sizes = {}
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    @contextmanager
+    def use(self, key, embeddings_file, warm_up=False):
+        """Yield the LoadedCatalog for key, loaded from embeddings_file on a miss.
+
+        A warm-up load goes in as the least recently used entry, so warming
+        more catalogs than fit evicts the last one warmed, not the most
+        recently matched.
+        """
+        with self.lock:
+            catalog = self.entries.get(key)
+            if catalog is None:
+                catalog = self.entries[key] = LoadedCatalog(embeddings_file)
+            self.entries.move_to_end(key, last=not warm_up)
+            catalog.users += 1
+        try:
+            CATALOG_CACHE.inc(result='miss' if catalog.load() else 'hit')
+            yield catalog
+        finally:
+            size = catalog.nbytes()
+            with self.lock:
+                catalog.users -= 1
+                if self.entries.get(key) is catalog:
+                    self.sizes[key] = size
+            self._evict()
+
+    def _evict(self):
+        with self.lock:
+            total = sum(self.sizes.values())
+            for key, catalog in list(self.entries.items()):
+                if total <= self.budget:
+                    break
+                if catalog.users == 0:
+                    total -= self.sizes.pop(key, 0)
+                    del self.entries[key]
+                    CATALOG_CACHE.inc(result='evicted')
+                    print(f"Evicted catalog {key} from the catalog cache")
+
+    def in_use(self, key):
+        with self.lock:
+            catalog = self.entries.get(key)
+            return catalog is not None and catalog.users > 0
+
+    def discard(self, key):
+        """Drop a catalog no job is using, e.g. before its files are deleted."""
+        with self.lock:
+            catalog = self.entries.get(key)
+            if catalog is not None and catalog.users == 0:
+                del self.entries[key]
+                self.sizes.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'catalogs': len(self.entries),
+                'bytes': sum(self.sizes.values()),
+                'budget_bytes': self.budget
+            }
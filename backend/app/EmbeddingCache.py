@@ -0,0 +1,93 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import numpy as np
+
+# SQLite caps the number of bound parameters per statement
+LOOKUP_BATCH = 500
+
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by model name plus a hash of the cleaned text.
+
+    Vectors are stored as float32 blobs in SQLite. Every hit refreshes the
+    entry's last_used time, and once the cache holds more than max_entries
+    vectors the least recently used ones are evicted.
+    """
+
+    def __init__(self, path, max_entries=1000000):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        # Concurrent runs write the same cache; wait for each other's write locks
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def key(model, text):
+        return hashlib.sha256(f"{model}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, model, texts):
+        """Return {text: vector} for every text already cached for this model."""
+        keys = {self.key(model, text): text for text in texts}
+        found = {}
+        key_list = list(keys)
+        with self.lock:
+            for start in range(0, len(key_list), LOOKUP_BATCH):
+                batch = key_list[start:start + LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, vector in rows:
+                    found[keys[key]] = np.frombuffer(vector, dtype=np.float32)
+                self.connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(time.time(), key) for key, _ in rows]
+                )
+            self.connection.commit()
+        return found
+
+    def put_many(self, model, embeddings):
+        """Store {text: vector} for this model, then evict down to max_entries."""
+        now = time.time()
+        rows = [
+            (self.key(model, text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in embeddings.items()
+        ]
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            self._evict()
+            self.connection.commit()
+
+    def _evict(self):
+        count = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
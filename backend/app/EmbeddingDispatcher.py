@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import openai
+from app.Metrics import EMBEDDING_BATCHES, EMBEDDING_RETRIES, EMBEDDING_SECONDS
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# HTTP statuses worth retrying: rate limits and transient server errors
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def openai_embed(texts, model=EMBEDDING_MODEL):
+    """Embed one batch with the OpenAI API, in input order."""
+    response = openai.Embedding.create(model=model, input=texts)
+    data = sorted(response['data'], key=lambda item: item.get('index', 0))
+    return [item['embedding'] for item in data]
+
+
+def estimate_tokens(text):
+    """Cheap upper-leaning token estimate (about 3 characters per token)."""
+    return len(text) // 3 + 1
+
+
+def make_batches(texts, max_items=100, max_tokens=8000):
+    """Split texts into consecutive batches bounded by item count and estimated tokens."""
+    batches = []
+    batch, batch_tokens = [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if batch and (len(batch) >= max_items or batch_tokens + tokens > max_tokens):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.error.RateLimitError, openai.error.Timeout,
+                          openai.error.APIConnectionError, openai.error.ServiceUnavailableError)):
+        return True
+    return getattr(error, 'http_status', None) in RETRYABLE_STATUSES
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait, if it said so."""
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_retries(fn, *args, max_retries=6, base_delay=1.0, max_delay=60.0, on_retry=None):
+    """Call fn, retrying retryable API errors with exponential backoff and full jitter."""
+    for attempt in range(max_retries + 1):
+        try:
+            return fn(*args)
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            if on_retry:
+                on_retry(e)
+            time.sleep(retry_after(e) or random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+
+class EmbeddingDispatcher:
+    """Runs embedding batches concurrently with retries, keeping the input order.
+
+    Batches are sized by item count and estimated tokens and sent from a thread
+    pool. Retryable failures (429s and transient server errors) back off
+    exponentially with full jitter, honouring Retry-After when present. With a
+    checkpoint file, every finished batch is appended to it so a rerun over the
+    same texts skips batches that already completed. model names the vector
+    space embed_fn produces (see EmbeddingProvider.name); checkpoint=False
+    ignores checkpoint files, for embed functions cheaper than the file.
+    """
+
+    def __init__(self, embed_fn=None, concurrency=4, max_batch_items=100, max_batch_tokens=8000,
+                 max_retries=6, base_delay=1.0, max_delay=60.0, model=EMBEDDING_MODEL, checkpoint=True):
+        self.embed_fn = embed_fn or openai_embed
+        self.model = model
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.max_batch_items = max_batch_items
+        self.max_batch_tokens = max_batch_tokens
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def for_provider(cls, provider, concurrency=4, max_retries=6):
+        """A dispatcher batching for an EmbeddingProvider and recording its space."""
+        return cls(provider.embed, concurrency, provider.batch_size, provider.max_batch_tokens or float('inf'),
+                   max_retries, model=provider.name, checkpoint=provider.remote)
+
+    @staticmethod
+    def batch_key(batch):
+        return hashlib.sha256("\0".join(batch).encode('utf-8')).hexdigest()
+
+    def _embed_with_retry(self, batch):
+        def embed():
+            vectors = self.embed_fn(batch)
+            if len(vectors) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+            return vectors
+
+        start = time.perf_counter()
+        vectors = call_with_retries(embed, max_retries=self.max_retries, base_delay=self.base_delay,
+                                    max_delay=self.max_delay, on_retry=self._count_retry)
+        EMBEDDING_BATCHES.inc()
+        EMBEDDING_SECONDS.observe(time.perf_counter() - start)
+        return vectors
+
+    def _count_retry(self, error):
+        # Retries are counted from every batch thread at once
+        with self.lock:
+            self.retries += 1
+        EMBEDDING_RETRIES.inc()
+
+    def _load_checkpoint(self, checkpoint_file):
+        done = {}
+        if checkpoint_file and os.path.exists(checkpoint_file):
+            with open(checkpoint_file, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn last line from an interrupted write
+                        continue
+                    done[entry['key']] = entry['embeddings']
+        return done
+
+    def embed(self, texts, checkpoint_file=None, on_batch=None):
+        """Embed texts and return the vectors in input order.
+
+        on_batch(batch, vectors) is called once per batch as it completes.
+        """
+        if not self.checkpoint:
+            checkpoint_file = None
+        batches = make_batches(texts, self.max_batch_items, self.max_batch_tokens)
+        done = self._load_checkpoint(checkpoint_file)
+        results = [None] * len(batches)
+        lock = threading.Lock()
+        checkpoint = open(checkpoint_file, 'a', encoding='utf-8') if checkpoint_file else None
+
+        def run(position, batch):
+            key = self.batch_key(batch)
+            if key in done:
+                vectors = done[key]
+            else:
+                vectors = self._embed_with_retry(batch)
+                if checkpoint:
+                    with lock:
+                        checkpoint.write(json.dumps({'key': key, 'embeddings': np.asarray(vectors, dtype=float).tolist()}) + "\n")
+                        checkpoint.flush()
+            if on_batch:
+                on_batch(batch, vectors)
+            results[position] = vectors
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                futures = [executor.submit(run, position, batch) for position, batch in enumerate(batches)]
+                for future in futures:
+                    future.result()
+        finally:
+            if checkpoint:
+                checkpoint.close()
+
+        resumed = sum(self.batch_key(batch) in done for batch in batches)
+        if resumed:
+            print(f"Resumed {resumed} of {len(batches)} embedding batches from {checkpoint_file}")
+
+        return [vector for vectors in results for vector in vectors]
@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+from app.EmbeddingStore import EmbeddingStore
+
+
+def normalize_embeddings(embeddings):
+    """Stack embeddings into a float32 matrix of unit-length rows."""
+    matrix = np.array(np.stack(embeddings), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    matrix /= norms
+    return matrix
+
+
+def batch_semantic_top_k(external_matrix, internal_matrix, k=1, memory_budget_mb=256):
+    """Top-k cosine matches for many external rows against a normalized internal matrix.
+
+    Both matrices must already be normalized. External rows are scored in chunks
+    sized so one chunk's score matrix stays within the memory budget. Returns
+    (indices, scores) arrays of shape (rows, k), best match first.
+    """
+    rows, catalog_size = len(external_matrix), len(internal_matrix)
+    k = min(k, catalog_size)
+    indices = np.empty((rows, k), dtype=np.int64)
+    scores = np.empty((rows, k), dtype=np.float32)
+
+    # Score matrix plus argpartition's index buffer per external row
+    bytes_per_row = catalog_size * (4 + 8)
+    chunk_rows = max(1, int(memory_budget_mb * 1024 * 1024 // max(bytes_per_row, 1)))
+
+    for start in range(0, rows, chunk_rows):
+        end = min(start + chunk_rows, rows)
+        similarities = external_matrix[start:end] @ internal_matrix.T
+
+        if k == 1:
+            # argmax keeps the lowest index on ties, like the per-row matcher
+            top = np.argmax(similarities, axis=1)[:, None]
+        else:
+            top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            top.sort(axis=1)
+            order = np.argsort(-np.take_along_axis(similarities, top, axis=1), axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1)
+
+        indices[start:end] = top
+        scores[start:end] = np.take_along_axis(similarities, top, axis=1)
+
+    return indices, scores
+
+
+class ExactIndex:
+    """Brute-force cosine search over the full internal matrix."""
+    backend = 'exact'
+    # Nothing to build beyond the matrix itself, which the embedding store already holds
+    persisted = False
+
+    def __init__(self, matrix, memory_budget_mb=256):
+        self.matrix = matrix
+        self.memory_budget_mb = memory_budget_mb
+
+    @classmethod
+    def build(cls, matrix, memory_budget_mb=256):
+        return cls(matrix, memory_budget_mb)
+
+    def search(self, queries, k=1):
+        return batch_semantic_top_k(queries, self.matrix, k, self.memory_budget_mb)
+
+
+class IVFIndex:
+    """Inverted-file index: k-means cells over the catalog, searching only the nearest cells.
+
+    Vectors are assigned to the closest of nlist centroids. A query scores the
+    centroids, then only the vectors in its nprobe best cells (more if those hold
+    fewer than k vectors).
+    """
+    backend = 'ivf'
+    persisted = True
+
+    def __init__(self, matrix, centroids, offsets, positions, nprobe=8):
+        self.matrix = matrix
+        self.centroids = centroids
+        self.offsets = offsets
+        self.positions = positions
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, matrix, nlist=None, nprobe=8, iterations=10, sample_size=50000, seed=0):
+        rng = np.random.default_rng(seed)
+        nlist = nlist or max(1, int(4 * np.sqrt(len(matrix))))
+        nlist = min(nlist, len(matrix))
+
+        # Spherical k-means on a sample of the catalog
+        sample = matrix[rng.choice(len(matrix), min(sample_size, len(matrix)), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for cell in range(nlist):
+                members = sample[assignment == cell]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[cell] = centroid / (np.linalg.norm(centroid) or 1)
+
+        assignment = np.concatenate([
+            np.argmax(matrix[start:start + 65536] @ centroids.T, axis=1)
+            for start in range(0, len(matrix), 65536)
+        ])
+        positions = np.argsort(assignment, kind='stable')
+        offsets = np.searchsorted(assignment[positions], np.arange(nlist + 1))
+        return cls(matrix, centroids, offsets, positions, nprobe)
+
+    def search(self, queries, k=1):
+        k = min(k, len(self.matrix))
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        cell_order = np.argsort(-(queries @ self.centroids.T), axis=1, kind='stable')
+
+        for row, query in enumerate(queries):
+            cells = []
+            found = 0
+            for cell in cell_order[row]:
+                if len(cells) >= self.nprobe and found >= k:
+                    break
+                cells.append(self.positions[self.offsets[cell]:self.offsets[cell + 1]])
+                found += len(cells[-1])
+
+            candidates = np.sort(np.concatenate(cells))
+            candidate_indices, candidate_scores = batch_semantic_top_k(query[None, :], self.matrix[candidates], k)
+            indices[row] = candidates[candidate_indices[0]]
+            scores[row] = candidate_scores[0]
+
+        return indices, scores
+
+    def save(self, path, fingerprint):
+        np.savez(path, centroids=self.centroids, offsets=self.offsets, positions=self.positions,
+                 fingerprint=fingerprint)
+
+    @classmethod
+    def load(cls, data, matrix, nprobe=8):
+        return cls(matrix, data['centroids'], data['offsets'], data['positions'], nprobe)
+
+
+INDEX_BACKENDS = {
+    'exact': ExactIndex,
+    'ivf': IVFIndex
+}
+
+
+def index_path(embeddings_file, backend):
+    """Location of the persisted index, next to the embedding store."""
+    return f"{os.path.splitext(embeddings_file)[0]}.{backend}.npz"
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def load_or_build_index(embeddings_file, store=None, backend='exact', **params):
+    """Load the persisted index for an embedding store, rebuilding it if the store changed.
+
+    The index searches the store's memory-mapped matrix; only the backend's own
+    structures (e.g. IVF cells) are persisted.
+    """
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown index backend '{backend}'. Choose one of {sorted(INDEX_BACKENDS)}.")
+    index_class = INDEX_BACKENDS[backend]
+    store = store or EmbeddingStore(embeddings_file)
+    matrix = store.matrix
+    if not index_class.persisted:
+        return index_class.build(matrix, **params)
+
+    path = index_path(store.path, backend)
+    fingerprint = file_fingerprint(store.path)
+    if os.path.exists(path):
+        with np.load(path) as data:
+            if str(data['fingerprint']) == fingerprint:
+                return index_class.load(data, matrix, **params)
+
+    index = index_class.build(matrix, **params)
+    index.save(path, fingerprint)
+    print(f"{backend} index saved to {path}")
+    return index
+
+
+def recall_latency_report(index, queries, k=10, exact=None):
+    """Compare an index's top-k results and query latency against exact search."""
+    exact = exact or ExactIndex(index.matrix)
+
+    start = time.perf_counter()
+    exact_indices, _ = exact.search(queries, k)
+    exact_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indices, _ = index.search(queries, k)
+    index_seconds = time.perf_counter() - start
+
+    hits = sum(len(set(found) & set(expected)) for found, expected in zip(indices, exact_indices))
+    top1 = float(np.mean(indices[:, 0] == exact_indices[:, 0])) if len(queries) else 0.0
+    return {
+        'backend': index.backend,
+        'queries': len(queries),
+        'catalog_size': len(index.matrix),
+        'k': k,
+        f'recall@{k}': round(hits / max(exact_indices.size, 1), 4),
+        'top1_agreement': round(top1, 4),
+        'exact_ms_per_query': round(1000 * exact_seconds / max(len(queries), 1), 4),
+        'index_ms_per_query': round(1000 * index_seconds / max(len(queries), 1), 4)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recall versus latency of an embedding index against exact search.')
+    parser.add_argument('embeddings_file', help='Internal embedding store')
+    parser.add_argument('--queries', help='External embedding store (defaults to a sample of the catalog)')
+    parser.add_argument('--backend', default='ivf', choices=sorted(INDEX_BACKENDS))
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nprobe', type=int, default=8)
+    parser.add_argument('--sample', type=int, default=1000)
+    args = parser.parse_args()
+
+    params = {'nprobe': args.nprobe} if args.backend == 'ivf' else {}
+    index = load_or_build_index(args.embeddings_file, backend=args.backend, **params)
+    if args.queries:
+        queries = EmbeddingStore(args.queries).matrix
+    else:
+        queries = index.matrix
+    queries = queries[np.random.default_rng(0).permutation(len(queries))[:args.sample]]
+    print(json.dumps(recall_latency_report(index, queries, args.k), indent=4))
@@ -0,0 +1,109 @@
+import functools
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+from app.EmbeddingDispatcher import EMBEDDING_MODEL, openai_embed
+
+
+class EmbeddingProvider:
+    """A backend that turns cleaned product names into vectors.
+
+    name identifies the vector space: it keys the embedding cache and is
+    recorded as the embedding store's model, so vectors from different
+    providers, or one provider with different settings, are never mixed.
+    batch_size and max_batch_tokens size the batches the dispatcher sends to
+    embed(); max_batch_tokens is None when only the item count matters.
+    Only remote providers are worth checkpointing: recomputing a local batch
+    is cheaper than writing it out.
+    """
+    name = None
+    batch_size = 100
+    max_batch_tokens = None
+    remote = False
+
+    def embed(self, texts):
+        raise NotImplementedError
+
+
+class OpenAIProvider(EmbeddingProvider):
+    """The OpenAI embeddings API; one network round trip per batch."""
+    remote = True
+
+    def __init__(self, model=EMBEDDING_MODEL, max_batch_tokens=8000):
+        # Stores written before providers existed record the bare model name, so keep using it
+        self.name = model
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens
+
+    def embed(self, texts):
+        return openai_embed(texts, self.model)
+
+
+class HashingProvider(EmbeddingProvider):
+    """Character n-gram feature hashing, projected down to a dense vector. Runs on the CPU, no model files.
+
+    Names are hashed into n_features signed n-gram counts (scikit-learn's
+    HashingVectorizer) and multiplied by a fixed sparse random projection
+    drawn from seed, which roughly preserves the cosine similarity between
+    names. Nothing is fitted to the data, so both catalogs land in the same
+    space however they are chunked.
+    """
+    batch_size = 2000
+
+    def __init__(self, dimensions=256, ngram_range=(3, 4), n_features=2 ** 18, seed=0):
+        self.dimensions = dimensions
+        self.name = f"hashing-char{ngram_range[0]}-{ngram_range[1]}-f{n_features}-d{dimensions}-s{seed}"
+        self.vectorizer = HashingVectorizer(analyzer='char_wb', ngram_range=tuple(ngram_range),
+                                            n_features=n_features, alternate_sign=True, norm='l2')
+        # Each hashed feature feeds a few random output dimensions with random signs
+        rng = np.random.default_rng(seed)
+        per_feature = 4
+        rows = np.repeat(np.arange(n_features), per_feature)
+        columns = rng.integers(0, dimensions, size=n_features * per_feature)
+        signs = rng.choice(np.array([-1.0, 1.0], dtype=np.float32), size=n_features * per_feature)
+        self.projection = sp.csr_matrix((signs, (rows, columns)), shape=(n_features, dimensions), dtype=np.float32)
+
+    def embed(self, texts):
+        features = self.vectorizer.transform(texts).astype(np.float32)
+        return np.asarray((features @ self.projection).todense(), dtype=np.float32)
+
+
+class SentenceTransformerProvider(EmbeddingProvider):
+    """A locally loaded sentence-transformers model; needs the sentence-transformers package."""
+    batch_size = 256
+
+    def __init__(self, model_name='all-MiniLM-L6-v2', device=None):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ValueError("The 'sentence-transformers' embedding provider needs the sentence-transformers "
+                             "package: pip install sentence-transformers")
+        self.name = f"sentence-transformers:{model_name}"
+        self.model = SentenceTransformer(model_name, device=device)
+
+    def embed(self, texts):
+        return self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True,
+                                 convert_to_numpy=True, show_progress_bar=False)
+
+
+PROVIDERS = {
+    'openai': OpenAIProvider,
+    'hashing': HashingProvider,
+    'sentence-transformers': SentenceTransformerProvider
+}
+
+
+@functools.lru_cache(maxsize=None)
+def make_provider(kind='openai', dimensions=256, local_model='all-MiniLM-L6-v2', max_batch_tokens=8000):
+    """The provider for an EMBEDDING_PROVIDER setting, built once per setting.
+
+    Each kind uses only its own options: max_batch_tokens for openai,
+    dimensions for hashing, local_model for sentence-transformers.
+    """
+    if kind == 'openai':
+        return OpenAIProvider(max_batch_tokens=max_batch_tokens)
+    if kind == 'hashing':
+        return HashingProvider(dimensions)
+    if kind == 'sentence-transformers':
+        return SentenceTransformerProvider(local_model)
+    raise ValueError(f"Unknown embedding provider '{kind}'. Choose one of {sorted(PROVIDERS)}.")
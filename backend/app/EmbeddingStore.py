@@ -0,0 +1,199 @@
+import argparse
+import io
+import json
+import os
+import pickle
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from app.EmbeddingDispatcher import EMBEDDING_MODEL
+
+METADATA_COLUMNS = ['original_name', 'cleaned_name', 'size', 'unit', 'manufacturer']
+METADATA_SCHEMA = pa.schema([
+    ('original_name', pa.string()),
+    ('cleaned_name', pa.string()),
+    ('size', pa.float64()),
+    ('unit', pa.string()),
+    ('manufacturer', pa.string())
+])
+STORE_DTYPES = {'float32': np.float32, 'float16': np.float16}
+STORE_FORMAT = 'columnar-v1'
+
+
+def store_paths(path):
+    """Vector matrix, metadata sidecar and manifest of the store at path (the .npy file)."""
+    base = os.path.splitext(path)[0]
+    return f"{base}.npy", f"{base}.parquet", f"{base}.json"
+
+
+def npy_header(dtype, shape):
+    header = {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': shape}
+    buffer = io.BytesIO()
+    np.lib.format.write_array_header_1_0(buffer, header)
+    return buffer.getvalue()
+
+
+class EmbeddingStoreWriter:
+    """Writes an embedding store one chunk at a time.
+
+    Vectors are normalized to unit length and appended to a .npy matrix whose
+    header is rewritten with the final row count on close; the name, size,
+    unit and manufacturer columns go to a Parquet sidecar, one row group per
+    chunk. Everything is written under '.partial' names and the manifest is
+    moved into place last, so readers never see a half-written store.
+    """
+
+    def __init__(self, path, dtype='float32', model=None):
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"Unsupported embedding dtype '{dtype}'. Choose one of {sorted(STORE_DTYPES)}.")
+        self.paths = store_paths(path)
+        self.partial_paths = [f"{p}.partial" for p in self.paths]
+        self.dtype = dtype
+        self.model = model
+        self.rows = 0
+        self.dimensions = None
+        self.vectors = open(self.partial_paths[0], 'wb')
+        self.header_size = len(npy_header(dtype, (0, 0)))
+        self.vectors.write(b"\0" * self.header_size)
+        self.metadata = pq.ParquetWriter(self.partial_paths[1], METADATA_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(commit=exc_type is None)
+
+    def write(self, frame):
+        """Append rows with an 'embedding' column plus the metadata columns."""
+        if not len(frame):
+            return
+        matrix = np.array(np.stack(frame['embedding'].values), dtype=np.float32)
+        if self.dimensions is None:
+            self.dimensions = matrix.shape[1]
+        elif matrix.shape[1] != self.dimensions:
+            raise ValueError(f"Expected {self.dimensions}-dimensional embeddings, got {matrix.shape[1]}.")
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        matrix /= norms
+
+        self.vectors.write(matrix.astype(STORE_DTYPES[self.dtype]).tobytes())
+        metadata = frame[METADATA_COLUMNS].reset_index(drop=True)
+        self.metadata.write_table(pa.Table.from_pandas(metadata, schema=METADATA_SCHEMA, preserve_index=False))
+        self.rows += len(frame)
+
+    def close(self, commit=True):
+        if self.vectors.closed:
+            return
+        header = npy_header(self.dtype, (self.rows, self.dimensions or 0))
+        if len(header) != self.header_size:
+            raise ValueError("Embedding matrix header no longer fits its reserved space.")
+        self.vectors.seek(0)
+        self.vectors.write(header)
+        self.vectors.close()
+        self.metadata.close()
+
+        if not commit:
+            for partial_path in self.partial_paths:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+            return
+
+        with open(self.partial_paths[2], 'w', encoding='utf-8') as f:
+            json.dump({
+                'format': STORE_FORMAT,
+                'rows': self.rows,
+                'dimensions': self.dimensions or 0,
+                'dtype': self.dtype,
+                'normalized': True,
+                'model': self.model,
+                'vectors': os.path.basename(self.paths[0]),
+                'metadata': os.path.basename(self.paths[1])
+            }, f, indent=4)
+        for partial_path, path in zip(self.partial_paths, self.paths):
+            os.replace(partial_path, path)
+
+
+class EmbeddingStore:
+    """Read side of a store: memory-mapped vectors plus the metadata frame."""
+
+    def __init__(self, path):
+        vectors_path, self.metadata_path, manifest_path = store_paths(path)
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"Embedding store manifest not found: {manifest_path}")
+        with open(manifest_path, encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.path = vectors_path
+        self.vectors = np.load(vectors_path, mmap_mode='r')
+        if self.vectors.shape[0] != self.manifest['rows']:
+            raise ValueError(f"{vectors_path} holds {self.vectors.shape[0]} rows, the manifest says {self.manifest['rows']}.")
+        self._frame = None
+
+    def __len__(self):
+        return self.manifest['rows']
+
+    @property
+    def matrix(self):
+        """Unit-length float32 rows; zero-copy for float32 stores."""
+        if self.vectors.dtype == np.float32:
+            return self.vectors
+        return np.asarray(self.vectors, dtype=np.float32)
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            self._frame = pd.read_parquet(self.metadata_path)
+        return self._frame
+
+
+def check_same_space(first, second):
+    """Raise ValueError unless two stores hold vectors from the same embedding space.
+
+    Dimensions must agree, and so must the models when both stores record one;
+    stores converted from old pickles may not.
+    """
+    first_model, second_model = first.manifest.get('model'), second.manifest.get('model')
+    if first_model and second_model and first_model != second_model:
+        raise ValueError(f"{os.path.basename(first.path)} was embedded with '{first_model}' but "
+                         f"{os.path.basename(second.path)} with '{second_model}'.")
+    if first.manifest['dimensions'] != second.manifest['dimensions']:
+        raise ValueError(f"{os.path.basename(first.path)} has {first.manifest['dimensions']}-dimensional embeddings "
+                         f"but {os.path.basename(second.path)} has {second.manifest['dimensions']}.")
+
+
+def read_embeddings(path):
+    """Load a store as one DataFrame with an 'embedding' column, as the old pickles held."""
+    store = EmbeddingStore(path)
+    frame = store.frame.copy()
+    frame['embedding'] = list(store.matrix)
+    return frame
+
+
+def convert_pickle(pickle_file, path=None, dtype='float32', chunk_size=50000):
+    """Rewrite a pickled DataFrame-of-lists embeddings file as a columnar store.
+
+    Accepts both a single DataFrame.to_pickle file and the chunked pickle
+    stream /preprocess used to write. Only convert files you produced
+    yourself: unpickling runs arbitrary code. The pickles predate local
+    providers, so the vectors are recorded as OpenAI embeddings.
+    """
+    path = path or store_paths(pickle_file)[0]
+    with open(pickle_file, 'rb') as f, EmbeddingStoreWriter(path, dtype, EMBEDDING_MODEL) as writer:
+        while True:
+            try:
+                frame = pickle.load(f)
+            except EOFError:
+                break
+            for start in range(0, len(frame), chunk_size):
+                writer.write(frame.iloc[start:start + chunk_size])
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert pickled embeddings files to the columnar store.')
+    parser.add_argument('pickle_files', nargs='+')
+    parser.add_argument('--dtype', default='float32', choices=sorted(STORE_DTYPES))
+    args = parser.parse_args()
+
+    for pickle_file in args.pickle_files:
+        print(f"{pickle_file} -> {convert_pickle(pickle_file, dtype=args.dtype)}")
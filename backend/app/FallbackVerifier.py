@@ -0,0 +1,162 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from app.EmbeddingDispatcher import call_with_retries
+from app.Metrics import FALLBACK_CACHE_HITS, FALLBACK_CALLS, FALLBACK_SECONDS
+
+# "3: Yes", "3. no", "3) YES" ... one verdict per line of a packed answer
+PACKED_VERDICT = re.compile(r"^\s*(\d+)\s*[:.)-]\s*(yes|no)\b", re.IGNORECASE | re.MULTILINE)
+
+
+def normalize_name(name):
+    return " ".join(str(name).lower().split())
+
+
+def pair_key(external_name, internal_name, prompt_version):
+    text = f"{prompt_version}\0{normalize_name(external_name)}\0{normalize_name(internal_name)}"
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def parse_packed_verdicts(content, count):
+    """Read numbered Yes/No answers; pairs without a clear answer come back as None."""
+    verdicts = [None] * count
+    for number, answer in PACKED_VERDICT.findall(content):
+        number = int(number)
+        if 1 <= number <= count:
+            verdicts[number - 1] = answer.lower() == 'yes'
+    return verdicts
+
+
+class VerdictCache:
+    """Persistent LLM verdicts keyed by normalized (external, internal) pair and prompt version."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # Concurrent runs write the same cache; wait for each other's write locks
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, verdict INTEGER NOT NULL, created REAL NOT NULL)"
+        )
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(keys)
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for key, verdict in self.connection.execute(
+                        f"SELECT key, verdict FROM verdicts WHERE key IN ({placeholders})", batch):
+                    found[key] = bool(verdict)
+        return found
+
+    def put_many(self, verdicts):
+        now = time.time()
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO verdicts (key, verdict, created) VALUES (?, ?, ?)",
+                [(key, int(verdict), now) for key, verdict in verdicts.items()]
+            )
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class FallbackVerifier:
+    """Verifies (external, internal) candidate pairs with the LLM, cached and in parallel.
+
+    verify_fn(external, internal) checks one pair; verify_many_fn(pairs), when
+    given and pack_size > 1, checks several pairs in one prompt and returns a
+    verdict per pair (None when the answer could not be read, which falls back
+    to a single-pair call). Repeated pairs are sent once, and cached verdicts
+    are not sent at all.
+    """
+
+    def __init__(self, verify_fn, verify_many_fn=None, prompt_version='', cache=None,
+                 concurrency=8, pack_size=1, max_retries=6):
+        self.verify_fn = verify_fn
+        self.verify_many_fn = verify_many_fn
+        self.prompt_version = prompt_version
+        self.cache = cache
+        self.concurrency = concurrency
+        self.pack_size = pack_size if verify_many_fn else 1
+        self.max_retries = max_retries
+        self.calls = 0
+        self.cache_hits = 0
+        self.lock = threading.Lock()
+
+    def _call(self, fn, *args):
+        """One fallback request, retried, counted and timed."""
+        with self.lock:
+            self.calls += 1
+        FALLBACK_CALLS.inc()
+        start = time.perf_counter()
+        try:
+            return call_with_retries(fn, *args, max_retries=self.max_retries)
+        finally:
+            FALLBACK_SECONDS.observe(time.perf_counter() - start)
+
+    def _verify_one(self, pair):
+        return self._call(self.verify_fn, *pair)
+
+    def _verify_group(self, group):
+        if len(group) == 1:
+            key, pair = group[0]
+            return {key: self._verify_one(pair)}
+
+        answers = self._call(self.verify_many_fn, [pair for _, pair in group])
+        return {
+            key: answer if answer is not None else self._verify_one(pair)
+            for (key, pair), answer in zip(group, answers)
+        }
+
+    def verify_pairs(self, pairs, on_progress=None):
+        """Return one boolean verdict per (external_name, internal_name) pair, in order.
+
+        on_progress(count) is called with the number of input pairs settled by
+        the cache and then by each finished call.
+        """
+        keys = [pair_key(external, internal, self.prompt_version) for external, internal in pairs]
+        key_counts = Counter(keys)
+        verdicts = self.cache.get_many(set(keys)) if self.cache is not None else {}
+        self.cache_hits += len(verdicts)
+        FALLBACK_CACHE_HITS.inc(len(verdicts))
+        if on_progress and verdicts:
+            on_progress(sum(key_counts[key] for key in verdicts))
+
+        pending = {}
+        for key, pair in zip(keys, pairs):
+            if key not in verdicts:
+                pending.setdefault(key, pair)
+        pending = list(pending.items())
+        groups = [pending[i:i + self.pack_size] for i in range(0, len(pending), self.pack_size)]
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [executor.submit(self._verify_group, group) for group in groups]
+            for future in as_completed(futures):
+                result = future.result()
+                verdicts.update(result)
+                if self.cache is not None:
+                    self.cache.put_many(result)
+                if on_progress:
+                    on_progress(sum(key_counts[key] for key in result))
+
+        return [verdicts[key] for key in keys]
+
+    def stats(self):
+        return {'llm_calls': self.calls, 'cache_hits': self.cache_hits}
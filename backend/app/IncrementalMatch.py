@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from app.Blocking import CandidateIndex, RuleFields, SIZE_TOLERANCE
+from app.EmbeddingIndex import ExactIndex, batch_semantic_top_k, normalize_embeddings
+from app.EmbeddingStore import METADATA_COLUMNS
+from app.Metrics import stage_timer
+from app.mapper import MATCH_BATCH_ROWS, fields_match, iter_match_batches
+
+# Bump whenever the matching rules change, so results stored by older code are not carried forward
+MATCH_STATE_VERSION = 2
+
+# Slack when comparing scores computed in different batches
+SCORE_TOLERANCE = 1e-6
+
+
+def row_hashes(frame, matrix):
+    """Content hash per row over everything matching reads: names, size, unit, manufacturer and embedding."""
+    columns = [frame[column].tolist() for column in METADATA_COLUMNS]
+    hashes = []
+    for position, values in enumerate(zip(*columns)):
+        digest = hashlib.blake2b("\0".join(map(str, values)).encode('utf-8'), digest_size=16)
+        digest.update(np.ascontiguousarray(matrix[position], dtype=np.float32).tobytes())
+        hashes.append(digest.hexdigest())
+    return hashes
+
+
+def could_rule_match(frame, probe):
+    """Mask of frame rows passing rule_based_match's size and manufacturer checks against some probe row.
+
+    A cheap vectorized superset of the rows that can rule-match any probe row,
+    used to index only the relevant slice of a catalog.
+    """
+    sizes = pd.to_numeric(frame['size'], errors='coerce').to_numpy(dtype=float)
+    probe_sizes = pd.to_numeric(probe['size'], errors='coerce').to_numpy(dtype=float)
+    probe_sizes = np.sort(probe_sizes[np.isfinite(probe_sizes) & (probe_sizes != 0)])
+    if not len(probe_sizes):
+        return np.zeros(len(frame), dtype=bool)
+
+    slack = SIZE_TOLERANCE + 1e-9
+    nearest = np.searchsorted(probe_sizes, sizes - slack)
+    size_ok = np.isfinite(sizes) & (sizes != 0) & (nearest < len(probe_sizes))
+    size_ok[size_ok] = probe_sizes[nearest[size_ok]] <= sizes[size_ok] + slack
+
+    if probe['manufacturer'].isna().any():
+        return size_ok
+    manufacturer_ok = frame['manufacturer'].isna() | frame['manufacturer'].isin(set(probe['manufacturer']))
+    return size_ok & manufacturer_ok.to_numpy()
+
+
+class MatchState:
+    """What one /match run needs to carry its results into the next.
+
+    For every distinct external row hash: the output record, the hashes of the
+    internal rows it rule-matched and scored best against, and that score.
+    Plus the internal catalog's row hashes in order. Saved as two Parquet
+    files; the settings the results depend on go in the schema metadata.
+    """
+
+    def __init__(self, settings, internal_hashes, entries):
+        self.settings = settings
+        self.internal_hashes = internal_hashes
+        self.entries = entries
+
+    @staticmethod
+    def internal_path(path):
+        return f"{os.path.splitext(path)[0]}.internal.parquet"
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path) or not os.path.exists(cls.internal_path(path)):
+            return None
+        table = pq.read_table(path)
+        settings = json.loads(table.schema.metadata[b'settings'])
+        columns = table.to_pydict()
+        entries = {
+            external_hash: (record, rule_hash, best_hash, best_score)
+            for external_hash, record, rule_hash, best_hash, best_score in zip(
+                columns['external_hash'], columns['record'], columns['rule_hash'],
+                columns['best_hash'], columns['best_score'])
+        }
+        internal_hashes = pq.read_table(cls.internal_path(path)).column('hash').to_pylist()
+        return cls(settings, internal_hashes, entries)
+
+    def save(self, path):
+        hashes = list(self.entries)
+        records, rule_hashes, best_hashes, best_scores = zip(*self.entries.values()) if hashes else ([], [], [], [])
+        table = pa.table({
+            'external_hash': pa.array(hashes, pa.string()),
+            'record': pa.array(records, pa.string()),
+            'rule_hash': pa.array(rule_hashes, pa.string()),
+            'best_hash': pa.array(best_hashes, pa.string()),
+            'best_score': pa.array(best_scores, pa.float64())
+        }).replace_schema_metadata({'settings': json.dumps(self.settings)})
+        internal_path = self.internal_path(path)
+        pq.write_table(pa.table({'hash': pa.array(self.internal_hashes, pa.string())}), f"{internal_path}.partial")
+        pq.write_table(table, f"{path}.partial")
+        os.replace(f"{internal_path}.partial", internal_path)
+        os.replace(f"{path}.partial", path)
+
+
+def first_seen_order(hashes, keep):
+    return [h for h in dict.fromkeys(hashes) if h in keep]
+
+
+def affected_rows(external, external_vectors, external_hashes, internal, internal_matrix, internal_hashes, previous):
+    """Positions of external rows whose result may differ from the previous run.
+
+    That is rows that are new or changed, rows whose rule match or best
+    semantic match left the catalog, and rows an added internal row could now
+    rule-match or outscore.
+    """
+    old_internal = set(previous.internal_hashes)
+    new_internal = set(internal_hashes)
+    gone = old_internal - new_internal
+    added = [position for position, h in enumerate(internal_hashes) if h not in old_internal]
+
+    affected = set()
+    carried = []
+    for position, h in enumerate(external_hashes):
+        entry = previous.entries.get(h)
+        if entry is None or entry[1] in gone or entry[2] in gone:
+            affected.add(position)
+        else:
+            carried.append(position)
+    if not added or not carried:
+        return sorted(affected), len(added), len(gone)
+
+    # Could an added row outscore the previous best semantic match?
+    semantic_rows = [position for position in carried if previous.entries[external_hashes[position]][1] is None]
+    if semantic_rows:
+        _, top_scores = batch_semantic_top_k(np.asarray(external_vectors[semantic_rows], dtype=np.float32),
+                                             np.asarray(internal_matrix[added], dtype=np.float32), k=1)
+        for position, score in zip(semantic_rows, top_scores[:, 0]):
+            best_score = previous.entries[external_hashes[position]][3]
+            if best_score is None or score >= best_score - SCORE_TOLERANCE:
+                affected.add(position)
+
+    # Could an added row rule-match? Probe an index over the plausible carried rows with each added row
+    added_frame = internal.iloc[added]
+    carried_frame = external.iloc[carried]
+    plausible = np.asarray(carried)[could_rule_match(carried_frame, added_frame)]
+    if len(plausible):
+        external_index = CandidateIndex(external.iloc[plausible], positions=plausible)
+        for fields in RuleFields(added_frame):
+            for position in external_index.candidates_for(*fields):
+                if position not in affected and fields_match(*external_index.records[position], *fields):
+                    affected.add(position)
+
+    return sorted(affected), len(added), len(gone)
+
+
+def carry_forward(previous, external_hashes, entries, start, end):
+    """The previous records of unaffected rows start to end - 1, keeping their state entries."""
+    records = []
+    for h in external_hashes[start:end]:
+        entries.setdefault(h, previous.entries[h])
+        records.append(json.loads(previous.entries[h][0]))
+    return records
+
+
+def run_incremental_matching(external, internal, external_vectors, internal_matrix, state_file, settings,
+                             threshold=0.8, stats=None, index=None, verifier=None, progress=None, workers=1,
+                             candidate_index=None, internal_hashes=None):
+    """run_matching_pipeline that re-matches only rows affected since the run saved in state_file; see
+    iter_incremental_matching."""
+    matches = [record for batch in iter_incremental_matching(
+        external, internal, external_vectors, internal_matrix, state_file, settings, threshold, stats, index,
+        verifier, progress, workers, candidate_index, internal_hashes
+    ) for record in batch]
+    return pd.DataFrame(matches)
+
+
+def iter_incremental_matching(external, internal, external_vectors, internal_matrix, state_file, settings,
+                              threshold=0.8, stats=None, index=None, verifier=None, progress=None, workers=1,
+                              candidate_index=None, internal_hashes=None, batch_size=MATCH_BATCH_ROWS):
+    """iter_matching_pipeline that re-matches only rows affected since the run saved in state_file.
+
+    Everything else is carried forward from the previous results. A full run
+    happens when there is no usable state: none saved yet, different settings
+    (rules version, threshold, prompt, index), or retained internal rows in a
+    new order, which could change which rule match comes first.
+
+    candidate_index and internal_hashes may be passed in when the internal
+    catalog's are already built, e.g. kept in a CatalogCache; without an
+    index, an ExactIndex over internal_matrix is used. Batches come
+    in external row order, carried-forward rows included; the new state is
+    saved once the last one has been consumed.
+    """
+    settings = {**settings, 'version': MATCH_STATE_VERSION, 'threshold': threshold}
+    if index is None:
+        index = ExactIndex(normalize_embeddings(internal_matrix))
+    timings = stats.setdefault('timings', {}) if stats is not None else {}
+    if progress:
+        progress.stage('diff', len(external) + len(internal))
+    with stage_timer('diff', len(external) + len(internal), timings):
+        external_hashes = row_hashes(external, external_vectors)
+        if internal_hashes is None:
+            internal_hashes = row_hashes(internal, internal_matrix)
+
+        previous = MatchState.load(state_file)
+        reason = None
+        if previous is None:
+            reason = 'no previous run'
+        elif previous.settings != settings:
+            reason = 'settings changed'
+        else:
+            retained = set(previous.internal_hashes) & set(internal_hashes)
+            if first_seen_order(previous.internal_hashes, retained) != first_seen_order(internal_hashes, retained):
+                reason = 'internal catalog reordered'
+
+        if reason:
+            rows, internal_added, internal_removed = list(range(len(external))), None, None
+        else:
+            rows, internal_added, internal_removed = affected_rows(
+                external, external_vectors, external_hashes, internal, internal_matrix, internal_hashes, previous)
+            if candidate_index is None:
+                # Only internal rows that can rule-match one of the affected rows need indexing
+                positions = np.flatnonzero(could_rule_match(internal, external.iloc[rows]))
+                candidate_index = CandidateIndex(internal.iloc[positions], positions=positions)
+    if progress:
+        progress.advance(len(external) + len(internal))
+
+    entries = {}
+    emitted = rematched = 0
+    for records, rule_matches, best_matches in iter_match_batches(
+            external.iloc[rows], internal, threshold, stats, index=index, verifier=verifier,
+            external_vectors=np.asarray(external_vectors[rows], dtype=np.float32) if rows else None,
+            progress=progress, workers=workers, candidate_index=candidate_index, batch_size=batch_size):
+        matches = []
+        for i, (position, record) in enumerate(zip(rows[rematched:], records)):
+            matches.extend(carry_forward(previous, external_hashes, entries, emitted, position))
+            rule_hash = internal_hashes[rule_matches[i]] if rule_matches[i] is not None else None
+            best_index, best_score = best_matches.get(i, (None, None))
+            entries[external_hashes[position]] = (
+                json.dumps(record), rule_hash,
+                internal_hashes[best_index] if best_index is not None else None, best_score
+            )
+            matches.append(record)
+            emitted = position + 1
+        rematched += len(records)
+        yield matches
+    matches = carry_forward(previous, external_hashes, entries, emitted, len(external))
+    if matches:
+        yield matches
+
+    MatchState(settings, internal_hashes, entries).save(state_file)
+    if stats is not None:
+        stats['incremental'] = {
+            'full_run_reason': reason,
+            'external_rows': len(external),
+            'rematched': len(rows),
+            'carried_forward': len(external) - len(rows),
+            'internal_added': internal_added,
+            'internal_removed': internal_removed
+        }
@@ -0,0 +1,167 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from app.Metrics import JOB_SECONDS, JOBS, profile_call
+
+FINISHED_STATUSES = {'succeeded', 'failed'}
+
+
+class JobProgress:
+    """Progress handle a running job reports through.
+
+    A job moves through named stages; within a stage it advances a row count
+    towards an optional total. A stage entered again, as when matching runs
+    batch by batch, adds to its earlier timing. Updates are written to the queue at most every
+    flush_interval seconds, so reporting per row stays cheap.
+    """
+
+    def __init__(self, queue, job_id, flush_interval=0.5):
+        self.queue = queue
+        self.job_id = job_id
+        self.flush_interval = flush_interval
+        self.stage_name = None
+        self.stage_started = None
+        self.stage_timings = {}
+        self.rows_processed = 0
+        self.rows_total = None
+        self.last_flush = 0.0
+
+    def stage(self, name, total=None):
+        """Start a new stage, closing the timing of the previous one."""
+        self._close_stage()
+        self.stage_name = name
+        self.stage_started = time.time()
+        self.rows_processed = 0
+        self.rows_total = total
+        self.flush(force=True)
+
+    def advance(self, rows=1):
+        self.rows_processed += rows
+        self.flush()
+
+    def _close_stage(self):
+        if self.stage_name is not None:
+            elapsed = time.time() - self.stage_started
+            self.stage_timings[self.stage_name] = round(self.stage_timings.get(self.stage_name, 0) + elapsed, 3)
+
+    def finish(self):
+        self._close_stage()
+        self.flush(force=True)
+
+    def flush(self, force=False):
+        now = time.perf_counter()
+        if not force and now - self.last_flush < self.flush_interval:
+            return
+        self.last_flush = now
+        self.queue.update(
+            self.job_id,
+            stage=self.stage_name,
+            stage_started=self.stage_started,
+            rows_processed=self.rows_processed,
+            rows_total=self.rows_total,
+            stage_timings=json.dumps(self.stage_timings)
+        )
+
+
+class JobQueue:
+    """Runs jobs on a local thread pool and keeps their state in SQLite.
+
+    submit(kind, fn, *args) records a queued job and returns its id at once;
+    a worker later calls fn(progress, *args) and stores whatever JSON-ready
+    result it returns, or the error it raised. Jobs left queued or running by
+    a previous process are marked failed on startup. submit(..., profile=True)
+    runs the job under cProfile (see profile_call), saving profile_<id>.prof
+    in profile_dir, and adds a 'profile' entry with the file and a summary to
+    its result.
+    """
+
+    def __init__(self, path, workers=1, profile_dir=None):
+        self.path = path
+        self.profile_dir = profile_dir or os.path.dirname(os.path.abspath(path))
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, created REAL NOT NULL, "
+            "started REAL, finished REAL, stage TEXT, stage_started REAL, rows_processed INTEGER, "
+            "rows_total INTEGER, stage_timings TEXT, result TEXT, error TEXT)"
+        )
+        self.connection.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Interrupted by a server restart', finished = ? "
+            "WHERE status IN ('queued', 'running')", (time.time(),)
+        )
+        self.connection.commit()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+
+    def submit(self, kind, fn, *args, profile=False):
+        job_id = uuid.uuid4().hex
+        profile_file = os.path.join(self.profile_dir, f"profile_{job_id}.prof") if profile else None
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO jobs (id, kind, status, created, rows_processed, stage_timings) VALUES (?, ?, 'queued', ?, 0, '{}')",
+                (job_id, kind, time.time())
+            )
+            self.connection.commit()
+        self.executor.submit(self._run, job_id, kind, fn, args, profile_file)
+        return job_id
+
+    def _run(self, job_id, kind, fn, args, profile_file=None):
+        started = time.time()
+        self.update(job_id, status='running', started=started)
+        progress = JobProgress(self, job_id)
+        try:
+            if profile_file:
+                result, summary = profile_call(profile_file, fn, progress, *args)
+                result = {**result, 'profile': {'file': profile_file, 'summary': summary}}
+            else:
+                result = fn(progress, *args)
+        except Exception as e:
+            traceback.print_exc()
+            progress.finish()
+            self.update(job_id, status='failed', finished=time.time(), error=str(e))
+            status = 'failed'
+        else:
+            progress.finish()
+            self.update(job_id, status='succeeded', finished=time.time(), result=json.dumps(result))
+            status = 'succeeded'
+        JOBS.inc(kind=kind, status=status)
+        JOB_SECONDS.observe(time.time() - started, kind=kind)
+
+    def update(self, job_id, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self.lock:
+            self.connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self.connection.commit()
+
+    def get(self, job_id):
+        """The job's state as a dict, with elapsed time and the current stage's ETA, or None."""
+        with self.lock:
+            cursor = self.connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            columns = [description[0] for description in cursor.description]
+        if row is None:
+            return None
+
+        job = dict(zip(columns, row))
+        job['stage_timings'] = json.loads(job['stage_timings'] or '{}')
+        job['result'] = json.loads(job['result']) if job['result'] else None
+
+        now = time.time()
+        job['elapsed_seconds'] = round((job['finished'] or now) - job['started'], 3) if job['started'] else None
+        job['eta_seconds'] = None
+        if job['status'] == 'running' and job['rows_total'] and job['rows_processed']:
+            stage_elapsed = now - job['stage_started']
+            remaining = max(job['rows_total'] - job['rows_processed'], 0)
+            job['eta_seconds'] = round(stage_elapsed / job['rows_processed'] * remaining, 1)
+        return job
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            self.connection.close()
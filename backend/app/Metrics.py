@@ -0,0 +1,195 @@
+import cProfile
+import io
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+# Upper bounds in seconds for latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# Upper bounds for blocking candidates per external row
+CANDIDATE_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+
+def label_text(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label combination."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Unlabelled counters report 0 before their first event
+        self.values = {} if self.labelnames else {(): 0}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, label_text(self.labelnames, key), value) for key, value in sorted(self.values.items())]
+
+
+class Histogram:
+    """Observations counted into cumulative buckets, plus their sum and count."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {} if self.labelnames else {(): ([0] * (len(self.buckets) + 1), 0.0, 0)}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        self.observe_many([value], **labels)
+
+    def observe_many(self, values, **labels):
+        """Record a batch of observations under one lock, e.g. a count per row."""
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        values = np.asarray(values, dtype=float)
+        bucket_counts = np.bincount(np.searchsorted(self.buckets, values, side='left'), minlength=len(self.buckets) + 1)
+        with self.lock:
+            counts, total, count = self.series.get(key, ([0] * (len(self.buckets) + 1), 0.0, 0))
+            counts = [a + int(b) for a, b in zip(counts, bucket_counts)]
+            self.series[key] = (counts, total + float(values.sum()), count + len(values))
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else format_value(float(bound))
+                    samples.append((f"{self.name}_bucket", label_text(self.labelnames, key, [('le', le)]), cumulative))
+                samples.append((f"{self.name}_sum", label_text(self.labelnames, key), total))
+                samples.append((f"{self.name}_count", label_text(self.labelnames, key), count))
+        return samples
+
+
+class MetricsRegistry:
+    """Process-wide metrics, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric):
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'smartmapper_stage_seconds', 'Wall time of each pipeline stage.', ['stage'])
+STAGE_ROWS = REGISTRY.counter(
+    'smartmapper_stage_rows_total', 'Rows processed by each pipeline stage.', ['stage'])
+CANDIDATES_PER_ROW = REGISTRY.histogram(
+    'smartmapper_blocking_candidates_per_row', 'Internal rows the rule pass scored per external row.',
+    buckets=CANDIDATE_BUCKETS)
+MATCHES = REGISTRY.counter(
+    'smartmapper_matches_total', 'External rows matched, by method.', ['method'])
+FALLBACK_CALLS = REGISTRY.counter(
+    'smartmapper_fallback_calls_total', 'LLM fallback requests sent.')
+FALLBACK_SECONDS = REGISTRY.histogram(
+    'smartmapper_fallback_call_seconds', 'LLM fallback request latency, retries included.')
+FALLBACK_CACHE_HITS = REGISTRY.counter(
+    'smartmapper_fallback_cache_hits_total', 'Fallback verdicts served from the verdict cache.')
+EMBEDDING_BATCHES = REGISTRY.counter(
+    'smartmapper_embedding_batches_total', 'Embedding API batches completed.')
+EMBEDDING_SECONDS = REGISTRY.histogram(
+    'smartmapper_embedding_batch_seconds', 'Embedding API batch latency, retries included.')
+EMBEDDING_RETRIES = REGISTRY.counter(
+    'smartmapper_embedding_retries_total', 'Embedding API calls retried.')
+EMBEDDING_CACHE = REGISTRY.counter(
+    'smartmapper_embedding_cache_lookups_total', 'Distinct names looked up in the embedding cache.', ['result'])
+CATALOG_CACHE = REGISTRY.counter(
+    'smartmapper_catalog_cache_total', 'Internal catalog cache hits, misses and evictions.', ['result'])
+JOBS = REGISTRY.counter(
+    'smartmapper_jobs_total', 'Background jobs finished, by kind and status.', ['kind', 'status'])
+JOB_SECONDS = REGISTRY.histogram(
+    'smartmapper_job_seconds', 'Background job run time.', ['kind'])
+
+
+@contextmanager
+def stage_timer(stage, rows=0, timings=None):
+    """Time a block as a pipeline stage, counting rows through it.
+
+    The duration goes to smartmapper_stage_seconds and, when a timings dict is
+    given, is added to timings[stage] for the run's own summary.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        if rows:
+            STAGE_ROWS.inc(rows, stage=stage)
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0) + seconds, 3)
+
+
+# Only one cProfile profiler can be active at a time (Python 3.12+ refuses a second one)
+PROFILE_LOCK = threading.Lock()
+
+
+def profile_call(profile_file, fn, *args, top=25):
+    """Run fn(*args) under cProfile, save the stats to profile_file and return (result, summary).
+
+    The summary is the top functions by cumulative time. Profiled calls run
+    one at a time, each waiting for the one before to finish. Before Python
+    3.12 only the calling thread is profiled, and work in thread pools or
+    worker processes shows up as the time spent waiting on them. From 3.12
+    the profiler sees every thread, so other jobs running meanwhile show up
+    too.
+    """
+    with PROFILE_LOCK:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            result = fn(*args)
+        finally:
+            profiler.disable()
+            profiler.dump_stats(profile_file)
+    buffer = io.StringIO()
+    pstats.Stats(profiler, stream=buffer).sort_stats('cumulative').print_stats(top)
+    return result, buffer.getvalue()
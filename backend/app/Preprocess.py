@@ -1,8 +1,17 @@
 import pandas as pd
+import numpy as np
 import re
+import sys
+import json
+import time
+import resource
+import functools
 import openai
 from dotenv import load_dotenv
 import os
+from app.EmbeddingDispatcher import EmbeddingDispatcher
+from app.EmbeddingStore import EmbeddingStoreWriter
+from app.Metrics import EMBEDDING_CACHE, stage_timer
 
 # Load environment variables from .env file
 load_dotenv()
@@ -11,8 +20,15 @@ load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
 
-def compute_and_save_embeddings(df, original_name_column, cleaned_name_column, output_file):
-    """Compute embeddings for all rows and save them with relevant metadata."""
+def compute_embeddings(df, original_name_column, cleaned_name_column, cache=None, dispatcher=None, checkpoint_file=None):
+    """Return the rows with a usable cleaned name plus an 'embedding' column, and cache stats.
+
+    When an EmbeddingCache is given, only names missing from it are sent to the
+    API. Batches go through the dispatcher (concurrent, retried, and
+    checkpointed when checkpoint_file is set), which defaults to OpenAI; the
+    cache is keyed by its model. The hit and miss counts are over the distinct
+    names.
+    """
     # Ensure required columns exist
     if original_name_column not in df.columns or cleaned_name_column not in df.columns:
         raise ValueError(f"Columns '{original_name_column}' or '{cleaned_name_column}' not found in DataFrame.")
@@ -22,22 +38,267 @@ def compute_and_save_embeddings(df, original_name_column, cleaned_name_column, o
     
     # Extract text for embedding
     texts = df[cleaned_name_column].astype(str).tolist()
+    unique_texts = list(dict.fromkeys(texts))
+    dispatcher = dispatcher or EmbeddingDispatcher()
+    cached = cache.get_many(dispatcher.model, unique_texts) if cache is not None else {}
+    missing = [text for text in unique_texts if text not in cached]
+    EMBEDDING_CACHE.inc(len(cached), result='hit')
+    EMBEDDING_CACHE.inc(len(missing), result='miss')
     
     # Batch API calls to handle large datasets
-    batch_size = 100
-    embeddings = []
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i+batch_size]
-        response = openai.Embedding.create(model="text-embedding-ada-002", input=batch)
-        embeddings.extend([data['embedding'] for data in response['data']])
+
+    def on_batch(batch, vectors):
+        # Cache each batch as it lands so an interrupted run keeps its progress
+        if cache is not None:
+            cache.put_many(dispatcher.model, dict(zip(batch, vectors)))
+
+    computed = dict(zip(missing, dispatcher.embed(missing, checkpoint_file, on_batch)))
     
+    embeddings = {**{text: list(map(float, vector)) for text, vector in cached.items()}, **computed}
+    df['embedding'] = [embeddings[text] for text in texts]
+
+    return df, {
+        'rows': len(texts),
+        'cache_hits': len(cached),
+        'cache_misses': len(missing)
+    }
+
+
+def compute_and_save_embeddings(df, original_name_column, cleaned_name_column, output_file, cache=None, dispatcher=None,
+                                dtype='float32'):
+    """Compute embeddings for all rows and save them with relevant metadata.
+
+    See compute_embeddings; the dispatcher checkpoints next to output_file,
+    and the result is written as an embedding store (see EmbeddingStore).
+    Returns the cache hit and miss counts.
+    """
+    checkpoint_file = f"{output_file}.checkpoint.jsonl"
+    dispatcher = dispatcher or EmbeddingDispatcher()
+    with stage_timer('compute_embeddings', len(df)):
+        df, stats = compute_embeddings(df, original_name_column, cleaned_name_column, cache, dispatcher, checkpoint_file)
+
     # Save embeddings along with metadata
-    df['embedding'] = embeddings
-    df[['original_name', 'cleaned_name', 'size', 'unit', 'manufacturer', 'embedding']].to_pickle(output_file)
-    print(f"Embeddings saved to {output_file}")
+    with stage_timer('write', len(df)), EmbeddingStoreWriter(output_file, dtype, dispatcher.model) as store:
+        store.write(df)
+    print(f"Embeddings saved to {output_file} ({stats['cache_hits']} cached, {stats['cache_misses']} embedded)")
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    return stats
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def count_csv_rows(path):
+    """Data rows in a CSV by counting line breaks; an estimate when names hold newlines."""
+    lines = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            lines += block.count(b"\n")
+            last = block
+    if lines and not last.endswith(b"\n"):
+        lines += 1
+    return max(lines - 1, 0)
+
+
+def preprocess_file(input_file, name_column, processed_file, embeddings_file, chunk_size=50000, cache=None, dispatcher=None,
+                    dtype='float32', progress=None, dedupe=False):
+    """Preprocess and embed a catalog CSV chunk by chunk.
+
+    Every chunk of chunk_size rows goes through preprocess_data and
+    compute_embeddings and is appended to processed_file and to the embedding
+    store, so memory stays bounded by the chunk size rather than the catalog.
+    A chunk_size of 0 reads the whole file as one chunk. input_file may also
+    be a readable text stream, such as an upload still arriving. With dedupe,
+    rows whose name exactly repeats an earlier row's are dropped first.
+    progress.advance(rows) is called after every chunk when a JobProgress is
+    given. Returns row counts, cache hits and misses, duplicates dropped,
+    throughput, and seconds spent per stage.
+    """
+    start = time.perf_counter()
+    dispatcher = dispatcher or EmbeddingDispatcher()
+    stats = {'rows': 0, 'cache_hits': 0, 'cache_misses': 0, 'duplicates': 0, 'chunks': 0, 'timings': {}}
+    # 64-bit hashes of the names seen so far, which stay small next to the names themselves
+    seen_names = set()
+    checkpoint_file = f"{embeddings_file}.checkpoint.jsonl"
+    partial_processed_file = f"{processed_file}.partial"
+
+    try:
+        with pd.read_csv(input_file, chunksize=chunk_size or None, iterator=True) as reader, \
+                EmbeddingStoreWriter(embeddings_file, dtype, dispatcher.model) as store:
+            for chunk in reader:
+                if dedupe:
+                    chunk = drop_duplicate_names(chunk, name_column, seen_names, stats)
+                with stage_timer('preprocess_data', len(chunk), stats['timings']):
+                    processed = preprocess_data(chunk, name_column)
+                with stage_timer('write', len(processed), stats['timings']):
+                    processed.to_csv(partial_processed_file, mode='w' if stats['chunks'] == 0 else 'a',
+                                     header=stats['chunks'] == 0, index=False)
+
+                with stage_timer('compute_embeddings', len(processed), stats['timings']):
+                    embedded, chunk_stats = compute_embeddings(processed, 'original_name', 'cleaned_name', cache,
+                                                               dispatcher, checkpoint_file)
+                with stage_timer('write', 0, stats['timings']):
+                    store.write(embedded)
+                # Finished chunks are in the cache, so the checkpoint only needs to cover the current one
+                if os.path.exists(checkpoint_file):
+                    os.remove(checkpoint_file)
+
+                stats['chunks'] += 1
+                for key in ('rows', 'cache_hits', 'cache_misses'):
+                    stats[key] += chunk_stats[key]
+                if progress:
+                    progress.advance(len(chunk))
+    except Exception:
+        if os.path.exists(partial_processed_file):
+            os.remove(partial_processed_file)
+        raise
+    os.replace(partial_processed_file, processed_file)
+
+    seconds = time.perf_counter() - start
+    stats['seconds'] = round(seconds, 3)
+    stats['rows_per_second'] = round(stats['rows'] / seconds, 1) if seconds else None
+    print(f"Embeddings saved to {embeddings_file} ({stats['rows']} rows in {stats['chunks']} chunks, "
+          f"{stats['cache_hits']} cached, {stats['cache_misses']} embedded)")
+    return stats
+
+def drop_duplicate_names(chunk, name_column, seen_names, stats):
+    """The chunk without rows whose name appeared in it or in an earlier chunk, counted into stats['duplicates']."""
+    hashes = pd.util.hash_pandas_object(chunk[name_column], index=False).to_numpy()
+    keep = np.zeros(len(hashes), dtype=bool)
+    for i, h in enumerate(hashes.tolist()):
+        if h not in seen_names:
+            seen_names.add(h)
+            keep[i] = True
+    stats['duplicates'] += int(len(keep) - keep.sum())
+    return chunk[keep]
+
+# Default normalization tables; set PREPROCESS_TABLES to a JSON file with
+# "abbreviations" and/or "stop_words" keys to override them
+ABBREVIATION_MAP = {
+    "choc.": "chocolate",
+    "strwbr.": "strawberry",
+    "eng.": "energy",
+    "pb": "peanut butter",
+    "oz": "oz",
+    "lb": "lb",
+    "g": "g",
+    "ml": "ml"
+}
+STOP_WORDS = ['and', 'with', 'the']
+
+
+class PreprocessRules:
+    """Abbreviation and stop-word tables compiled once into regexes.
+
+    Keys are regex fragments applied as \\b{key}\\b, one table entry after
+    another, and expand() reproduces that exactly. Cheap column-wide masks pick
+    the names that can change at all; those go through a single alternation
+    with a dict lookup. A name where one match ends in a non-word character and
+    a later entry matches right after it would expand differently in one pass,
+    so those names (and every name, for tables the one-pass form cannot
+    represent) take the entry-by-entry path.
+    """
+
+    def __init__(self, abbreviations, stop_words):
+        # Entries that map a plain word to itself never change the text
+        self.abbreviations = {
+            abbr: full for abbr, full in abbreviations.items() if not (abbr == full and re.fullmatch(r"\w+", abbr))
+        }
+        self.sequential = [(re.compile(rf"\b{abbr}\b"), full) for abbr, full in self.abbreviations.items()]
+        self.stop_words = set(stop_words)
+
+        # Every character str.split() splits on, spelled out so the patterns below
+        # mean the same under Python's re and pyarrow's RE2 (which has no lookarounds)
+        whitespace = "".join(c for c in map(chr, range(sys.maxunicode + 1)) if c.isspace())
+        self.whitespace_run = f"[{whitespace}]+"
+        # Only stop words without whitespace can equal a token
+        stop_alternation = "|".join(
+            re.escape(word) for word in stop_words if not any(c.isspace() for c in word)
+        ) or "(?!)"
+        self.stop_run = f" (?:(?:{stop_alternation}) )+"
+
+        self.alternation = None
+        if self.abbreviations and self._single_pass_safe():
+            keys = list(self.abbreviations)
+            stems = [abbr.rstrip('.') for abbr in keys]
+            self.replacements = list(self.abbreviations.values())
+            self.alternation = re.compile(r"\b(?:" + "|".join(f"({abbr})" for abbr in keys) + r")\b")
+            self.mentions = r"\b(?:" + "|".join(stems) + ")"
+            self.adjacent = "|".join(
+                rf"\b{stems[i]}\W(?:{'|'.join(keys[i + 1:])})\b"
+                for i in range(len(keys) - 1) if keys[i].endswith('.')
+            ) or None
+
+    def _single_pass_safe(self):
+        keys = list(self.abbreviations)
+        if not all(re.fullmatch(r"\w+\.?", abbr) for abbr in keys):
+            return False
+        stems = [abbr.rstrip('.') for abbr in keys]
+        if any(i != j and stems[j].startswith(stems[i]) for i in range(len(stems)) for j in range(len(stems))):
+            return False
+        for i, full in enumerate(self.abbreviations.values()):
+            if not re.fullmatch(r"\w+(?: \w+)*", full):
+                return False
+            # A later entry must not be able to start inside this expansion
+            word_starts = [0] + [m.end() for m in re.finditer(" ", full)]
+            for start in word_starts:
+                rest = full[start:]
+                if any(rest.startswith(stem) or stem.startswith(rest) for stem in stems[i + 1:]):
+                    return False
+        return True
+
+    def expand_one(self, text):
+        for pattern, full in self.sequential:
+            text = pattern.sub(full, text)
+        return text
+
+    def _expand_alternation(self, text):
+        return self.alternation.sub(lambda m: self.replacements[m.lastindex - 1], text)
+
+    def expand(self, names):
+        if not self.abbreviations:
+            return names
+        if self.alternation is None:
+            return names.map(self.expand_one, na_action='ignore')
+
+        # The masks may over-select (e.g. ASCII-only \b under RE2) but never miss a name
+        names = names.copy()
+        mentions = names.str.contains(self.mentions, regex=True, na=False)
+        adjacent = names.str.contains(self.adjacent, regex=True, na=False) if self.adjacent else mentions & False
+        single_pass = mentions & ~adjacent
+        names[single_pass] = names[single_pass].map(self._expand_alternation)
+        names[adjacent] = names[adjacent].map(self.expand_one)
+        return names
+
+    def remove_stop_words(self, names):
+        """Drop stop-word tokens and collapse whitespace, like " ".join(x.split()) with a filter."""
+        # With single spaces around every token, a run of stop-word tokens is " stop stop "
+        padded = " " + names.str.replace(self.whitespace_run, " ", regex=True) + " "
+        return padded.str.replace(self.stop_run, " ", regex=True).str.strip(" ")
+
+
+@functools.lru_cache(maxsize=None)
+def load_preprocess_rules(tables_file=None):
+    """Compile the normalization tables once per tables file."""
+    abbreviations, stop_words = ABBREVIATION_MAP, STOP_WORDS
+    if tables_file:
+        with open(tables_file, encoding='utf-8') as f:
+            tables = json.load(f)
+        abbreviations = tables.get('abbreviations', abbreviations)
+        stop_words = tables.get('stop_words', stop_words)
+    return PreprocessRules(abbreviations, stop_words)
+
 
 def preprocess_data(df, name_column):
     """Preprocess product data."""
+    rules = load_preprocess_rules(os.getenv("PREPROCESS_TABLES"))
+
     # Save original product name
     df['original_name'] = df[name_column]
     
@@ -46,34 +307,17 @@ def preprocess_data(df, name_column):
     df[name_column] = df[name_column].str.replace(r"[^\w\s./-]", "", regex=True).str.strip()
     
     # Expand abbreviations
-    abbreviation_map = {
-        "choc.": "chocolate",
-        "strwbr.": "strawberry",
-        "eng.": "energy",
-        "pb": "peanut butter",
-        "oz": "oz",
-        "lb": "lb",
-        "g": "g",
-        "ml": "ml"
-    }
-    
-    def expand_abbreviations(text):
-        for abbr, full in abbreviation_map.items():
-            text = re.sub(rf"\b{abbr}\b", full, text)
-        return text
-    
-    df[name_column] = df[name_column].apply(expand_abbreviations)
+    df[name_column] = rules.expand(df[name_column])
     
     # Remove stop words
-    stop_words = {'and', 'with', 'the'}
-    df[name_column] = df[name_column].apply(lambda x: " ".join([word for word in x.split() if word not in stop_words]))
+    df[name_column] = rules.remove_stop_words(df[name_column])
     
     # Correct unit extraction with case-insensitivity
     df['size'] = df[name_column].str.extract(r"(\d+(\.\d+)?)(?=\s?(oz|g|ml|lb)\b)", expand=False)[0].astype(float, errors='ignore')
     df['unit'] = df[name_column].str.extract(r"(?i)(\boz\b|\bg\b|\bml\b|\blb\b)", expand=False).fillna('')
 
     # Handle size and unit normalization
-    df['size'] = df.apply(lambda row: row['size'] if pd.notna(row['size']) else 0, axis=1)
+    df['size'] = df['size'].fillna(0)
 
     # Extract manufacturer (first meaningful word)
     df['manufacturer'] = df[name_column].str.split().str[0].fillna('')
@@ -85,4 +329,3 @@ def preprocess_data(df, name_column):
     df = df[df[name_column].notna()]
     
     return df
-
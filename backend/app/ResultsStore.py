@@ -0,0 +1,253 @@
+import io
+import json
+import os
+import sqlite3
+import pandas as pd
+from app.EmbeddingIndex import file_fingerprint
+
+RESULT_COLUMNS = ['External', 'Internal', 'Method', 'Semantic Score', 'Fallback_Internal', 'Fallback_Semantic_Score']
+NAME_COLUMNS = {'External': str, 'Internal': str, 'Method': str, 'Fallback_Internal': str}
+MAX_PAGE_SIZE = 1000
+
+
+def score_value(value):
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def create_tables(connection):
+    connection.execute(
+        "CREATE TABLE results (position INTEGER PRIMARY KEY, method TEXT, semantic_score REAL, record TEXT NOT NULL)"
+    )
+    connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+
+def create_indexes(connection):
+    connection.execute("CREATE INDEX results_method ON results (method, position)")
+    connection.execute("CREATE INDEX results_score ON results (semantic_score, position)")
+
+
+def live_path(path):
+    """Where a ResultsWriter keeps the store for path while a match is running."""
+    return f"{path}.live"
+
+
+def insert_chunk(connection, chunk, position):
+    """Insert a chunk of the results CSV, as pandas read it, starting at row position; returns its length."""
+    records = chunk.fillna("").to_dict(orient='records')
+    connection.executemany(
+        "INSERT INTO results (position, method, semantic_score, record) VALUES (?, ?, ?, ?)",
+        [
+            (position + i, record.get('Method'), score_value(record.get('Semantic Score')),
+             json.dumps(record, sort_keys=True))
+            for i, record in enumerate(records)
+        ]
+    )
+    return len(records)
+
+
+class ResultsStore:
+    """Matched results in SQLite, indexed for paging and filtering by Method and semantic score.
+
+    Each row keeps the JSON record /view-mapped has always returned (the CSV
+    as pandas reads it, NaN as ""), plus the Method and score columns the
+    filters use. The store remembers which results CSV it was built from.
+    A ResultsWriter fills a live store next to it (see live()), whose status
+    is 'running' until the match finishes and 'failed' if it does not.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        return sqlite3.connect(self.path)
+
+    @classmethod
+    def build(cls, results_file, path, chunk_size=50000):
+        partial_path = f"{path}.partial"
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        connection = sqlite3.connect(partial_path)
+        create_tables(connection)
+
+        position = 0
+        with pd.read_csv(results_file, chunksize=chunk_size, dtype=NAME_COLUMNS) as reader:
+            for chunk in reader:
+                position += insert_chunk(connection, chunk, position)
+
+        create_indexes(connection)
+        connection.execute("INSERT INTO meta (key, value) VALUES ('source', ?)", (file_fingerprint(results_file),))
+        connection.commit()
+        connection.close()
+        os.replace(partial_path, path)
+        return cls(path)
+
+    @classmethod
+    def open(cls, results_file, path):
+        """The store for results_file, rebuilt first if missing or built from an older file."""
+        store = cls(path)
+        if not os.path.exists(path) or not store.is_current(results_file):
+            store = cls.build(results_file, path)
+        return store
+
+    @classmethod
+    def live(cls, path):
+        """The store a ResultsWriter is filling, or left behind by a failed match, or None."""
+        if not os.path.exists(live_path(path)):
+            return None
+        return cls(live_path(path))
+
+    def meta(self, key):
+        with self.connect() as connection:
+            row = connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def source(self):
+        return self.meta('source')
+
+    def status(self):
+        """'running', 'failed' or 'complete'; stores built from a CSV are complete."""
+        return self.meta('status') or 'complete'
+
+    def is_complete(self):
+        return self.status() == 'complete'
+
+    def is_current(self, results_file):
+        if not os.path.exists(self.path):
+            return False
+        return self.source() == file_fingerprint(results_file)
+
+    @staticmethod
+    def _filters(method=None, min_score=None, max_score=None):
+        clauses, params = [], []
+        if method:
+            clauses.append("method = ?")
+            params.append(method)
+        if min_score is not None:
+            clauses.append("semantic_score >= ?")
+            params.append(min_score)
+        if max_score is not None:
+            clauses.append("semantic_score <= ?")
+            params.append(max_score)
+        return clauses, params
+
+    def page(self, cursor=None, offset=None, limit=100, method=None, min_score=None, max_score=None):
+        """One page of records in results order.
+
+        Pass the previous page's next_cursor to continue, or an offset to jump.
+        Returns (records, next_cursor, total matching rows).
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        clauses, params = self._filters(method, min_score, max_score)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        page_clauses, page_params = list(clauses), list(params)
+        if cursor is not None:
+            page_clauses.append("position > ?")
+            page_params.append(cursor)
+        page_where = f"WHERE {' AND '.join(page_clauses)}" if page_clauses else ""
+
+        with self.connect() as connection:
+            total = connection.execute(f"SELECT COUNT(*) FROM results {where}", params).fetchone()[0]
+            rows = connection.execute(
+                f"SELECT position, record FROM results {page_where} ORDER BY position LIMIT ? OFFSET ?",
+                (*page_params, limit + 1, offset if cursor is None and offset else 0)
+            ).fetchall()
+
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return [json.loads(record) for _, record in rows[:limit]], next_cursor, total
+
+    def iter_records(self, method=None, min_score=None, max_score=None, batch_size=1000):
+        """Yield every matching record as a JSON string, in results order."""
+        clauses, params = self._filters(method, min_score, max_score)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        connection = self.connect()
+        try:
+            cursor = connection.execute(f"SELECT record FROM results {where} ORDER BY position", params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for (record,) in rows:
+                    yield record
+        finally:
+            connection.close()
+
+
+class ResultsWriter:
+    """Writes a run's results CSV and its ResultsStore a batch of records at a time.
+
+    Each batch is appended to a partial CSV, flushed, and committed to the
+    live store, so /view-mapped pages through the rows written so far while
+    matching goes on. The store gets the records build() would read back
+    from the CSV. The previous results stay in place until close() moves
+    both files over them, as build() does. A writer left by an exception
+    removes its partial CSV and marks the live store failed.
+    """
+
+    def __init__(self, results_file, path, columns=RESULT_COLUMNS):
+        self.results_file = results_file
+        self.path = path
+        self.columns = columns
+        self.rows = 0
+        self.partial_file = f"{results_file}.partial"
+        self.live_path = live_path(path)
+        for stale in (self.live_path, f"{self.live_path}-wal", f"{self.live_path}-shm"):
+            if os.path.exists(stale):
+                os.remove(stale)
+        self.csv = open(self.partial_file, 'w', newline='', encoding='utf-8')
+        self.csv.write(pd.DataFrame(columns=columns).to_csv(index=False))
+        self.csv.flush()
+        self.connection = sqlite3.connect(self.live_path)
+        # Readers keep paging while a batch is being committed
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        create_tables(self.connection)
+        create_indexes(self.connection)
+        self.connection.execute("INSERT INTO meta (key, value) VALUES ('status', 'running')")
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.fail(exc)
+
+    def write(self, records):
+        if not records:
+            return
+        text = pd.DataFrame(records, columns=self.columns).to_csv(index=False, header=False)
+        self.csv.write(text)
+        self.csv.flush()
+        chunk = pd.read_csv(io.StringIO(text), header=None, names=self.columns, dtype=NAME_COLUMNS)
+        self.rows += insert_chunk(self.connection, chunk, self.rows)
+        self.connection.commit()
+
+    def close(self):
+        self.csv.close()
+        os.replace(self.partial_file, self.results_file)
+        self.connection.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                    [('source', file_fingerprint(self.results_file)), ('status', 'complete')])
+        self.connection.commit()
+        # Readers may still hold the live store, so copy it out of WAL mode rather than moving it
+        partial_path = f"{self.path}.partial"
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        final = sqlite3.connect(partial_path)
+        self.connection.backup(final)
+        final.execute("PRAGMA journal_mode=DELETE")
+        final.close()
+        self.connection.close()
+        os.replace(partial_path, self.path)
+        for live in (self.live_path, f"{self.live_path}-wal", f"{self.live_path}-shm"):
+            if os.path.exists(live):
+                os.remove(live)
+        return ResultsStore(self.path)
+
+    def fail(self, error):
+        self.csv.close()
+        os.remove(self.partial_file)
+        self.connection.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                    [('status', 'failed'), ('error', str(error))])
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,241 @@
+import codecs
+import csv
+import hashlib
+import os
+import queue
+import threading
+from werkzeug.formparser import parse_form_data
+
+# Each catalog is recognised by the name column in its header and saved under the name /preprocess expects
+CATALOGS = {
+    'internal': ('LONG_NAME', 'Data_Internal.csv'),
+    'external': ('PRODUCT_NAME', 'Data_External.csv')
+}
+
+
+class TextPipe:
+    """A bounded pipe of decoded CSV text from the upload request to a preprocessing thread.
+
+    read() blocks until enough text has arrived, so pd.read_csv parses the
+    upload while it streams in. A full pipe blocks the writer, which keeps
+    memory bounded when preprocessing falls behind the upload. After abort()
+    the reader gets an error instead of what looks like a short file.
+    """
+
+    def __init__(self, maxsize=64):
+        self.queue = queue.Queue(maxsize)
+        self.buffer = ''
+        self.done = False
+        self.reader_gone = False
+
+    def _put(self, item):
+        while not self.reader_gone:
+            try:
+                self.queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def write(self, text):
+        if text and not self._put(text):
+            raise BrokenPipeError('The preprocessing thread stopped reading the upload')
+
+    def close(self):
+        self._put(None)
+
+    def abort(self):
+        self._put(ConnectionAbortedError('The upload was aborted'))
+
+    def read(self, size=-1):
+        while not self.done and (size is None or size < 0 or len(self.buffer) < size):
+            item = self.queue.get()
+            if item is None:
+                self.done = True
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                self.buffer += item
+        if size is None or size < 0:
+            size = len(self.buffer)
+        text, self.buffer = self.buffer[:size], self.buffer[size:]
+        return text
+
+    def __iter__(self):
+        # pandas only takes objects that look iterable as files; it reads them with read()
+        return iter(())
+
+
+class CatalogUpload:
+    """One CSV file of a streaming upload, written into by werkzeug's form parser.
+
+    Bytes are decoded as UTF-8 on the way through, so other encodings are
+    rejected at the first bad byte rather than after the upload. The header
+    names the catalog; from then on the raw bytes go to its Data_*.csv in the
+    workspace and the text into a TextPipe read by the catalog's
+    preprocessing thread. digest is the SHA-256 of the raw file, as
+    file_digest() would compute it.
+    """
+
+    def __init__(self, upload, filename):
+        self.upload = upload
+        self.filename = filename
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.sha256 = hashlib.sha256()
+        self.pending_bytes = []
+        self.pending_text = ''
+        self.catalog = None
+        self.file = None
+        self.pipe = TextPipe()
+        self.thread = None
+        self.result = None
+        self.error = None
+        self.digest = None
+
+    def write(self, data):
+        try:
+            text = self.decoder.decode(data)
+        except UnicodeDecodeError:
+            raise ValueError(f"{self.filename} is not UTF-8 encoded text.")
+        self.sha256.update(data)
+        if self.file is None:
+            self.pending_bytes.append(bytes(data))
+            self.pending_text += text
+            if '\n' not in self.pending_text:
+                return len(data)
+            self._start(self.pending_text.split('\n', 1)[0])
+            self.file.write(b''.join(self.pending_bytes))
+            text, self.pending_bytes, self.pending_text = self.pending_text, [], ''
+        else:
+            self.file.write(data)
+        self._check_reader()
+        self.pipe.write(text)
+        return len(data)
+
+    def _start(self, header):
+        columns = next(csv.reader([header]), [])
+        found = [catalog for catalog, (column, _) in CATALOGS.items() if column in columns]
+        if len(found) != 1:
+            raise ValueError(f"{self.filename} needs exactly one of the columns "
+                             f"{' or '.join(column for column, _ in CATALOGS.values())}.")
+        self.catalog = found[0]
+        self.path = self.upload.claim(self.catalog, self)
+        self.file = open(self.path, 'wb')
+        self.thread = threading.Thread(target=self._run, name=f"upload-{self.catalog}", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            self.result = self.upload.preprocess(self.catalog, self.pipe)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.pipe.reader_gone = True
+
+    def failure(self):
+        """The preprocessing thread's error, as a ValueError for the reply, or None."""
+        if self.error is not None:
+            return ValueError(f"Preprocessing {self.filename} failed: {self.error}")
+        return None
+
+    def _check_reader(self):
+        if self.error is not None:
+            raise self.failure()
+
+    def seek(self, offset, whence=0):
+        # The parser rewinds each finished file; there is nothing to read back
+        return 0
+
+    def finish(self):
+        """The whole file has arrived: flush the decoder and close the pipe."""
+        if self.file is None:
+            # A header without a line break is the whole file
+            self._start(self.pending_text)
+            self.file.write(b''.join(self.pending_bytes))
+            self.pipe.write(self.pending_text)
+        try:
+            tail = self.decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            raise ValueError(f"{self.filename} is not UTF-8 encoded text.")
+        self.pipe.write(tail)
+        self.pipe.close()
+        self.file.close()
+        self.digest = self.sha256.hexdigest()
+
+    def abort(self):
+        if self.file is not None:
+            self.pipe.abort()
+            self.thread.join()
+            self.file.close()
+            os.remove(self.path)
+
+
+class StreamingUpload:
+    """A multipart upload of both catalogs, preprocessed while it streams in.
+
+    receive() parses the request body with werkzeug, handing every file part
+    to a CatalogUpload instead of a temporary file. Each catalog starts
+    preprocessing on its own thread, via preprocess(catalog, pipe), as soon
+    as its header has arrived, so by the time the upload ends most of the
+    work is done; wait() collects what preprocess returned for each catalog.
+    """
+
+    def __init__(self, workspace, preprocess):
+        self.workspace = workspace
+        self.preprocess = preprocess
+        self.parts = []
+        self.catalogs = {}
+
+    def stream_factory(self, total_content_length, content_type, filename, content_length=None):
+        if not filename or not filename.lower().endswith('.csv'):
+            raise ValueError('Invalid file format. Only CSV files are allowed.')
+        part = CatalogUpload(self, filename)
+        self.parts.append(part)
+        return part
+
+    def claim(self, catalog, part):
+        if catalog in self.catalogs:
+            raise ValueError(f"{part.filename} and {self.catalogs[catalog].filename} are both the {catalog} catalog.")
+        self.catalogs[catalog] = part
+        return self.workspace.path(CATALOGS[catalog][1])
+
+    def receive(self, environ):
+        """Parse the request body; on any error the upload is undone.
+
+        A ValueError says what was wrong with the upload. When a preprocessing
+        thread has already failed, its error is the one raised, whatever it
+        made the upload fail with (such as a BrokenPipeError writing to its
+        pipe). Preprocessing carries on after receive() returns; see wait().
+        """
+        try:
+            parse_form_data(environ, stream_factory=self.stream_factory, silent=False)
+            for part in self.parts:
+                part.finish()
+            missing = [CATALOGS[catalog][0] for catalog in CATALOGS if catalog not in self.catalogs]
+            if missing:
+                raise ValueError(f"No uploaded file has the {' or '.join(missing)} column.")
+        except BaseException as e:
+            # Look before aborting: abort() makes every thread still reading fail too
+            failure = next((part.failure() for part in self.parts if part.error is not None), None)
+            self.abort()
+            if failure is not None:
+                raise failure from e
+            raise
+
+    def abort(self):
+        for part in self.parts:
+            part.abort()
+
+    def wait(self):
+        """What preprocess returned for each catalog, once both threads are done.
+
+        If either failed, the saved catalogs are removed and its error is
+        raised as a ValueError.
+        """
+        for part in self.parts:
+            part.thread.join()
+        failure = next((part.failure() for part in self.parts if part.error is not None), None)
+        if failure is not None:
+            self.abort()
+            raise failure
+        return {catalog: part.result for catalog, part in self.catalogs.items()}
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from app.CatalogCache import CatalogCache
+
+# Bump whenever preprocessing output changes, so artifacts built by older code are not reused
+ARTIFACT_VERSION = 1
+
+RUN_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+class Workspace:
+    """One mapping run's own folder: its uploads, external catalog intermediates and results.
+
+    Runs are identified by a random run id and live in runs_folder/<run_id>,
+    so concurrent runs never write the same files. The internal catalog's
+    artifacts are not copied in; they are shared through an ArtifactStore.
+    """
+
+    def __init__(self, runs_folder, run_id):
+        self.run_id = run_id
+        self.folder = os.path.join(runs_folder, run_id)
+
+    @classmethod
+    def create(cls, runs_folder):
+        workspace = cls(runs_folder, uuid.uuid4().hex)
+        os.makedirs(workspace.folder)
+        return workspace
+
+    @classmethod
+    def open(cls, runs_folder, run_id):
+        """The workspace of an existing run, or None for an unknown or malformed run id."""
+        if not run_id or not RUN_ID_PATTERN.fullmatch(run_id):
+            return None
+        workspace = cls(runs_folder, run_id)
+        return workspace if os.path.isdir(workspace.folder) else None
+
+    def path(self, filename):
+        return os.path.join(self.folder, filename)
+
+    def delete(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """Preprocessed internal catalogs shared between runs, deduplicated by content hash.
+
+    An artifact is a folder root/<key> holding Processed_Internal.csv, the
+    Internal_Embeddings store and the indexes persisted next to it. key()
+    hashes the uploaded CSV together with every setting that changes the
+    output, so runs uploading the same catalog share one artifact. Each run
+    references at most one artifact; the references are kept in SQLite and an
+    artifact is deleted once no run references it and no job is using it.
+
+    use() hands out the artifact's LoadedCatalog from a CatalogCache, so
+    concurrent and repeated matches against one catalog share a single
+    in-memory copy and skip loading it again. warm_up() fills the cache ahead
+    of the first match.
+    """
+
+    PROCESSED_FILE = 'Processed_Internal.csv'
+    EMBEDDINGS_FILE = 'Internal_Embeddings.npy'
+
+    def __init__(self, root, cache=None):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.lock = threading.Lock()
+        self.build_locks = {}
+        self.cache = cache or CatalogCache()
+        self.connection = sqlite3.connect(os.path.join(root, 'artifacts.sqlite'), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS refs (run_id TEXT PRIMARY KEY, key TEXT NOT NULL)")
+        self.connection.commit()
+
+    @staticmethod
+    def key(source_file, settings, source_digest=None):
+        """Content hash of a catalog CSV plus the JSON-ready settings it is preprocessed with.
+
+        source_digest saves reading the file again when its file_digest is already known.
+        """
+        digest = hashlib.sha256((source_digest or file_digest(source_file)).encode('utf-8'))
+        digest.update(json.dumps({**settings, 'version': ARTIFACT_VERSION}).encode('utf-8'))
+        return digest.hexdigest()
+
+    def path(self, key, filename=None):
+        folder = os.path.join(self.root, key)
+        return os.path.join(folder, filename) if filename else folder
+
+    def exists(self, key):
+        return os.path.isdir(self.path(key))
+
+    def build(self, key, build_fn):
+        """Run build_fn(folder) to create the artifact unless it exists; returns its result, or None if reused.
+
+        build_fn writes into a private folder that is renamed into place when
+        it returns, so a failed or concurrent build never leaves a partial
+        artifact. Builds of the same key are serialized: the second waits and
+        then reuses the first one's output.
+        """
+        with self.lock:
+            build_lock = self.build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            if self.exists(key):
+                return None
+            partial = os.path.join(self.root, f".{key}.{uuid.uuid4().hex}.partial")
+            os.makedirs(partial)
+            try:
+                result = build_fn(partial)
+                os.replace(partial, self.path(key))
+            except BaseException:
+                shutil.rmtree(partial, ignore_errors=True)
+                raise
+            return result
+
+    def adopt(self, key, folder):
+        """Move a folder built outside build() into place as the artifact for key; returns False if the
+        artifact already existed, in which case folder is deleted and the existing one kept."""
+        with self.lock:
+            build_lock = self.build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            if self.exists(key):
+                shutil.rmtree(folder, ignore_errors=True)
+                return False
+            os.replace(folder, self.path(key))
+            return True
+
+    def bind(self, run_id, key):
+        """Point a run at an artifact, dropping its reference to the previous one."""
+        previous = self.key_for(run_id)
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO refs (run_id, key) VALUES (?, ?)", (run_id, key))
+            self.connection.commit()
+        if previous and previous != key:
+            self._collect(previous)
+
+    def release(self, run_id):
+        """Drop a run's reference, deleting its artifact if that was the last one."""
+        key = self.key_for(run_id)
+        with self.lock:
+            self.connection.execute("DELETE FROM refs WHERE run_id = ?", (run_id,))
+            self.connection.commit()
+        if key:
+            self._collect(key)
+
+    def key_for(self, run_id):
+        with self.lock:
+            row = self.connection.execute("SELECT key FROM refs WHERE run_id = ?", (run_id,)).fetchone()
+        return row[0] if row else None
+
+    def refcount(self, key):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM refs WHERE key = ?", (key,)).fetchone()[0]
+
+    def _collect(self, key):
+        # Holding the build lock keeps a concurrent build of the same key from being deleted half way
+        with self.lock:
+            build_lock = self.build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            with self.lock:
+                referenced = self.connection.execute("SELECT 1 FROM refs WHERE key = ? LIMIT 1", (key,)).fetchone()
+                if referenced or self.cache.in_use(key) or not self.exists(key):
+                    return
+            self.cache.discard(key)
+            shutil.rmtree(self.path(key), ignore_errors=True)
+        print(f"Deleted unreferenced artifact {key}")
+
+    @contextmanager
+    def use(self, key, warm_up=False):
+        """Yield the artifact's LoadedCatalog, from the catalog cache when it is warm."""
+        # The folder's mtime records the last use, which orders warm_up()
+        os.utime(self.path(key))
+        try:
+            with self.cache.use(key, self.path(key, self.EMBEDDINGS_FILE), warm_up) as catalog:
+                yield catalog
+        finally:
+            self._collect(key)
+
+    def warm_up(self, index_backend='exact', row_hashes=True):
+        """Load referenced artifacts into the catalog cache, most recently used first, until it is full.
+
+        Builds each one's nearest-neighbour index and CandidateIndex, and its
+        row hashes when row_hashes is set, so the next match skips all of it.
+        Returns the keys warmed.
+        """
+        with self.lock:
+            keys = [row[0] for row in self.connection.execute("SELECT DISTINCT key FROM refs")]
+        keys = sorted((key for key in keys if self.exists(key)), key=lambda key: os.path.getmtime(self.path(key)),
+                      reverse=True)
+        warmed = []
+        for key in keys:
+            start = time.perf_counter()
+            with self.use(key, warm_up=True) as catalog:
+                catalog.index(index_backend)
+                catalog.candidate_index()
+                if row_hashes:
+                    catalog.row_hashes()
+            if key not in self.cache:
+                break
+            warmed.append(key)
+            print(f"Warmed catalog {key} in {time.perf_counter() - start:.2f}s")
+        return warmed
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
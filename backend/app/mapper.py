@@ -3,10 +3,25 @@ import re
 import openai
 import numpy as np
 import time
-from sklearn.metrics.pairwise import cosine_similarity
-from fuzzywuzzy import fuzz
+import math
+import multiprocessing
+from collections import Counter
+from rapidfuzz.distance import Indel
 from dotenv import load_dotenv
 import os
+from app.Blocking import CandidateIndex, NAME_THRESHOLD, RuleFields, SIZE_TOLERANCE, row_fields
+from app.EmbeddingIndex import ExactIndex, normalize_embeddings
+from app.FallbackVerifier import FallbackVerifier, parse_packed_verdicts
+from app.Metrics import CANDIDATES_PER_ROW, MATCHES, stage_timer
+
+# Shards per worker process in the parallel rule pass; more shards balance uneven rows better
+SHARDS_PER_WORKER = 8
+
+# Normalized key of a preprocessed row; external rows sharing one are matched once
+DEDUPE_COLUMNS = ['cleaned_name', 'size', 'unit', 'manufacturer']
+
+# Unique external rows matched per batch; each batch's results are emitted before the next starts
+MATCH_BATCH_ROWS = 20000
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,40 +30,35 @@ load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
 def rule_based_match(row1, row2):
-    size1 = row1.get('size', None)
-    unit1 = row1.get('unit', None)
-    manufacturer1 = row1.get('manufacturer', None)
-    cleaned_name1 = row1.get('cleaned_name', None)
-
-    size2 = row2.get('size', None)
-    unit2 = row2.get('unit', None)
-    manufacturer2 = row2.get('manufacturer', None)
-    cleaned_name2 = row2.get('cleaned_name', None)
-
-    size_match = abs(size1 - size2) <= 0.1 if size1 and size2 else False
-    manufacturer_match = (
-        manufacturer1 == manufacturer2 
-        if pd.notna(manufacturer1) and pd.notna(manufacturer2) 
-        else True
-    )
-    product_name_match = fuzz.token_sort_ratio(cleaned_name1, cleaned_name2) >= 85
+    return fields_match(*row_fields(row1), *row_fields(row2))
 
-    return size_match and manufacturer_match and product_name_match
+
+def fields_match(size1, manufacturer1, name1, size2, manufacturer2, name2):
+    """rule_based_match on two rows' row_fields, cheapest check first.
+
+    Sizes must be set (non-zero) and within SIZE_TOLERANCE, manufacturers
+    equal when both are known, and the token-sorted names must reach
+    NAME_THRESHOLD on the rounded token_sort_ratio scale.
+    """
+    if size1 is None or size2 is None or abs(size1 - size2) > SIZE_TOLERANCE:
+        return False
+    if manufacturer1 is not None and manufacturer2 is not None and manufacturer1 != manufacturer2:
+        return False
+    if name1 == name2:
+        return True
+    if not name1 or not name2:
+        return False
+    # Stop counting edits once the ratio cannot round up to the threshold
+    total = len(name1) + len(name2)
+    distance = Indel.distance(name1, name2, score_cutoff=int(total * (100.5 - NAME_THRESHOLD) / 100) + 1)
+    return round(100 * ((total - distance) / total)) >= NAME_THRESHOLD
 
 
-def semantic_similarity_match(external_embedding, internal_embeddings, threshold=0.8):
-    similarities = cosine_similarity([external_embedding], internal_embeddings)[0]
-    best_index = np.argmax(similarities)
-    best_score = similarities[best_index]
-    
-    # Correct Return Logic
-    if best_score >= threshold:
-        return best_index, best_score
-    else:
-        return None, None
-    
 # GPT-4 Model Fallback
 
+# Bump whenever the fallback prompts or model change so cached verdicts are not reused
+FALLBACK_PROMPT_VERSION = "gpt-4:v1"
+
 def openai_fallback(external_name, internal_name):
     #print("Checking External Name - " + external_name + " Internal Name - " + internal_name)
     prompt = f"""
@@ -77,6 +87,42 @@ def openai_fallback(external_name, internal_name):
     
     return response['choices'][0]['message']['content'].strip().lower() == 'yes'
 
+
+def openai_fallback_batch(pairs):
+    """Check several (external, internal) pairs in one prompt; None where no verdict was read."""
+    listing = "\n".join(
+        f"    {number}. External Product: {external_name} | Internal Product: {internal_name}"
+        for number, (external_name, internal_name) in enumerate(pairs, 1)
+    )
+    prompt = f"""
+    
+    You are a product matching system. Use these rules strictly:
+    1. If the external product does NOT have the size (weight), the answer is 'No'.
+    2. The product manufacturer, size (within a tolerance of ±0.1 oz), and units of internal and external products MUST be the same.
+    3. The flavor must match exactly.
+    4. If any rule is violated, the answer is 'No'.
+    5. Ignore abbreviations, formatting, and common shorthand if they do not affect the rules above.
+
+    With that in Consideration here are the numbered product pairs - 
+    
+{listing}
+    
+    Judge every pair on its own. Answer with one line per pair, '<number>: Yes' if they are the correct match and '<number>: No' if they are the wrong match.
+    """
+
+    response = openai.ChatCompletion.create(
+        model="gpt-4",
+        messages=[{"role": "user", "content": prompt}]
+    )
+
+    return parse_packed_verdicts(response['choices'][0]['message']['content'], len(pairs))
+
+
+def make_fallback_verifier(cache=None, concurrency=8, pack_size=1):
+    """FallbackVerifier bound to the GPT-4 fallback prompts."""
+    return FallbackVerifier(openai_fallback, openai_fallback_batch, FALLBACK_PROMPT_VERSION,
+                            cache=cache, concurrency=concurrency, pack_size=pack_size)
+
 # GPT-4-turbo Model Fallback
 
 
@@ -148,68 +194,309 @@ def openai_fallback(external_name, internal_name):
 
 
 
-def run_matching_pipeline(external, internal, threshold=0.8):
-    matches = []
-    internal_embeddings = np.stack(internal['embedding'].values)
+def rule_match_rows(external, candidate_index, start, end, progress=None):
+    """First rule-based match among the blocking candidates for external rows start..end.
+
+    Returns the matches and the number of candidates each row had.
+    """
+    rule_matches = []
+    candidate_counts = []
+    records = candidate_index.records
+    for size, manufacturer, name in RuleFields(external.iloc[start:end]):
+        rule_match = None
+        candidates = candidate_index.candidates_for(size, manufacturer, name)
+        for position in candidates:
+            if fields_match(size, manufacturer, name, *records[position]):
+                rule_match = position
+                break
+        rule_matches.append(rule_match)
+        candidate_counts.append(len(candidates))
+        if progress:
+            progress.advance()
+    return rule_matches, candidate_counts
+
+
+# State of a rule-matching worker process: inherited on fork, or set up by the pool initializer
+_rule_worker = {}
+
+
+def _init_rule_worker(external, internal, candidate_index=None):
+    _rule_worker.update(external=external, internal=internal,
+                        candidate_index=candidate_index or CandidateIndex(internal))
+
+
+def _rule_match_shard(bounds):
+    candidate_index = _rule_worker['candidate_index']
+    pairs_total, pairs_candidates = candidate_index.pairs_total, candidate_index.pairs_candidates
+    rule_matches, candidate_counts = rule_match_rows(_rule_worker['external'], candidate_index, *bounds)
+    return (rule_matches, candidate_counts, candidate_index.pairs_total - pairs_total,
+            candidate_index.pairs_candidates - pairs_candidates)
 
-    for _, row_external in external.iterrows():
-        external_embedding = np.array(row_external['embedding'])
-        matched = False
-        fallback_data = {
-            'Fallback_Internal': None,
-            'Fallback_Semantic_Score': None
+
+def rule_match_all(external, internal, candidate_index, workers=1, progress=None):
+    """Rule-match every external row, sharding the rows across worker processes when workers > 1.
+
+    Workers are forked where the platform allows it, so they share the frames
+    and the candidate index with this process instead of receiving pickled
+    copies. Shards come back in input order and their blocking counts are
+    added to candidate_index, so the result equals the serial run.
+    Candidates per row are recorded here, in the parent process.
+    """
+    rows = len(external)
+    if workers <= 1 or rows < 2 * SHARDS_PER_WORKER:
+        rule_matches, candidate_counts = rule_match_rows(external, candidate_index, 0, rows, progress)
+        CANDIDATES_PER_ROW.observe_many(candidate_counts)
+        return rule_matches
+
+    shard_size = math.ceil(rows / (workers * SHARDS_PER_WORKER))
+    shards = [(start, min(start + shard_size, rows)) for start in range(0, rows, shard_size)]
+    if 'fork' in multiprocessing.get_all_start_methods():
+        _init_rule_worker(external, internal, candidate_index)
+        pool = multiprocessing.get_context('fork').Pool(workers)
+    else:
+        pool = multiprocessing.Pool(workers, _init_rule_worker, (external, internal))
+
+    rule_matches = []
+    try:
+        with pool:
+            for (start, end), (shard_matches, candidate_counts, pairs_total, pairs_candidates) in zip(
+                    shards, pool.imap(_rule_match_shard, shards)):
+                rule_matches.extend(shard_matches)
+                CANDIDATES_PER_ROW.observe_many(candidate_counts)
+                candidate_index.pairs_total += pairs_total
+                candidate_index.pairs_candidates += pairs_candidates
+                if progress:
+                    progress.advance(end - start)
+    finally:
+        _rule_worker.clear()
+    return rule_matches
+
+
+def duplicate_groups(frame, columns=DEDUPE_COLUMNS):
+    """Number the rows by normalized key, in order of each key's first row; returns (numbers, first row of each).
+
+    Rows with equal keys match identically: the rules and the embedding only
+    look at these columns. Without any of the columns every row is its own key.
+    """
+    columns = [column for column in columns if column in frame.columns]
+    if not columns:
+        groups = np.arange(len(frame))
+    else:
+        groups = frame.groupby(columns, sort=False, dropna=False).ngroup().to_numpy()
+    _, first_positions = np.unique(groups, return_index=True)
+    return groups, first_positions
+
+
+def match_record(external_name, rule_match, best_match, verdict, internal_names, threshold=0.8):
+    """The results record of an external row, from its rule match, best semantic match and fallback verdict."""
+    fallback_data = {
+        'Fallback_Internal': None,
+        'Fallback_Semantic_Score': None
+    }
+
+    if rule_match is not None:
+        return {
+            'External': external_name,
+            'Internal': internal_names[rule_match],
+            'Method': 'Rule-Based',
+            'Semantic Score': None,
+            **fallback_data
         }
 
-        for _, row_internal in internal.iterrows():
-            if rule_based_match(row_external, row_internal):
-                matches.append({
-                    'External': row_external['original_name'],
-                    'Internal': row_internal['original_name'],
-                    'Method': 'Rule-Based',
-                    'Semantic Score': None,
+    best_index, best_score = best_match
+    if best_score >= threshold:
+        best_name = internal_names[best_index]
+        if best_score <= 0.97:
+            fallback_data.update({
+                'Fallback_Internal': best_name,
+                'Fallback_Semantic_Score': best_score
+            })
+            if verdict:
+                return {
+                    'External': external_name,
+                    'Internal': best_name,
+                    'Method': 'Semantic + Fallback',
+                    'Semantic Score': best_score,
                     **fallback_data
-                })
-                matched = True
-                break
-
-        if not matched:
-            best_index, best_score = semantic_similarity_match(external_embedding, internal_embeddings, threshold)
-            if best_index is not None:
-                best_match = internal.iloc[best_index]
-                if best_score <= 0.97:
-                    is_match = openai_fallback(row_external['original_name'], best_match['original_name'])
-                    fallback_data.update({
-                        'Fallback_Internal': best_match['original_name'],
-                        'Fallback_Semantic_Score': best_score
-                    })
-                    if is_match:
-                        matches.append({
-                            'External': row_external['original_name'],
-                            'Internal': best_match['original_name'],
-                            'Method': 'Semantic + Fallback',
-                            'Semantic Score': best_score,
-                            **fallback_data
-                        })
-                        matched = True
-                else:
-                    matches.append({
-                        'External': row_external['original_name'],
-                        'Internal': best_match['original_name'],
-                        'Method': 'Semantic',
-                        'Semantic Score': best_score,
-                        **fallback_data
-                    })
-                    matched = True
-
-        if not matched:
-            # print(f"Unmatched: {row_external['original_name']}")
-            _, best_score = semantic_similarity_match(external_embedding, internal_embeddings, 0.0)
-            matches.append({
-                'External': row_external['original_name'],
-                'Internal': 'NULL',
-                'Method': 'Unmatched',
-                'Semantic Score': best_score if best_score else 'N/A',
+                }
+        else:
+            return {
+                'External': external_name,
+                'Internal': best_name,
+                'Method': 'Semantic',
+                'Semantic Score': best_score,
                 **fallback_data
-            })
+            }
+
+    unmatched_score = best_score if best_score >= 0.0 else None
+    return {
+        'External': external_name,
+        'Internal': 'NULL',
+        'Method': 'Unmatched',
+        'Semantic Score': unmatched_score if unmatched_score else 'N/A',
+        **fallback_data
+    }
+
 
+def run_matching_pipeline(external, internal, threshold=0.8, stats=None, memory_budget_mb=256, index=None,
+                          verifier=None, external_vectors=None, progress=None, workers=1, candidate_index=None,
+                          dedupe=True):
+    """Match every external row to the internal catalog.
+
+    Embeddings come from an 'embedding' column unless given directly:
+    external_vectors and the index's matrix are unit-length rows in the same
+    order as the frames, such as EmbeddingStore.matrix. A JobProgress, when
+    given, is moved through the rules, semantic, fallback and assembly stages.
+    With workers > 1 the rule pass runs in that many processes (see
+    rule_match_all); the output is the same as with one. A prebuilt
+    CandidateIndex over the internal catalog saves building it again.
+    dedupe=False matches every row on its own rather than once per
+    duplicate key (see duplicate_groups); the output is the same either way.
+    """
+    matches = [record for batch in iter_matching_pipeline(external, internal, threshold, stats, memory_budget_mb, index,
+                                                          verifier, external_vectors, progress, workers, candidate_index,
+                                                          dedupe=dedupe)
+               for record in batch]
     return pd.DataFrame(matches)
+
+
+def iter_matching_pipeline(external, internal, threshold=0.8, stats=None, memory_budget_mb=256, index=None,
+                           verifier=None, external_vectors=None, progress=None, workers=1, candidate_index=None,
+                           batch_size=MATCH_BATCH_ROWS, dedupe=True):
+    """run_matching_pipeline as a generator of record lists, batch_size external rows at a time, in row order."""
+    for records, _, _ in iter_match_batches(external, internal, threshold, stats, memory_budget_mb, index, verifier,
+                                            external_vectors, progress, workers, candidate_index, batch_size, dedupe):
+        yield records
+
+
+def match_external_rows(external, internal, threshold=0.8, stats=None, memory_budget_mb=256, index=None,
+                        verifier=None, external_vectors=None, progress=None, workers=1, candidate_index=None):
+    """run_matching_pipeline's records, plus each row's rule match position and (best position, score).
+
+    candidate_index may be prebuilt over just the internal rows that can
+    possibly rule-match these external rows.
+    """
+    matches, rule_matches, best_matches = [], [], {}
+    for records, batch_rule_matches, batch_best_matches in iter_match_batches(
+            external, internal, threshold, stats, memory_budget_mb, index, verifier, external_vectors, progress,
+            workers, candidate_index):
+        offset = len(matches)
+        matches.extend(records)
+        rule_matches.extend(batch_rule_matches)
+        best_matches.update((offset + i, best) for i, best in batch_best_matches.items())
+    return matches, rule_matches, best_matches
+
+
+def iter_match_batches(external, internal, threshold=0.8, stats=None, memory_budget_mb=256, index=None,
+                       verifier=None, external_vectors=None, progress=None, workers=1, candidate_index=None,
+                       batch_size=MATCH_BATCH_ROWS, dedupe=True):
+    """Yield match_external_rows' three results for successive runs of external rows, indexed within each run.
+
+    External rows with the same normalized key (see duplicate_groups) are
+    matched once, through the first of them, and the result is fanned out
+    to every copy under its own External name. The fallback prompt shows
+    that name, so it is asked once per distinct name among the copies.
+    With dedupe=False every row is its own key. The unique rows go through all four stages
+    batch_size at a time, and after each batch every row whose key has been
+    matched is yielded in row order, so results can be written out while
+    later rows are still matching. Each stage is timed into the stage
+    metrics and into stats['timings'], summed over the batches;
+    stats['dedupe'], stats['blocking'] and stats['fallback'] are filled in
+    once the last batch is done.
+    """
+    timings = stats.setdefault('timings', {}) if stats is not None else {}
+    if index is None:
+        index = ExactIndex(normalize_embeddings(internal['embedding'].values), memory_budget_mb)
+    if verifier is None:
+        verifier = make_fallback_verifier()
+
+    # Only rows sharing manufacturer, size bucket and enough name bigrams go to the fuzzy scorer
+    if candidate_index is None:
+        candidate_index = CandidateIndex(internal)
+
+    with stage_timer('dedupe', len(external), timings):
+        if dedupe:
+            groups, first_positions = duplicate_groups(external)
+        else:
+            groups = first_positions = np.arange(len(external))
+        # The rows of key g are order[bounds[g]:bounds[g + 1]]
+        order = np.argsort(groups, kind='stable')
+        bounds = np.searchsorted(groups[order], np.arange(len(first_positions) + 1))
+    all_external_names = external['original_name'].tolist()
+    internal_names = internal['original_name'].tolist()
+
+    def copy_names(group):
+        return list(dict.fromkeys(all_external_names[position] for position in order[bounds[group]:bounds[group + 1]]))
+
+    # Each unique key's (rule match, best match), in group order, and the verdict for each (key, External name)
+    results = []
+    fallback_verdicts = {}
+    emitted = 0
+    fallback_pairs_total = 0
+    for start in range(0, len(first_positions), batch_size):
+        positions = first_positions[start:start + batch_size]
+        batch = external.iloc[positions]
+        batch_vectors = external_vectors[positions] if external_vectors is not None else None
+        if progress:
+            progress.stage('rules', len(batch))
+        with stage_timer('rules', len(batch), timings):
+            rule_matches = rule_match_all(batch, internal, candidate_index, workers, progress)
+
+        # Score every row the rules left unmatched in one batched pass
+        unmatched_rows = [i for i, position in enumerate(rule_matches) if position is None]
+        best_matches = {}
+        if progress:
+            progress.stage('semantic', len(unmatched_rows))
+        with stage_timer('semantic', len(unmatched_rows), timings):
+            if unmatched_rows:
+                if batch_vectors is not None:
+                    external_matrix = np.asarray(batch_vectors[unmatched_rows], dtype=np.float32)
+                else:
+                    external_matrix = normalize_embeddings(batch['embedding'].values[unmatched_rows])
+                top_indices, top_scores = index.search(external_matrix, k=1)
+                for i, best_index, best_score in zip(unmatched_rows, top_indices[:, 0], top_scores[:, 0]):
+                    best_matches[i] = (int(best_index), float(best_score))
+                if progress:
+                    progress.advance(len(unmatched_rows))
+
+        # Verify all of the batch's uncertain semantic matches with the LLM at once. The prompt shows
+        # the External name, so each distinct name among a key's copies gets its own verdict
+        fallback_keys = [(start + i, name) for i, (_, score) in best_matches.items() if threshold <= score <= 0.97
+                         for name in copy_names(start + i)]
+        fallback_pairs = [(name, internal_names[best_matches[group - start][0]]) for group, name in fallback_keys]
+        if progress:
+            progress.stage('fallback', len(fallback_pairs))
+        with stage_timer('fallback', len(fallback_pairs), timings):
+            fallback_verdicts.update(zip(fallback_keys, verifier.verify_pairs(
+                fallback_pairs, progress.advance if progress else None
+            )))
+        results.extend((rule_match, best_matches.get(i)) for i, rule_match in enumerate(rule_matches))
+        fallback_pairs_total += len(fallback_pairs)
+
+        # Every row up to the next unmatched key's first copy now has its result
+        end = first_positions[start + batch_size] if start + batch_size < len(first_positions) else len(external)
+        records, row_rule_matches, row_best_matches = [], [], {}
+        if progress:
+            progress.stage('assembly', end - emitted)
+        with stage_timer('assembly', end - emitted, timings):
+            for i, position in enumerate(range(emitted, end)):
+                if progress:
+                    progress.advance()
+                group, external_name = groups[position], all_external_names[position]
+                rule_match, best_match = results[group]
+                records.append(match_record(external_name, rule_match, best_match,
+                                            fallback_verdicts.get((group, external_name)), internal_names, threshold))
+                row_rule_matches.append(rule_match)
+                if best_match is not None:
+                    row_best_matches[i] = best_match
+        emitted = end
+        for method, count in Counter(record['Method'] for record in records).items():
+            MATCHES.inc(count, method=method)
+        yield records, row_rule_matches, row_best_matches
+
+    blocking_stats = candidate_index.stats()
+    if stats is not None:
+        stats['dedupe'] = {'rows': len(external), 'unique': len(first_positions)}
+        stats['blocking'] = blocking_stats
+        stats['fallback'] = {'pairs': fallback_pairs_total, **verifier.stats()}
+
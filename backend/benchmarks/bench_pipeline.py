@@ -0,0 +1,161 @@
+"""End-to-end matcher benchmark on synthetic catalogs, with no network access.
+
+    python benchmarks/bench_pipeline.py --rows 10000 --output benchmarks/results/10k.json
+    python benchmarks/bench_pipeline.py --rows 10000 --baseline benchmarks/results/10k.json
+
+Generates catalogs with known truth (see synthetic_catalog.py), then runs
+preprocess_file (preprocess_data plus embedding persistence),
+run_matching_pipeline and calculate_accuracy on them. Embeddings come from the
+local hashing provider and the LLM fallback from a naive rule, so repeated
+runs are comparable. Reports rows per second per stage, peak memory and
+accuracy as JSON. With --baseline, stages that got slower or an accuracy that
+dropped beyond the tolerances are reported and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.AccuracyCheck import calculate_accuracy  # noqa: E402
+from app.EmbeddingDispatcher import EmbeddingDispatcher  # noqa: E402
+from app.EmbeddingIndex import load_or_build_index  # noqa: E402
+from app.EmbeddingProvider import HashingProvider  # noqa: E402
+from app.EmbeddingStore import EmbeddingStore  # noqa: E402
+from app.FallbackVerifier import FallbackVerifier  # noqa: E402
+from app.Preprocess import preprocess_file, peak_rss_mb  # noqa: E402
+from app.mapper import run_matching_pipeline  # noqa: E402
+from synthetic_catalog import write_catalogs  # noqa: E402
+
+
+def naive_verify(external_name, internal_name):
+    """Fallback stand-in: same first word and the same numbers."""
+    first = lambda name: name.lower().split()[:1]  # noqa: E731
+    numbers = lambda name: sorted(re.findall(r"\d+(?:\.\d+)?", name))  # noqa: E731
+    return first(external_name) == first(internal_name) and numbers(external_name) == numbers(internal_name)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def throughput(rows, seconds):
+    return {'rows': rows, 'seconds': round(seconds, 3), 'rows_per_second': round(rows / seconds, 1) if seconds else None}
+
+
+def run_benchmark(workdir, rows, internal_rows=None, match_rate=0.8, seed=0, chunk_size=50000, index='exact',
+                  workers=1, fallback_concurrency=8, dimensions=256, embedding_concurrency=4):
+    start = time.perf_counter()
+    internal_file, external_file, truth_file = write_catalogs(workdir, rows, internal_rows, match_rate, seed)
+    stages = {'generate': {'seconds': round(time.perf_counter() - start, 3)}}
+
+    # Preprocess and embed both catalogs the way /preprocess does
+    provider = HashingProvider(dimensions)
+    dispatcher = EmbeddingDispatcher.for_provider(provider, embedding_concurrency)
+    stores = {}
+    for name, path, column in (('external', external_file, 'PRODUCT_NAME'), ('internal', internal_file, 'LONG_NAME')):
+        stores[name] = os.path.join(workdir, f"{name.title()}_Embeddings.npy")
+        stats = preprocess_file(path, column, os.path.join(workdir, f"Processed_{name.title()}.csv"), stores[name],
+                                chunk_size, dispatcher=dispatcher)
+        stages[f"preprocess_{name}"] = {**throughput(stats['rows'], stats['seconds']), 'timings': stats['timings']}
+
+    # Match
+    start = time.perf_counter()
+    external_store, internal_store = EmbeddingStore(stores['external']), EmbeddingStore(stores['internal'])
+    matcher_index = load_or_build_index(stores['internal'], internal_store, backend=index)
+    match_stats = {}
+    matches = run_matching_pipeline(external_store.frame, internal_store.frame, threshold=0.8, stats=match_stats,
+                                    index=matcher_index, verifier=FallbackVerifier(naive_verify, concurrency=fallback_concurrency),
+                                    external_vectors=external_store.matrix, workers=workers)
+    results_file = os.path.join(workdir, 'Matched_Results.csv')
+    matches.to_csv(results_file, index=False)
+    stages['match'] = {
+        **throughput(len(external_store), time.perf_counter() - start),
+        'timings': match_stats['timings'],
+        'dedupe': match_stats['dedupe'],
+        'blocking': match_stats['blocking'],
+        'fallback': match_stats['fallback']
+    }
+
+    # Grade against the ground truth
+    start = time.perf_counter()
+    accuracy = calculate_accuracy(results_file, truth_file)
+    if 'error' in accuracy:
+        raise RuntimeError(accuracy['error'])
+    stages['accuracy'] = throughput(len(matches), time.perf_counter() - start)
+
+    return {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'params': {'rows': rows, 'internal_rows': internal_rows or rows, 'match_rate': match_rate, 'seed': seed,
+                   'chunk_size': chunk_size, 'index': index, 'workers': workers, 'embedding_model': provider.name},
+        'stages': stages,
+        'peak_rss_mb': peak_rss_mb(),
+        'accuracy': accuracy['accuracy'],
+        'precision': accuracy['precision'],
+        'recall': accuracy['recall'],
+        'by_method': accuracy.get('by_method')
+    }
+
+
+def regressions(report, baseline, slowdown=0.10, accuracy_drop=0.5):
+    """Stages more than slowdown slower than the baseline, and an accuracy drop of more than accuracy_drop points."""
+    found = []
+    for stage, current in report['stages'].items():
+        before = baseline['stages'].get(stage, {}).get('rows_per_second')
+        now = current.get('rows_per_second')
+        if before and now and now < before * (1 - slowdown):
+            found.append(f"{stage}: {now:,.0f} rows/s, baseline {before:,.0f} ({now / before - 1:+.1%})")
+    if report['accuracy'] < baseline['accuracy'] - accuracy_drop:
+        found.append(f"accuracy: {report['accuracy']}%, baseline {baseline['accuracy']}%")
+    return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark preprocessing, matching and grading end to end.')
+    parser.add_argument('--rows', type=int, default=10000, help='External rows, 1k to 1M')
+    parser.add_argument('--internal-rows', type=int, help='Internal rows (default: same as --rows)')
+    parser.add_argument('--match-rate', type=float, default=0.8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--index', default='exact', choices=['exact', 'ivf'])
+    parser.add_argument('--workers', type=int, default=1, help='Processes for the rule pass')
+    parser.add_argument('--dimensions', type=int, default=256, help='Hashing provider output dimensions')
+    parser.add_argument('--workdir', help='Keep the generated catalogs and outputs here (default: a temp dir)')
+    parser.add_argument('--output', help='Write the JSON report here')
+    parser.add_argument('--baseline', help='Earlier JSON report to compare against')
+    parser.add_argument('--max-slowdown', type=float, default=0.10, help='Tolerated throughput loss per stage')
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.5, help='Tolerated accuracy loss, in points')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        workdir = args.workdir or temp_dir
+        report = run_benchmark(workdir, args.rows, args.internal_rows, args.match_rate, args.seed, args.chunk_size,
+                               args.index, args.workers, dimensions=args.dimensions)
+
+    print(json.dumps(report, indent=4))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        found = regressions(report, baseline, args.max_slowdown, args.max_accuracy_drop)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (revision {baseline.get('revision')})")
@@ -0,0 +1,97 @@
+"""Throughput of preprocess_data, and a byte-for-byte check against the row-wise version.
+
+    python benchmarks/bench_preprocess.py --rows 1000000
+    python benchmarks/bench_preprocess.py --reference uploads/Data_External.csv --column PRODUCT_NAME
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.Preprocess import preprocess_data  # noqa: E402
+
+
+def legacy_preprocess_data(df, name_column):
+    """The row-wise preprocess_data this module replaced, kept as the reference output."""
+    df['original_name'] = df[name_column]
+    df[name_column] = df[name_column].str.lower()
+    df[name_column] = df[name_column].str.replace(r"[^\w\s./-]", "", regex=True).str.strip()
+    abbreviation_map = {
+        "choc.": "chocolate",
+        "strwbr.": "strawberry",
+        "eng.": "energy",
+        "pb": "peanut butter",
+        "oz": "oz",
+        "lb": "lb",
+        "g": "g",
+        "ml": "ml"
+    }
+
+    def expand_abbreviations(text):
+        for abbr, full in abbreviation_map.items():
+            text = re.sub(rf"\b{abbr}\b", full, text)
+        return text
+
+    df[name_column] = df[name_column].apply(expand_abbreviations)
+    stop_words = {'and', 'with', 'the'}
+    df[name_column] = df[name_column].apply(lambda x: " ".join([word for word in x.split() if word not in stop_words]))
+    df['size'] = df[name_column].str.extract(r"(\d+(\.\d+)?)(?=\s?(oz|g|ml|lb)\b)", expand=False)[0].astype(float, errors='ignore')
+    df['unit'] = df[name_column].str.extract(r"(?i)(\boz\b|\bg\b|\bml\b|\blb\b)", expand=False).fillna('')
+    df['size'] = df.apply(lambda row: row['size'] if pd.notna(row['size']) else 0, axis=1)
+    df['manufacturer'] = df[name_column].str.split().str[0].fillna('')
+    df['cleaned_name'] = df[name_column].str.replace(r"(?i)\b(?:oz|g|ml|lb)\b", "", regex=True).str.strip()
+    df = df[df[name_column].notna()]
+    return df
+
+
+def synthetic_names(rows, seed=0):
+    """Product names exercising abbreviations, stop words, punctuation and sizes."""
+    rng = random.Random(seed)
+    brands = ['Quest', 'Clif', 'KIND', '5-Hour', 'Monster', 'Pure Protein', 'RXBAR', 'Nature Valley', 'PB&J Co.']
+    flavors = ['Choc. Chip', 'choc pb', 'Strwbr. Banana', 'Eng. Berry', 'PB Cup', 'Cookies and Cream',
+               'Vanilla with Almonds', 'The Original', 'Sea Salt  Caramel', 'chocs', 'eng-blast']
+    sizes = ['1.9oz', '2.1 oz', '12 OZ', '50g', '16 fl oz', '473ml', '1 lb', '', '3.52 Oz.']
+    return [
+        f"{rng.choice(brands)} {rng.choice(flavors)} {rng.choice(['', 'Bar', 'Bars', '(12 ct)', '- Xtra!'])} {rng.choice(sizes)}"
+        for _ in range(rows)
+    ]
+
+
+def run(names, column):
+    frame = pd.DataFrame({column: names})
+    start = time.perf_counter()
+    result = preprocess_data(frame, column)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark preprocess_data.')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--reference', help='CSV whose names are used for the byte-identity check')
+    parser.add_argument('--column', default='PRODUCT_NAME')
+    parser.add_argument('--check-rows', type=int, default=100000, help='Rows compared against the legacy version')
+    args = parser.parse_args()
+
+    if args.reference:
+        names = pd.read_csv(args.reference)[args.column].tolist()
+    else:
+        names = synthetic_names(args.rows)
+
+    sample = names[:args.check_rows]
+    expected = legacy_preprocess_data(pd.DataFrame({args.column: sample}), args.column)
+    actual, _ = run(sample, args.column)
+    identical = expected.to_csv(index=False) == actual.to_csv(index=False)
+    print(f"Byte-identical to legacy output on {len(sample)} rows: {identical}")
+
+    start = time.perf_counter()
+    legacy_preprocess_data(pd.DataFrame({args.column: sample}), args.column)
+    legacy_seconds = time.perf_counter() - start
+
+    _, seconds = run(names, args.column)
+    print(f"legacy:     {len(sample) / legacy_seconds:,.0f} rows/s ({len(sample)} rows)")
+    print(f"vectorized: {len(names) / seconds:,.0f} rows/s ({len(names)} rows)")
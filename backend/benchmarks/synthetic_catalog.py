@@ -0,0 +1,157 @@
+"""Synthetic internal/external product catalogs with known ground truth.
+
+    python benchmarks/synthetic_catalog.py --rows 100000 --output-dir /tmp/catalogs
+
+Internal rows are canonical names ("Quest Chocolate Chip Protein Bar 2.12
+oz"). Most external rows are noisy renderings of one of them: abbreviated
+flavors, other casing, glued or dotted units, stop words, pack counts,
+dropped form words. The rest have no true match, and half of those differ
+from a real product only by size. The same seed always gives the same
+catalogs.
+"""
+import argparse
+import os
+import random
+import pandas as pd
+
+BRANDS = ['Quest', 'Clif', 'KIND', 'Monster', 'Pure Protein', 'RXBAR', 'Nature Valley', 'Larabar', 'Oreo',
+          'Gatorade', 'Celsius', 'Hershey', 'Kellogg', 'Ghost']
+SYLLABLES = ['va', 'lo', 'zen', 'ka', 'ri', 'mo', 'tru', 'vi', 'na', 'po', 'lux', 'be', 'ta', 'sol', 'mi', 'ro']
+FLAVORS = ['Chocolate Chip', 'Strawberry Banana', 'Peanut Butter', 'Cookies and Cream', 'Sea Salt Caramel',
+           'Blueberry', 'Vanilla Almond', 'Mint Chocolate', 'Energy Berry', 'Lemon Lime', 'Tropical Punch',
+           'Coconut', 'Peanut Butter Chocolate', 'Strawberry']
+LINES = ['', 'Original', 'Zero Sugar', 'Keto', 'Mini', 'Organic', 'Crunch', 'Classic', 'Protein Plus', 'Lite']
+# Form and the sizes it is sold in
+FORMS = {
+    'Protein Bar': [(1.9, 'oz'), (2.12, 'oz'), (60, 'g'), (45, 'g')],
+    'Bar': [(1.4, 'oz'), (1.52, 'oz'), (40, 'g')],
+    'Energy Drink': [(12, 'oz'), (16, 'oz'), (473, 'ml'), (250, 'ml')],
+    'Snack Bites': [(5, 'oz'), (7.5, 'oz'), (200, 'g')],
+    'Cookies': [(14.3, 'oz'), (1, 'lb'), (300, 'g')],
+    'Shake': [(11, 'oz'), (325, 'ml')],
+}
+# Shorthand external feeds use; the preprocessing tables expand these back
+ABBREVIATIONS = {'Chocolate': 'Choc.', 'Strawberry': 'Strwbr.', 'Energy': 'Eng.', 'Peanut Butter': 'PB'}
+STOP_WORDS = ['and', 'with', 'the']
+
+
+def brand_pool(rows, seed=0):
+    """The fixed brands plus invented ones, about one brand per 500 catalog rows."""
+    rng = random.Random(seed)
+    brands = list(BRANDS)
+    seen = {brand.lower() for brand in brands}
+    while len(brands) < max(len(BRANDS), rows // 500):
+        brand = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+        if brand.lower() not in seen:
+            seen.add(brand.lower())
+            brands.append(brand)
+    return brands
+
+
+def format_size(size):
+    return f"{size:g}"
+
+
+def random_product(rng, brands):
+    form = rng.choice(list(FORMS))
+    size, unit = rng.choice(FORMS[form])
+    return rng.choice(brands), rng.choice(LINES), rng.choice(FLAVORS), form, size, unit
+
+
+def canonical_name(product):
+    brand, line, flavor, form, size, unit = product
+    return " ".join(part for part in (brand, line, flavor, form, format_size(size), unit) if part)
+
+
+def noisy_name(product, rng):
+    """An external feed's rendering of a product."""
+    brand, line, flavor, form, size, unit = product
+    if rng.random() < 0.5:
+        for word, short in ABBREVIATIONS.items():
+            flavor = flavor.replace(word, short)
+    words = [brand, line, flavor]
+    if rng.random() < 0.7:
+        words.append(form)
+    if rng.random() < 0.2:
+        words.insert(rng.randint(1, len(words)), rng.choice(STOP_WORDS))
+    size_text = rng.choice([f"{format_size(size)}{unit}", f"{format_size(size)} {unit}",
+                            f"{format_size(size)} {unit.upper()}", f"{format_size(size)} {unit.title()}."])
+    words.append(size_text)
+    if rng.random() < 0.15:
+        words.append(rng.choice(['(12 ct)', '- Xtra!', 'Value Pack', '6pk']))
+    name = " ".join(word for word in words if word)
+    casing = rng.random()
+    if casing < 0.2:
+        name = name.upper()
+    elif casing < 0.35:
+        name = name.lower()
+    return name
+
+
+def generate_catalogs(rows, internal_rows=None, match_rate=0.8, seed=0):
+    """(internal, external, truth) frames.
+
+    internal has a LONG_NAME column and external a PRODUCT_NAME column, as
+    the upload step expects. truth lists each external name, in order, with
+    its true internal name or NULL, the layout calculate_accuracy grades
+    against.
+    """
+    internal_rows = internal_rows or rows
+    rng = random.Random(seed)
+    brands = brand_pool(internal_rows, seed)
+
+    products = {}
+    attempts = 0
+    while len(products) < internal_rows:
+        product = random_product(rng, brands)
+        products.setdefault(canonical_name(product), product)
+        attempts += 1
+        if attempts > internal_rows * 50:
+            raise ValueError(f"Could not generate {internal_rows} distinct products; add brands or flavors.")
+    catalog = list(products.values())
+
+    external_names, truth = [], []
+    for _ in range(rows):
+        if rng.random() < match_rate:
+            product = rng.choice(catalog)
+            truth.append(canonical_name(product))
+        else:
+            # No true match: half are a catalog product in a size it is not sold in, half are new products
+            while True:
+                if rng.random() < 0.5:
+                    brand, line, flavor, form, _, _ = rng.choice(catalog)
+                    size, unit = rng.choice(FORMS[form])
+                    product = (brand, line, flavor, form, round(size * rng.choice([2, 3, 0.5]), 2), unit)
+                else:
+                    product = random_product(rng, brands)
+                if canonical_name(product) not in products:
+                    break
+            truth.append('NULL')
+        external_names.append(noisy_name(product, rng))
+
+    internal = pd.DataFrame({'LONG_NAME': list(products)})
+    external = pd.DataFrame({'PRODUCT_NAME': external_names})
+    truth = pd.DataFrame({'External': external_names, 'Internal': truth})
+    return internal, external, truth
+
+
+def write_catalogs(output_dir, rows, internal_rows=None, match_rate=0.8, seed=0):
+    """Write Data_Internal.csv, Data_External.csv and Ground_Truth.csv; returns their paths."""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [os.path.join(output_dir, name) for name in ('Data_Internal.csv', 'Data_External.csv', 'Ground_Truth.csv')]
+    for frame, path in zip(generate_catalogs(rows, internal_rows, match_rate, seed), paths):
+        frame.to_csv(path, index=False)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate synthetic catalogs with ground truth.')
+    parser.add_argument('--rows', type=int, default=10000, help='External rows')
+    parser.add_argument('--internal-rows', type=int, help='Internal rows (default: same as --rows)')
+    parser.add_argument('--match-rate', type=float, default=0.8, help='Share of external rows with a true match')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', default='.')
+    args = parser.parse_args()
+
+    for path in write_catalogs(args.output_dir, args.rows, args.internal_rows, args.match_rate, args.seed):
+        print(path)
@@ -0,0 +1,49 @@
+"""Shared fixtures: small synthetic catalogs, embedded locally, and an offline fallback verifier."""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, os.path.join(BACKEND, 'benchmarks'))
+
+from app.EmbeddingDispatcher import EmbeddingDispatcher  # noqa: E402
+from app.EmbeddingIndex import ExactIndex, normalize_embeddings  # noqa: E402
+from app.EmbeddingProvider import HashingProvider  # noqa: E402
+from app.FallbackVerifier import FallbackVerifier  # noqa: E402
+from app.Preprocess import compute_embeddings, preprocess_data  # noqa: E402
+from synthetic_catalog import generate_catalogs  # noqa: E402
+
+
+def embed(frame, name_column):
+    dispatcher = EmbeddingDispatcher.for_provider(HashingProvider(), 1)
+    embedded, _ = compute_embeddings(preprocess_data(frame, name_column), 'original_name', 'cleaned_name',
+                                     dispatcher=dispatcher)
+    return embedded.reset_index(drop=True)
+
+
+def punctuation_verify(external_name, internal_name):
+    """Fallback stand-in that reads the raw text: same first word, and no '!' after the external name."""
+    return external_name.lower().split()[:1] == internal_name.lower().split()[:1] and not external_name.endswith('!')
+
+
+@pytest.fixture
+def verifier():
+    return FallbackVerifier(punctuation_verify)
+
+
+@pytest.fixture(scope='session')
+def catalogs():
+    """(internal, external, index) for 300 internal products and 400 external rows.
+
+    Every external name also appears upper-cased and with a trailing '!',
+    which normalize to the same key; the '!' reads differently to the verifier.
+    """
+    internal, external, _ = generate_catalogs(400, internal_rows=300, seed=3)
+    names = external['PRODUCT_NAME']
+    external = pd.DataFrame({'PRODUCT_NAME': pd.concat([names, names.str.upper(), names + '!'], ignore_index=True)})
+    internal = embed(internal, 'LONG_NAME')
+    external = embed(external, 'PRODUCT_NAME')
+    return internal, external, ExactIndex(normalize_embeddings(internal['embedding'].values))
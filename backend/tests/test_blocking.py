@@ -0,0 +1,20 @@
+from app.Blocking import CandidateIndex
+from app.mapper import rule_based_match, rule_match_all
+
+
+def brute_force_rule_matches(external, internal):
+    """The first internal row each external row rule-matches, trying every pair."""
+    internal_rows = internal.to_dict(orient='records')
+    return [next((position for position, internal_row in enumerate(internal_rows)
+                  if rule_based_match(external_row, internal_row)), None)
+            for external_row in external.to_dict(orient='records')]
+
+
+def test_blocking_finds_the_brute_force_matches(catalogs):
+    internal, external, _ = catalogs
+    external = external.iloc[:400]
+    candidate_index = CandidateIndex(internal)
+    rule_matches = rule_match_all(external, internal, candidate_index)
+    assert rule_matches == brute_force_rule_matches(external, internal)
+    assert any(position is not None for position in rule_matches)
+    assert candidate_index.stats()['pairs_candidates'] < len(external) * len(internal)
@@ -0,0 +1,89 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import openai
+import pytest
+
+from app.FallbackVerifier import VerdictCache
+from app.mapper import make_fallback_verifier
+
+TOOLS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools')
+sys.path.insert(0, TOOLS)
+from stub_openai_server import stub_verdict  # noqa: E402
+
+PAIRS = [
+    ("Coca Cola 12 oz", "Coca Cola Classic 12 oz"),
+    ("Coca Cola 12 oz", "Coca Cola 20 oz"),
+    ("Lays Classic 8 oz", "Lays Classic Chips 8 oz"),
+    ("Lays Classic 8 oz", "Doritos Nacho 8 oz"),
+    ("Monster Energy 16 oz", "Monster Energy Ultra 16 oz"),
+    ("Red Bull 8.4 oz", "Red Bull Sugarfree 12 oz"),
+    ("Oreo 14.3 oz", "Oreo Double Stuf 14.3 oz"),
+]
+
+
+@pytest.fixture(scope='module')
+def stub_server():
+    """URL of tools/stub_openai_server.py running on a free port, with the openai client pointed at it."""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    server = subprocess.Popen([sys.executable, os.path.join(TOOLS, 'stub_openai_server.py'),
+                               '--port', str(port)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while True:
+        try:
+            urllib.request.urlopen(f"{url}/stats")
+            break
+        except OSError:
+            if time.time() > deadline or server.poll() is not None:
+                server.kill()
+                raise RuntimeError('The stub OpenAI server did not start')
+            time.sleep(0.1)
+
+    previous = openai.api_base, openai.api_key
+    openai.api_base, openai.api_key = f"{url}/v1", 'stub'
+    yield url
+    openai.api_base, openai.api_key = previous
+    server.terminate()
+    server.wait()
+
+
+def server_requests(url):
+    with urllib.request.urlopen(f"{url}/stats") as response:
+        return json.load(response)['requests']
+
+
+def test_packed_prompts_answer_every_pair(stub_server):
+    verifier = make_fallback_verifier(concurrency=2, pack_size=3)
+    before = server_requests(stub_server)
+    verdicts = verifier.verify_pairs(PAIRS)
+    assert verdicts == [stub_verdict(*pair) == 'Yes' for pair in PAIRS]
+    assert any(verdicts) and not all(verdicts)
+    # Seven pairs in prompts of three
+    assert verifier.stats() == {'llm_calls': 3, 'cache_hits': 0}
+    assert server_requests(stub_server) - before == 3
+
+
+def test_cached_verdicts_are_not_sent_again(stub_server, tmp_path):
+    # Repeats, even with other spacing and case, are one pair
+    pairs = PAIRS + [PAIRS[0], ("COCA  cola 12 OZ", "coca cola classic 12 oz")]
+    with VerdictCache(str(tmp_path / 'verdicts.sqlite')) as cache:
+        first = make_fallback_verifier(cache)
+        verdicts = first.verify_pairs(pairs)
+        assert first.stats() == {'llm_calls': len(PAIRS), 'cache_hits': 0}
+
+    with VerdictCache(str(tmp_path / 'verdicts.sqlite')) as cache:
+        before = server_requests(stub_server)
+        second = make_fallback_verifier(cache, pack_size=4)
+        settled = []
+        assert second.verify_pairs(pairs, on_progress=settled.append) == verdicts
+        assert second.stats() == {'llm_calls': 0, 'cache_hits': len(PAIRS)}
+        assert settled == [len(pairs)]
+        assert server_requests(stub_server) == before
@@ -0,0 +1,37 @@
+import pandas as pd
+
+from app.EmbeddingIndex import ExactIndex, normalize_embeddings
+from app.IncrementalMatch import run_incremental_matching
+from app.mapper import run_matching_pipeline
+
+SETTINGS = {'prompt_version': 'test', 'index': 'exact', 'embedding_model': 'hashing'}
+
+
+def incremental_run(external, internal, state_file, verifier, stats=None):
+    # Frames loaded from an EmbeddingStore have no embedding column, only the matrices
+    external_matrix = normalize_embeddings(external['embedding'].values)
+    internal_matrix = normalize_embeddings(internal['embedding'].values)
+    return run_incremental_matching(external.drop(columns='embedding'), internal.drop(columns='embedding'),
+                                    external_matrix, internal_matrix, state_file, SETTINGS, stats=stats,
+                                    verifier=verifier)
+
+
+def test_incremental_run_matches_a_full_run(catalogs, verifier, tmp_path):
+    internal, external, _ = catalogs
+    state_file = str(tmp_path / 'Match_State.parquet')
+    first = {}
+    incremental_run(external.iloc[:1000].reset_index(drop=True), internal.iloc[:270].reset_index(drop=True),
+                    state_file, verifier, first)
+    assert first['incremental']['full_run_reason'] == 'no previous run'
+
+    # Drop external and internal rows, and add new ones to both
+    external = external.iloc[100:].reset_index(drop=True)
+    internal = internal.iloc[20:].reset_index(drop=True)
+    stats = {}
+    incremental = incremental_run(external, internal, state_file, verifier, stats)
+    assert stats['incremental']['full_run_reason'] is None
+    assert 0 < stats['incremental']['carried_forward'] < len(external)
+
+    index = ExactIndex(normalize_embeddings(internal['embedding'].values))
+    full = run_matching_pipeline(external, internal, index=index, verifier=verifier)
+    pd.testing.assert_frame_equal(incremental, full)
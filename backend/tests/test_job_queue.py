@@ -0,0 +1,80 @@
+import sqlite3
+import threading
+import time
+
+from app.JobQueue import FINISHED_STATUSES, JobQueue
+
+
+def wait_for(queue, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in FINISHED_STATUSES:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_job_runs_from_queued_to_succeeded(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+    started, release = threading.Event(), threading.Event()
+
+    def job(progress, rows):
+        started.set()
+        release.wait()
+        progress.stage('counting', total=rows)
+        progress.advance(rows)
+        return {'rows': rows}
+
+    blocked = queue.submit('test', job, 5)
+    # The single worker is busy, so the next job waits its turn
+    waiting = queue.submit('test', job, 7)
+    started.wait()
+    assert queue.get(blocked)['status'] == 'running'
+    assert queue.get(waiting)['status'] == 'queued'
+
+    release.set()
+    first, second = wait_for(queue, blocked), wait_for(queue, waiting)
+    queue.close()
+    assert (first['status'], first['result'], first['error']) == ('succeeded', {'rows': 5}, None)
+    assert second['result'] == {'rows': 7}
+    assert second['rows_processed'] == 7 and 'counting' in second['stage_timings']
+    assert second['elapsed_seconds'] is not None and second['eta_seconds'] is None
+
+
+def test_job_failure_keeps_the_error(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+
+    def job(progress):
+        progress.stage('reading')
+        raise ValueError("Column 'LONG_NAME' is missing")
+
+    job = wait_for(queue, queue.submit('test', job))
+    queue.close()
+    assert job['status'] == 'failed'
+    assert job['error'] == "Column 'LONG_NAME' is missing"
+    assert job['result'] is None and job['stage'] == 'reading'
+
+
+def test_restart_fails_unfinished_jobs(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    queue = JobQueue(path)
+    done = wait_for(queue, queue.submit('test', lambda progress: {'ok': True}))
+    queue.close()
+
+    # Jobs a killed server left behind
+    connection = sqlite3.connect(path)
+    connection.executemany("INSERT INTO jobs (id, kind, status, created) VALUES (?, 'match', ?, ?)",
+                           [('queued-job', 'queued', time.time()), ('running-job', 'running', time.time())])
+    connection.commit()
+    connection.close()
+
+    queue = JobQueue(path)
+    for job_id in ('queued-job', 'running-job'):
+        job = queue.get(job_id)
+        assert job['status'] == 'failed'
+        assert job['error'] == 'Interrupted by a server restart'
+        assert job['finished'] is not None
+    assert queue.get(done['id'])['status'] == 'succeeded'
+    assert queue.get('unknown') is None
+    queue.close()
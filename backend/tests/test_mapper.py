@@ -0,0 +1,40 @@
+import pandas as pd
+
+from app.mapper import duplicate_groups, iter_matching_pipeline, run_matching_pipeline
+
+
+def assert_same_matches(left, right):
+    # Scores come from float32 matrix products, whose last bits depend on how many rows are searched at once
+    pd.testing.assert_frame_equal(left, right, check_exact=False, atol=1e-6)
+
+
+def test_dedupe_matches_as_without(catalogs, verifier):
+    internal, external, index = catalogs
+    stats = {}
+    deduped = run_matching_pipeline(external, internal, stats=stats, index=index, verifier=verifier)
+    plain = run_matching_pipeline(external, internal, index=index, verifier=verifier, dedupe=False)
+    assert stats['dedupe']['unique'] < len(external)
+    assert_same_matches(deduped, plain)
+
+    # The '!' copies read differently to the verifier, so some keys get more than one verdict
+    groups, _ = duplicate_groups(external)
+    methods = deduped.groupby(groups)['Method'].nunique()
+    assert (methods > 1).any()
+
+
+def test_batches_match_one_pass(catalogs, verifier):
+    internal, external, index = catalogs
+    whole = run_matching_pipeline(external, internal, index=index, verifier=verifier)
+    batches = list(iter_matching_pipeline(external, internal, index=index, verifier=verifier, batch_size=37))
+    assert len(batches) > 1
+    assert_same_matches(pd.DataFrame([record for batch in batches for record in batch]), whole)
+
+
+def test_workers_match_one_process(catalogs, verifier):
+    internal, external, index = catalogs
+    serial_stats, sharded_stats = {}, {}
+    serial = run_matching_pipeline(external, internal, stats=serial_stats, index=index, verifier=verifier)
+    sharded = run_matching_pipeline(external, internal, stats=sharded_stats, index=index, verifier=verifier,
+                                    workers=2)
+    assert_same_matches(sharded, serial)
+    assert sharded_stats['blocking'] == serial_stats['blocking']
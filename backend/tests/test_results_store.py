@@ -0,0 +1,107 @@
+import os
+
+import pandas as pd
+import pytest
+
+from app.ResultsStore import RESULT_COLUMNS, ResultsStore, ResultsWriter
+
+METHODS = ['Rule-Based', 'Semantic', 'Fallback', 'No Match']
+
+
+def match_records(count):
+    """Results rows cycling through every Method; unmatched rows have no score."""
+    records = []
+    for i in range(count):
+        method = METHODS[i % len(METHODS)]
+        records.append({
+            'External': f"external {i}", 'Internal': "" if method == 'No Match' else f"internal {i}",
+            'Method': method, 'Semantic Score': "" if method == 'No Match' else round(i / count, 4),
+            'Fallback_Internal': "", 'Fallback_Semantic_Score': "",
+        })
+    return records
+
+
+def all_pages(store, limit, **filters):
+    records, cursor = [], None
+    while True:
+        page, cursor, total = store.page(cursor=cursor, limit=limit, **filters)
+        records.extend(page)
+        if cursor is None:
+            return records, total
+
+
+def test_cursor_and_offset_pages_follow_the_filters(tmp_path):
+    results_file = tmp_path / 'Mapped_Products.csv'
+    pd.DataFrame(match_records(250), columns=RESULT_COLUMNS).to_csv(results_file, index=False)
+    store = ResultsStore.open(str(results_file), str(tmp_path / 'Mapped_Products.db'))
+    expected = pd.read_csv(results_file, dtype=str, keep_default_na=False)
+    scores = pd.to_numeric(expected['Semantic Score'])
+
+    for filters, mask in [
+        ({}, pd.Series(True, index=expected.index)),
+        ({'method': 'Semantic'}, expected['Method'] == 'Semantic'),
+        ({'min_score': 0.25, 'max_score': 0.5}, scores.between(0.25, 0.5)),
+        ({'method': 'Fallback', 'min_score': 0.5}, (expected['Method'] == 'Fallback') & (scores >= 0.5)),
+    ]:
+        records, total = all_pages(store, 17, **filters)
+        assert total == mask.sum()
+        assert [record['External'] for record in records] == list(expected.loc[mask, 'External'])
+
+        page, _, _ = store.page(offset=20, limit=10, **filters)
+        assert [record['External'] for record in page] == list(expected.loc[mask, 'External'][20:30])
+
+    # The records are those /view-mapped returned from the CSV, missing values as ""
+    first = store.page(limit=4)[0]
+    assert first[3]['Internal'] == "" and first[3]['Semantic Score'] == ""
+    assert first[1]['Semantic Score'] == 0.004
+    records, next_cursor, _ = store.page(limit=10 ** 6)
+    assert len(records) == 250 and next_cursor is None
+
+
+def write_previous_results(tmp_path):
+    results_file, path = str(tmp_path / 'Mapped_Products.csv'), str(tmp_path / 'Mapped_Products.db')
+    pd.DataFrame(match_records(5), columns=RESULT_COLUMNS).to_csv(results_file, index=False)
+    ResultsStore.open(results_file, path)
+    return results_file, path
+
+
+def test_writer_close_swaps_in_the_live_store(tmp_path):
+    results_file, path = write_previous_results(tmp_path)
+    records = match_records(30)
+    with ResultsWriter(results_file, path) as writer:
+        writer.write(records[:20])
+        # Readers see the rows written so far while the previous results stay in place
+        live = ResultsStore.live(path)
+        assert live.status() == 'running'
+        assert live.page(limit=100)[2] == 20
+        assert ResultsStore(path).page(limit=100)[2] == 5
+        writer.write(records[20:])
+
+    assert ResultsStore.live(path) is None
+    assert sorted(os.listdir(tmp_path)) == ['Mapped_Products.csv', 'Mapped_Products.db']
+    store = ResultsStore.open(results_file, path)
+    assert store.is_complete() and store.is_current(results_file)
+    assert [record['External'] for record in store.page(limit=100)[0]] == [record['External'] for record in records]
+    assert len(pd.read_csv(results_file)) == 30
+
+
+def test_writer_failure_keeps_the_previous_results(tmp_path):
+    results_file, path = write_previous_results(tmp_path)
+    with open(results_file, 'rb') as f:
+        previous = f.read()
+    with pytest.raises(RuntimeError):
+        with ResultsWriter(results_file, path) as writer:
+            writer.write(match_records(12))
+            raise RuntimeError("Embedding service unavailable")
+
+    with open(results_file, 'rb') as f:
+        assert f.read() == previous
+    assert not os.path.exists(f"{results_file}.partial")
+    store = ResultsStore.open(results_file, path)
+    assert store.is_complete() and store.page(limit=100)[2] == 5
+
+    # The failed run's rows stay readable, marked failed with the error
+    live = ResultsStore.live(path)
+    assert live.status() == 'failed'
+    assert live.meta('error') == "Embedding service unavailable"
+    assert live.page(limit=100)[2] == 12
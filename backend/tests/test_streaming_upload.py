@@ -0,0 +1,72 @@
+import io
+import os
+
+import pandas as pd
+import pytest
+from werkzeug.test import EnvironBuilder
+
+from app.StreamingUpload import StreamingUpload
+from app.Workspace import Workspace, file_digest
+
+INTERNAL = "LONG_NAME,SIZE\n" + "".join(f"Crème brûlée {i},{i} ml\n" for i in range(5000))
+EXTERNAL = "PRODUCT_NAME\n" + "".join(f"Creme brulee {i}\n" for i in range(300))
+
+
+def count_rows(catalog, pipe):
+    return len(pd.read_csv(pipe))
+
+
+def upload_environ(files):
+    """A multipart /upload request body with one file part per (filename, bytes)."""
+    data = {'files': [(io.BytesIO(content), filename) for filename, content in files]}
+    return EnvironBuilder(method='POST', data=data).get_environ()
+
+
+def saved_catalogs(workspace):
+    return sorted(name for name in os.listdir(workspace.folder) if name.startswith('Data_'))
+
+
+def test_upload_is_saved_and_preprocessed(tmp_path):
+    workspace = Workspace.create(str(tmp_path))
+    upload = StreamingUpload(workspace, count_rows)
+    upload.receive(upload_environ([('products.csv', EXTERNAL.encode()), ('catalog.csv', INTERNAL.encode())]))
+    assert upload.wait() == {'internal': 5000, 'external': 300}
+
+    with open(workspace.path('Data_Internal.csv'), 'rb') as f:
+        assert f.read() == INTERNAL.encode()
+    assert upload.catalogs['internal'].digest == file_digest(workspace.path('Data_Internal.csv'))
+    assert upload.catalogs['external'].digest == file_digest(workspace.path('Data_External.csv'))
+
+
+@pytest.mark.parametrize('files, message', [
+    ([('products.txt', EXTERNAL.encode()), ('catalog.csv', INTERNAL.encode())], 'Only CSV files are allowed'),
+    ([('products.csv', b"NAME\nMilk\n"), ('catalog.csv', INTERNAL.encode())],
+     'products.csv needs exactly one of the columns LONG_NAME or PRODUCT_NAME'),
+    ([('products.csv', EXTERNAL.encode()), ('catalog.csv', INTERNAL.encode('latin-1'))],
+     'catalog.csv is not UTF-8 encoded text'),
+    ([('products.csv', EXTERNAL.encode()), ('catalog.csv', INTERNAL.encode()), ('more.csv', INTERNAL.encode())],
+     'more.csv and catalog.csv are both the internal catalog'),
+    ([('catalog.csv', INTERNAL.encode())], 'No uploaded file has the PRODUCT_NAME column'),
+])
+def test_invalid_upload_is_undone(tmp_path, files, message):
+    workspace = Workspace.create(str(tmp_path))
+    upload = StreamingUpload(workspace, count_rows)
+    with pytest.raises(ValueError, match=message):
+        upload.receive(upload_environ(files))
+    assert saved_catalogs(workspace) == []
+
+
+def test_preprocessing_failure_is_raised_by_wait(tmp_path):
+    def fail_internal(catalog, pipe):
+        rows = count_rows(catalog, pipe)
+        if catalog == 'internal':
+            raise TypeError(f"LONG_NAME is not text in {rows} rows")
+        return rows
+
+    workspace = Workspace.create(str(tmp_path))
+    upload = StreamingUpload(workspace, fail_internal)
+    # Each thread reads its whole file first, so the upload itself goes through
+    upload.receive(upload_environ([('products.csv', EXTERNAL.encode()), ('catalog.csv', INTERNAL.encode())]))
+    with pytest.raises(ValueError, match='Preprocessing catalog.csv failed: LONG_NAME is not text in 5000 rows'):
+        upload.wait()
+    assert saved_catalogs(workspace) == []
@@ -0,0 +1,105 @@
+"""Local stand-in for the OpenAI API, for exercising the pipeline offline.
+
+Run it, then point the openai client at it before starting the backend:
+
+    python tools/stub_openai_server.py --port 8001 --latency 0.2 --error-rate 0.3
+    OPENAI_API_BASE=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub python app.py
+
+Embeddings are deterministic per input text, so repeated runs are comparable.
+Chat completions answer the matcher's fallback prompts (single or numbered
+pairs) with a naive rule: 'Yes' when both names start with the same word and
+mention the same numbers. Each request sleeps for the configured latency and
+fails with a 429 at the configured rate.
+"""
+import argparse
+import hashlib
+import random
+import re
+import time
+import numpy as np
+from flask import Flask, request, jsonify
+
+app = Flask(__name__)
+app.config.update(LATENCY=0.0, ERROR_RATE=0.0, DIMENSIONS=1536, REQUESTS=0, RATE_LIMITED=0)
+
+
+def stub_embedding(text, dimensions):
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).normal(size=dimensions)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def maybe_fail():
+    """Sleep for the configured latency and sometimes answer 429."""
+    app.config['REQUESTS'] += 1
+    time.sleep(app.config['LATENCY'])
+    if random.random() < app.config['ERROR_RATE']:
+        app.config['RATE_LIMITED'] += 1
+        response = jsonify({'error': {'message': 'Rate limit reached (stub)', 'type': 'requests'}})
+        response.status_code = 429
+        return response
+    return None
+
+
+@app.route('/v1/embeddings', methods=['POST'])
+def embeddings():
+    failure = maybe_fail()
+    if failure:
+        return failure
+    payload = request.get_json()
+    texts = payload['input'] if isinstance(payload['input'], list) else [payload['input']]
+    return jsonify({
+        'object': 'list',
+        'model': payload.get('model'),
+        'data': [
+            {'object': 'embedding', 'index': i, 'embedding': stub_embedding(text, app.config['DIMENSIONS'])}
+            for i, text in enumerate(texts)
+        ],
+        'usage': {'prompt_tokens': sum(len(text.split()) for text in texts), 'total_tokens': 0}
+    })
+
+
+def stub_verdict(external_name, internal_name):
+    words1, words2 = external_name.lower().split(), internal_name.lower().split()
+    same_start = bool(words1) and bool(words2) and words1[0] == words2[0]
+    same_numbers = set(re.findall(r"\d+(?:\.\d+)?", external_name)) == set(re.findall(r"\d+(?:\.\d+)?", internal_name))
+    return 'Yes' if same_start and same_numbers else 'No'
+
+
+@app.route('/v1/chat/completions', methods=['POST'])
+def chat_completions():
+    failure = maybe_fail()
+    if failure:
+        return failure
+    prompt = request.get_json()['messages'][-1]['content']
+
+    packed = re.findall(r"^\s*(\d+)\. External Product: (.*) \| Internal Product: (.*)$", prompt, re.MULTILINE)
+    if packed:
+        answer = "\n".join(f"{number}: {stub_verdict(external, internal)}" for number, external, internal in packed)
+    else:
+        external = re.search(r"External Product: (.*)", prompt).group(1).strip()
+        internal = re.search(r"Internal Product: (.*)", prompt).group(1).strip()
+        answer = stub_verdict(external, internal)
+
+    return jsonify({
+        'object': 'chat.completion',
+        'model': request.get_json().get('model'),
+        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': answer}}]
+    })
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({'requests': app.config['REQUESTS'], 'rate_limited': app.config['RATE_LIMITED']})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stub OpenAI API server.')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to sleep per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--dimensions', type=int, default=1536)
+    args = parser.parse_args()
+
+    app.config.update(LATENCY=args.latency, ERROR_RATE=args.error_rate, DIMENSIONS=args.dimensions)
+    app.run(port=args.port, threaded=True)
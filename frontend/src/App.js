@@ -8,19 +8,26 @@ import CheckAccuracy from "./components/CheckAccuracy";
 
 function App() {
   const [activeView, setActiveView] = useState("fileUpload");
+  // Every upload starts a run on the server; the later steps all work on it
+  const [runId, setRunId] = useState(localStorage.getItem("runId"));
+
+  const startRun = (id) => {
+    localStorage.setItem("runId", id);
+    setRunId(id);
+  };
 
   const renderView = () => {
     switch (activeView) {
       case "preprocess":
-        return <Preprocess />;
+        return <Preprocess runId={runId} />;
       case "mapProducts":
-        return <MapProducts />;
+        return <MapProducts runId={runId} />;
       case "viewMapped":
-        return <ViewMapped />;
+        return <ViewMapped runId={runId} />;
       case "checkAccuracy":
-        return <CheckAccuracy />;
+        return <CheckAccuracy runId={runId} />;
       default:
-        return <FileUpload />;
+        return <FileUpload onUploaded={startRun} />;
     }
   };
 
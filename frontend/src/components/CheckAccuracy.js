@@ -1,7 +1,7 @@
 import React, { useState } from "react";
 import axios from "axios";
 
-function CheckAccuracy() {
+function CheckAccuracy({ runId }) {
   const [file, setFile] = useState(null);
   const [accuracyScore, setAccuracyScore] = useState(null);
   const [results, setResults] = useState([]);
@@ -28,6 +28,7 @@ function CheckAccuracy() {
 
     const formData = new FormData();
     formData.append("file", file);
+    formData.append("run_id", runId);
 
     try {
       const response = await axios.post(
@@ -1,7 +1,7 @@
 import React, { useState } from "react";
 import axios from "axios";
 
-function FileUpload() {
+function FileUpload({ onUploaded }) {
   const [file1, setFile1] = useState(null);
   const [file2, setFile2] = useState(null);
   const [message, setMessage] = useState("");
@@ -40,6 +40,7 @@ function FileUpload() {
       );
 
       setMessage(response.data.message);
+      onUploaded(response.data.run_id);
     } catch (error) {
       setMessage("Error uploading files.");
       console.error(error);
@@ -1,32 +1,48 @@
 import React, { useState } from "react";
 import axios from "axios";
+import { waitForJob, describeProgress } from "./jobs";
 
-function MapProducts() {
+function MapProducts({ runId }) {
   const [message, setMessage] = useState("");
   const [loading, setLoading] = useState(false);
   const [timeTaken, setTimeTaken] = useState(null);
+  const [progress, setProgress] = useState("");
 
   const handleMapping = async () => {
+    if (!runId) {
+      setMessage("Please upload the files first.");
+      return;
+    }
+
     setLoading(true);
     setMessage("");
     setTimeTaken(null);
+    setProgress("");
 
     const startTime = new Date();
 
     try {
-      const response = await axios.post("http://127.0.0.1:5000/match");
+      const response = await axios.post("http://127.0.0.1:5000/match", null, {
+        params: { run_id: runId },
+      });
+
+      // The server runs the job in the background; poll it until it is done
+      const result = await waitForJob(response.data.job_id, (job) =>
+        setProgress(describeProgress(job))
+      );
 
       const endTime = new Date();
       const processingTime = ((endTime - startTime) / 1000).toFixed(2);
 
-      setMessage(
-        response.data.message || "Product mapping completed successfully."
-      );
+      setMessage(result.message || "Product mapping completed successfully.");
       setTimeTaken(processingTime);
     } catch (error) {
-      setMessage("Error during product mapping: " + error.message);
+      // A 409 means this run is already being matched; the server says so
+      const reason = error.response?.data?.message || error.message;
+      setMessage("Error during product mapping: " + reason);
     } finally {
       setLoading(false);
+      setProgress("");
     }
   };
 
@@ -50,6 +66,7 @@ function MapProducts() {
         {loading ? "Mapping..." : "Start Mapping"}
       </button>
 
+      {loading && progress && <p style={styles.progress}>{progress}</p>}
       {message && <p style={styles.message}>{message}</p>}
       {timeTaken && <p style={styles.time}>Time Taken: {timeTaken} seconds</p>}
     </div>
@@ -99,6 +116,11 @@ const styles = {
     color: "#28a745",
     fontWeight: "bold",
   },
+  progress: {
+    marginTop: "15px",
+    fontSize: "14px",
+    color: "#555",
+  },
   time: {
     marginTop: "10px",
     fontSize: "14px",
@@ -1,29 +1,45 @@
 import React, { useState } from "react";
 import axios from "axios";
+import { waitForJob, describeProgress } from "./jobs";
 
-function Preprocess() {
+function Preprocess({ runId }) {
   const [message, setMessage] = useState("");
   const [loading, setLoading] = useState(false);
   const [timeTaken, setTimeTaken] = useState(null);
+  const [progress, setProgress] = useState("");
 
   const handlePreprocess = async () => {
+    if (!runId) {
+      setMessage("Please upload the files first.");
+      return;
+    }
+
     setLoading(true);
     setMessage("");
     setTimeTaken(null);
+    setProgress("");
     const startTime = new Date();
 
     try {
-      const response = await axios.post("http://127.0.0.1:5000/preprocess");
+      const response = await axios.post("http://127.0.0.1:5000/preprocess", null, {
+        params: { run_id: runId },
+      });
+
+      // The server runs the job in the background; poll it until it is done
+      const result = await waitForJob(response.data.job_id, (job) =>
+        setProgress(describeProgress(job))
+      );
 
       const endTime = new Date();
       const processingTime = ((endTime - startTime) / 1000).toFixed(2);
       setTimeTaken(processingTime);
 
-      setMessage(response.data.message || "Preprocessing completed.");
+      setMessage(result.message || "Preprocessing completed.");
     } catch (error) {
       setMessage("Error during preprocessing: " + error.message);
     } finally {
       setLoading(false);
+      setProgress("");
     }
   };
 
@@ -47,6 +63,7 @@ function Preprocess() {
         {loading ? "Processing..." : "Start Preprocessing"}
       </button>
 
+      {loading && progress && <p style={styles.progress}>{progress}</p>}
       {message && <p style={styles.message}>{message}</p>}
       {timeTaken && <p style={styles.time}>Time Taken: {timeTaken} seconds</p>}
     </div>
@@ -96,6 +113,11 @@ const styles = {
     color: "green",
     fontWeight: "bold",
   },
+  progress: {
+    marginTop: "15px",
+    fontSize: "14px",
+    color: "#555",
+  },
   time: {
     marginTop: "10px",
     fontSize: "14px",
@@ -1,20 +1,42 @@
 import React, { useState } from "react";
 import axios from "axios";
 
-function ViewMapped() {
+const PAGE_SIZE = 100;
+
+function ViewMapped({ runId }) {
   const [mappedProducts, setMappedProducts] = useState([]);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState("");
+  // Rows are fetched a page at a time; nextCursor is null once all are loaded
+  const [nextCursor, setNextCursor] = useState(null);
+  const [total, setTotal] = useState(0);
+  // "running" while the match is still writing rows, "failed" if it stopped part way
+  const [status, setStatus] = useState("complete");
+  const [method, setMethod] = useState("");
+  const [minScore, setMinScore] = useState("");
+  const [maxScore, setMaxScore] = useState("");
 
-  const fetchMappedProducts = async () => {
+  const fetchPage = async (cursor) => {
     setLoading(true);
     setError("");
 
+    const params = { run_id: runId, limit: PAGE_SIZE };
+    if (cursor !== null) params.cursor = cursor;
+    if (method) params.method = method;
+    if (minScore !== "") params.min_score = minScore;
+    if (maxScore !== "") params.max_score = maxScore;
+
     try {
-      const response = await axios.get("http://127.0.0.1:5000/view-mapped");
-      if (Array.isArray(response.data) && response.data.length > 0) {
-        setMappedProducts(response.data);
-      } else {
+      const response = await axios.get("http://127.0.0.1:5000/view-mapped", {
+        params,
+      });
+      const { rows, next_cursor, total, status } = response.data;
+      const loaded = cursor === null ? rows : [...mappedProducts, ...rows];
+      setMappedProducts(loaded);
+      setNextCursor(next_cursor);
+      setTotal(total);
+      setStatus(status || "complete");
+      if (loaded.length === 0) {
         setError("No mapped products found.");
       }
     } catch (err) {
@@ -24,6 +46,9 @@ function ViewMapped() {
     }
   };
 
+  const fetchMappedProducts = () => fetchPage(null);
+  const loadMore = () => fetchPage(nextCursor);
+
   const formatValue = (value) => {
     if (
       value === null ||
@@ -36,12 +61,19 @@ function ViewMapped() {
     return value.toString();
   };
 
+  const methods = [
+    "Rule-Based",
+    "Semantic",
+    "Semantic + Fallback",
+    "Unmatched",
+  ];
+
   // Define the specific column order
   const columnOrder = [
     "External",
     "Internal", // Rename to Predicted Internal
     "Method",
-    "Semantic_Score",
+    "Semantic Score",
     "Fallback_Internal",
     "Fallback_Semantic_Score",
   ];
@@ -54,6 +86,37 @@ function ViewMapped() {
         an organized table for easy review.
       </p>
 
+      <div style={styles.filters}>
+        <select
+          style={styles.filter}
+          value={method}
+          onChange={(e) => setMethod(e.target.value)}
+        >
+          <option value="">All methods</option>
+          {methods.map((name) => (
+            <option key={name} value={name}>
+              {name}
+            </option>
+          ))}
+        </select>
+        <input
+          style={styles.filter}
+          type="number"
+          step="0.01"
+          placeholder="Min score"
+          value={minScore}
+          onChange={(e) => setMinScore(e.target.value)}
+        />
+        <input
+          style={styles.filter}
+          type="number"
+          step="0.01"
+          placeholder="Max score"
+          value={maxScore}
+          onChange={(e) => setMaxScore(e.target.value)}
+        />
+      </div>
+
       <button
         style={
           loading
@@ -70,7 +133,7 @@ function ViewMapped() {
         <p style={styles.loadingMessage}>Loading mapped products...</p>
       )}
       {error && <p style={styles.error}>{error}</p>}
-      {!loading && !error && mappedProducts.length > 0 && (
+      {!error && mappedProducts.length > 0 && (
         <div style={styles.tableWrapper}>
           <table style={styles.table}>
             <thead>
@@ -94,6 +157,24 @@ function ViewMapped() {
               ))}
             </tbody>
           </table>
+          <p style={styles.loadingMessage}>
+            Showing {mappedProducts.length} of {total} products
+            {status === "running" && " (matching still in progress, fetch again for more)"}
+            {status === "failed" && " (matching failed before all rows were written; run it again)"}
+          </p>
+          {nextCursor !== null && (
+            <button
+              style={
+                loading
+                  ? { ...styles.button, ...styles.buttonDisabled }
+                  : styles.button
+              }
+              onClick={loadMore}
+              disabled={loading}
+            >
+              {loading ? "Loading..." : "Load More"}
+            </button>
+          )}
         </div>
       )}
     </div>
@@ -142,6 +223,18 @@ const styles = {
     fontSize: "16px",
     color: "#333",
   },
+  filters: {
+    display: "flex",
+    justifyContent: "center",
+    gap: "10px",
+    marginBottom: "15px",
+  },
+  filter: {
+    padding: "8px",
+    fontSize: "14px",
+    border: "1px solid #ddd",
+    borderRadius: "5px",
+  },
   tableWrapper: {
     width: "100%",
     marginTop: "20px",
@@ -0,0 +1,29 @@
+import axios from "axios";
+
+// Polls a background job until it finishes. onProgress receives every status
+// update; resolves with the job's result or rejects with its error.
+export async function waitForJob(jobId, onProgress, intervalMs = 1000) {
+  while (true) {
+    const response = await axios.get(`http://127.0.0.1:5000/jobs/${jobId}`);
+    const job = response.data;
+
+    if (onProgress) onProgress(job);
+    if (job.status === "succeeded") return job.result;
+    if (job.status === "failed") throw new Error(job.error);
+
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+}
+
+// One-line summary such as "rules: 1200 / 3000 rows, about 12s left".
+export function describeProgress(job) {
+  if (job.status === "queued") return "Waiting for a free worker...";
+  if (!job.stage) return "Starting...";
+
+  let text = `${job.stage}: ${job.rows_processed} `;
+  text += job.rows_total ? `/ ${job.rows_total} rows` : "rows";
+  if (job.eta_seconds !== null && job.eta_seconds !== undefined) {
+    text += `, about ${Math.ceil(job.eta_seconds)}s left`;
+  }
+  return text;
+}